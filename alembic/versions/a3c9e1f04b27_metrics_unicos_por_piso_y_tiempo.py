@@ -0,0 +1,41 @@
+"""metrics unicos por piso y tiempo
+
+Revision ID: a3c9e1f04b27
+Revises: 7627f8570073
+Create Date: 2026-10-19 09:12:41.503118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c9e1f04b27'
+down_revision: Union[str, Sequence[str], None] = '7627f8570073'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Los reintentos de los gateways dejaron lecturas duplicadas: se conserva la primera
+    op.execute(
+        """
+        DELETE FROM metrics m
+        USING metrics d
+        WHERE m.floor_id = d.floor_id
+          AND m.time = d.time
+          AND m.id > d.id
+        """
+    )
+    # El índice único cubre las mismas consultas (floor_id, time) que el anterior
+    op.drop_index('ix_metrics_floor_time', table_name='metrics')
+    op.create_unique_constraint('uq_metrics_floor_time', 'metrics', ['floor_id', 'time'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_metrics_floor_time', 'metrics', type_='unique')
+    op.create_index('ix_metrics_floor_time', 'metrics', ['floor_id', 'time'], unique=False)
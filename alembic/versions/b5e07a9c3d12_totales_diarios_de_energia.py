@@ -0,0 +1,38 @@
+"""totales diarios de energia
+
+Revision ID: b5e07a9c3d12
+Revises: d8e41b7a2c60
+Create Date: 2026-10-19 18:05:31.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e07a9c3d12'
+down_revision: Union[str, Sequence[str], None] = 'd8e41b7a2c60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'energy_daily',
+        sa.Column('floor_id', sa.Integer(), nullable=False),
+        sa.Column('tz', sa.String(length=64), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('kwh', sa.Numeric(precision=12, scale=3), nullable=False),
+        sa.Column('readings', sa.Integer(), nullable=False),
+        sa.Column('computed_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['floor_id'], ['floors.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('floor_id', 'tz', 'day'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('energy_daily')
@@ -0,0 +1,30 @@
+"""alertas predictivas
+
+Revision ID: c52d7e8a91f3
+Revises: a3c9e1f04b27
+Create Date: 2026-10-19 11:40:07.218334
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c52d7e8a91f3'
+down_revision: Union[str, Sequence[str], None] = 'a3c9e1f04b27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('alerts', sa.Column('is_predicted', sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.add_column('alerts', sa.Column('breach_eta', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('alerts', 'breach_eta')
+    op.drop_column('alerts', 'is_predicted')
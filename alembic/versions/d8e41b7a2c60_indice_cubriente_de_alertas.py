@@ -0,0 +1,35 @@
+"""indice cubriente de alertas
+
+Revision ID: d8e41b7a2c60
+Revises: c52d7e8a91f3
+Create Date: 2026-10-19 15:22:48.610927
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8e41b7a2c60'
+down_revision: Union[str, Sequence[str], None] = 'c52d7e8a91f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Mismas columnas clave; variable y level en la hoja permiten que el heatmap
+    # (/alerts/heatmap) se resuelva con un index-only scan
+    op.drop_index('ix_alerts_floor_created', table_name='alerts')
+    op.create_index(
+        'ix_alerts_floor_created', 'alerts', ['floor_id', 'created_at'],
+        unique=False, postgresql_include=['variable', 'level'],
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_alerts_floor_created', table_name='alerts')
+    op.create_index('ix_alerts_floor_created', 'alerts', ['floor_id', 'created_at'], unique=False)
@@ -0,0 +1,33 @@
+import logging
+from typing import Any, Callable, Optional
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from app.services.response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+
+def cached_response(
+    request: Request,
+    response: Response,
+    compute: Callable[[], Any],
+    edificio: Optional[str] = None,
+    piso: Optional[int] = None,
+) -> Any:
+    """
+    Read-through sobre la caché de respuestas. La llave es la ruta + query normalizada,
+    dentro del alcance global (sin edificio), del edificio o del piso. Las excepciones
+    de `compute` (p. ej. 404) se propagan y no se cachean.
+    """
+    if response_cache is None:
+        return compute()
+    try:
+        key = response_cache.key_for(request.url.path, request.query_params.multi_items(), edificio, piso)
+    except Exception as e:
+        logger.warning(f"⚠️ Caché de respuestas no disponible: {e}")
+        return compute()
+
+    value, hit = response_cache.get_or_compute(key, lambda: jsonable_encoder(compute()))
+    response.headers["X-Cache"] = "HIT" if hit else "MISS"
+    return value
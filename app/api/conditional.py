@@ -0,0 +1,35 @@
+from email.utils import format_datetime
+from typing import Optional
+from fastapi import Request, Response
+
+from app.services.data_version import data_versions
+
+
+def conditional_response(
+    request: Request,
+    response: Response,
+    edificio: Optional[str],
+    piso: Optional[int] = None,
+    variant: str = "",
+) -> Optional[Response]:
+    """
+    Fija ETag y Last-Modified según la versión de datos del edificio/piso (o la global
+    si `edificio` es None).
+    Si el cliente ya tiene esa versión (If-None-Match) retorna un 304 listo para devolver,
+    sin haber consultado la base de datos.
+    """
+    etag = data_versions.etag(edificio, piso, variant)
+    _, modified = data_versions.get(edificio, piso)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(modified, usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+    response.headers.update(headers)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        if "*" in tags or etag in tags:
+            return Response(status_code=304, headers=headers)
+    return None
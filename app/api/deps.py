@@ -1,5 +1,7 @@
 from typing import Generator
 from app.db.session import SessionLocal
+from app.db.shards import ShardSessions, shard_router
+from app.core.lifecycle import ingest_inflight
 
 def get_db() -> Generator:
     db = SessionLocal()
@@ -7,3 +9,24 @@ def get_db() -> Generator:
         yield db
     finally:
         db.close()
+
+def get_building_db(edificio: str) -> Generator:
+    """Sesión del shard que aloja el edificio (el de `?edificio=` del endpoint)."""
+    db = shard_router.for_building(edificio).session()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_shard_sessions() -> Generator:
+    """Sesiones por shard abiertas a pedido, para peticiones con varios edificios."""
+    sessions = ShardSessions(shard_router)
+    try:
+        yield sessions
+    finally:
+        sessions.close()
+
+def track_ingest() -> Generator:
+    """Marca la petición como ingesta en curso: el apagado del worker espera a que termine."""
+    with ingest_inflight.track():
+        yield
@@ -0,0 +1,233 @@
+"""
+Formatos rápidos de ingesta para `/metrics/ingest`: NDJSON en streaming y MessagePack
+columnar. Ambos validan con tipos `float` en pydantic-core (sin pasar por `Decimal` ni
+crear un modelo por lectura) y producen los mismos dicts que `_store_readings`.
+"""
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional
+
+from fastapi import HTTPException
+from pydantic import ConfigDict, TypeAdapter, ValidationError
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from typing_extensions import NotRequired, TypedDict
+
+NDJSON_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl"}
+MSGPACK_TYPES = {"application/msgpack", "application/x-msgpack", "application/vnd.msgpack"}
+
+# Lecturas por escritura (y commit) al procesar NDJSON o MessagePack
+STREAM_CHUNK = 5000
+
+
+class _Row(TypedDict):
+    """Mismos campos que MetricIn, con float en vez de Decimal"""
+    __pydantic_config__ = ConfigDict(allow_inf_nan=False)  # type: ignore[misc]
+
+    timestamp: NotRequired[Optional[datetime]]
+    edificio: str
+    piso: int
+    temp_C: NotRequired[Optional[float]]
+    humedad_pct: NotRequired[Optional[float]]
+    energia_kW: NotRequired[Optional[float]]
+
+
+_ROWS = TypeAdapter(List[_Row])
+_ROW = TypeAdapter(_Row)
+_STRINGS = TypeAdapter(List[str])
+_INTS = TypeAdapter(List[int])
+_FLOATS = TypeAdapter(List[Optional[float]], config=ConfigDict(allow_inf_nan=False))
+_DATETIMES = TypeAdapter(List[datetime])
+
+
+class InvalidReading(ValueError):
+    """Lectura que no pasa la validación; `where` identifica la línea o la columna."""
+
+    def __init__(self, where: str, error: dict):
+        loc = ".".join(str(p) for p in error.get("loc", ()))
+        super().__init__(f"{where}{f', campo {loc}' if loc else ''}: {error.get('msg')}")
+        self.where = where
+
+
+def as_utc(value: datetime) -> datetime:
+    """Timestamp aware en UTC. Sin zona horaria se interpreta como UTC (como `utcnow()`)"""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def _to_reading(row: dict) -> dict:
+    return {
+        "edificio": row["edificio"],
+        "piso": row["piso"],
+        "time": row.get("timestamp") or datetime.utcnow(),  # mismo default que MetricIn
+        "temp_c": row.get("temp_C"),
+        "humidity_pct": row.get("humedad_pct"),
+        "energy_kw": row.get("energia_kW"),
+    }
+
+
+# ============================================================
+# NDJSON (una lectura por línea)
+# ============================================================
+
+def _parse_lines(lines: List[bytes], numbers: List[int]) -> List[dict]:
+    """
+    Valida un lote de líneas en una sola llamada (como un arreglo JSON). Solo si falla
+    se revisa línea por línea para reportar cuál es la inválida.
+    """
+    try:
+        rows = _ROWS.validate_json(b"[" + b",".join(lines) + b"]")
+    except ValidationError as batch_error:
+        for line, number in zip(lines, numbers):
+            try:
+                _ROW.validate_json(line)
+            except ValidationError as e:
+                raise InvalidReading(f"línea {number}", e.errors(include_url=False)[0]) from None
+        raise InvalidReading(f"líneas {numbers[0]}-{numbers[-1]}", batch_error.errors(include_url=False)[0]) from None
+    return [_to_reading(r) for r in rows]
+
+
+async def ndjson_batches(request: Request, size: int = STREAM_CHUNK) -> AsyncIterator[List[dict]]:
+    """
+    Recorre el body a medida que llega y entrega lotes de hasta `size` lecturas
+    validadas, sin esperar al resto. Las líneas vacías se ignoran. La validación de cada
+    lote corre en el threadpool para no bloquear el event loop.
+    """
+    pending = b""
+    lines: List[bytes] = []
+    numbers: List[int] = []
+    line_no = 0
+
+    async for chunk in request.stream():
+        pending += chunk
+        if b"\n" not in chunk:
+            continue
+        *complete, pending = pending.split(b"\n")
+        for line in complete:
+            line_no += 1
+            if line.strip():
+                lines.append(line)
+                numbers.append(line_no)
+                if len(lines) >= size:
+                    yield await run_in_threadpool(_parse_lines, lines, numbers)
+                    lines, numbers = [], []
+    if pending.strip():
+        lines.append(pending)
+        numbers.append(line_no + 1)
+    if lines:
+        yield await run_in_threadpool(_parse_lines, lines, numbers)
+
+
+# ============================================================
+# MessagePack columnar
+# ============================================================
+
+def _column(data: dict, field: str, adapter: TypeAdapter, size: int, required: bool) -> list:
+    """Lista del tamaño del lote, o un escalar que se repite en todas las filas."""
+    value = data.get(field)
+    if value is None and required:
+        raise InvalidReading("body", {"loc": (field,), "msg": "Field required"})
+    if not isinstance(value, (list, tuple)):
+        value = [value] * size
+    elif len(value) != size:
+        raise InvalidReading("body", {"loc": (field,), "msg": f"se esperaban {size} valores, llegaron {len(value)}"})
+    return _validate(adapter, field, value)
+
+
+def _validate(adapter: TypeAdapter, field: str, values: list) -> list:
+    try:
+        return adapter.validate_python(values)
+    except ValidationError as e:
+        error = e.errors(include_url=False)[0]
+        raise InvalidReading("body", {**error, "loc": (field, *error["loc"])}) from None
+
+
+def msgpack_readings(body: bytes) -> List[dict]:
+    """
+    Body MessagePack en forma columnar:
+
+        {"edificio": "A", "piso": [1, 1, 2], "timestamp": [1700000000, ...],
+         "temp_C": [24.1, 24.3, 23.9], "humedad_pct": [...], "energia_kW": [...]}
+
+    Cada campo es una lista (todas del mismo largo) o un escalar común a todas las
+    filas. `timestamp` admite epoch en segundos, texto ISO 8601 o la extensión de
+    timestamp de MessagePack. También se acepta una lista de objetos fila.
+    """
+    try:
+        import msgpack
+    except ImportError as e:
+        raise HTTPException(status_code=415, detail="application/msgpack requiere el paquete 'msgpack'") from e
+
+    try:
+        data = msgpack.unpackb(body, raw=False, timestamp=3)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"MessagePack inválido: {e}") from e
+
+    if isinstance(data, list):
+        try:
+            return [_to_reading(r) for r in _ROWS.validate_python(data)]
+        except ValidationError as e:
+            raise InvalidReading("body", e.errors(include_url=False)[0]) from None
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Se esperaba un mapa columnar o una lista de lecturas")
+
+    lengths = {len(v) for v in data.values() if isinstance(v, (list, tuple))}
+    if len(lengths) > 1:
+        raise HTTPException(status_code=400, detail="Las columnas deben tener el mismo largo")
+    size = lengths.pop() if lengths else 1
+
+    edificios = _column(data, "edificio", _STRINGS, size, required=True)
+    pisos = _column(data, "piso", _INTS, size, required=True)
+    if data.get("timestamp") is None:
+        times = [datetime.utcnow()] * size  # mismo default que MetricIn
+    else:
+        times = _column(data, "timestamp", _DATETIMES, size, required=True)
+    temps = _column(data, "temp_C", _FLOATS, size, required=False)
+    hums = _column(data, "humedad_pct", _FLOATS, size, required=False)
+    energies = _column(data, "energia_kW", _FLOATS, size, required=False)
+    return [
+        {"edificio": e, "piso": p, "time": t, "temp_c": tc, "humidity_pct": h, "energy_kw": kw}
+        for e, p, t, tc, h, kw in zip(edificios, pisos, times, temps, hums, energies)
+    ]
+
+
+class IngestSummary:
+    """Acumula conteos y rango de tiempos de una ingesta escrita en varios lotes."""
+
+    def __init__(self):
+        self.inserted = self.updated = self.duplicates = 0
+        self.spooled = 0
+        self.first_ts: Optional[datetime] = None
+        self.last_ts: Optional[datetime] = None
+        self.buildings: set[str] = set()
+        self.readings = 0
+
+    def _track(self, readings: list[dict]) -> None:
+        self.readings += len(readings)
+        # Un lote puede mezclar timestamps naive y con zona: se comparan en UTC
+        times = [as_utc(r["time"]) for r in readings]
+        low, high = min(times), max(times)
+        self.first_ts = low if self.first_ts is None or low < self.first_ts else self.first_ts
+        self.last_ts = high if self.last_ts is None or high > self.last_ts else self.last_ts
+        self.buildings.update(r["edificio"] for r in readings)
+
+    def add(self, readings: list[dict], result: dict) -> None:
+        self._track(readings)
+        self.inserted += result["inserted"]
+        self.updated += result["updated"]
+        self.duplicates += result["duplicates"]
+
+    def add_spooled(self, readings: list[dict]) -> None:
+        """Lecturas aceptadas en el spool local, pendientes de escribirse en la base"""
+        self._track(readings)
+        self.spooled += len(readings)
+
+    def to_dict(self) -> dict:
+        return {
+            "ingested": self.inserted + self.updated,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "duplicates": self.duplicates,
+            "first_ts": str(self.first_ts),
+            "last_ts": str(self.last_ts),
+            "buildings": sorted(self.buildings),
+            **({"spooled": self.spooled} if self.spooled else {}),
+        }
@@ -1,144 +1,307 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List, Optional
-from datetime import datetime, timedelta
-from app.api.deps import get_db
+from sqlalchemy import func, and_
+from typing import List, Literal, Optional
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from app.api.deps import get_building_db
+from app.api.conditional import conditional_response
+from app.api.caching import cached_response
 from app.db.models.alert import Alert
 from app.db.models.floor import Floor
 from app.db.models.building import Building
 from app.db.models.enums import AlertStatus, AlertLevel, Variable
-from app.db.schemas.alert import AlertCreate, AlertOut
+from app.db.schemas.alert import AlertCreate, AlertOut, ReevaluationIn
+from app.core.config import settings
+from app.db.shards import shard_router
+from app.services.data_version import data_versions
+from app.core.instrumentation import ALERTS_CREATED
 
 router = APIRouter()
 
 @router.post("/", response_model=AlertOut, status_code=201)
-def create_alert(payload: AlertCreate, db: Session = Depends(get_db)):
-    obj = Alert(**payload.model_dump())
-    db.add(obj)
-    db.commit()
-    db.refresh(obj)
-    return obj
+def create_alert(payload: AlertCreate):
+    # El id del piso indica en qué shard vive
+    with shard_router.for_id(payload.floor_id).session() as db:
+        obj = Alert(**payload.model_dump())
+        db.add(obj)
+        db.commit()
+        db.refresh(obj)
+        data_versions.bump_floor(db, obj.floor_id)
+        ALERTS_CREATED.labels(level=obj.level.value, variable=obj.variable.value).inc()
+        return AlertOut.model_validate(obj)
 
 @router.get("/", response_model=List[AlertOut])
 def list_alerts(
+    request: Request,
+    response: Response,
     floor_id: Optional[int] = None,
     status: Optional[AlertStatus] = None,
     level: Optional[AlertLevel] = Query(None, description="Filtrar por nivel: info, medium, critical"),
     variable: Optional[Variable] = Query(None, description="Filtrar por variable: temperature, humidity, energy"),
     limit: int = Query(200, ge=1, le=1000),
-    db: Session = Depends(get_db),
 ):
-    q = db.query(Alert)
-    if floor_id:
-        q = q.filter(Alert.floor_id == floor_id)
-    if status:
-        q = q.filter(Alert.status == status)
-    if level:
-        q = q.filter(Alert.level == level)
-    if variable:
-        q = q.filter(Alert.variable == variable)
-    return q.order_by(Alert.created_at.desc()).limit(limit).all()
+    def query(db: Session) -> List[AlertOut]:
+        q = db.query(Alert)
+        if floor_id:
+            q = q.filter(Alert.floor_id == floor_id)
+        if status:
+            q = q.filter(Alert.status == status)
+        if level:
+            q = q.filter(Alert.level == level)
+        if variable:
+            q = q.filter(Alert.variable == variable)
+        return [AlertOut.model_validate(a) for a in q.order_by(Alert.created_at.desc()).limit(limit).all()]
+
+    def compute():
+        # Con un piso se consulta solo su shard; sin él, todos y se unen por fecha
+        shards = [shard_router.for_id(floor_id)] if floor_id else None
+        parts = shard_router.fan_out(query, shards)
+        if len(parts) == 1:
+            return parts[0]
+        merged = sorted((a for part in parts for a in part), key=lambda a: a.created_at, reverse=True)
+        return merged[:limit]
+
+    return cached_response(request, response, compute)
 
 @router.get("/by-building", response_model=List[dict])
 def list_alerts_by_building(
+    request: Request,
+    response: Response,
     edificio: str,
     piso: Optional[int] = None,
     nivel: Optional[AlertLevel] = Query(None, description="info | medium | critical"),
     status: Optional[AlertStatus] = Query(None, description="open | acknowledged | closed"),
     limit: int = Query(200, ge=1, le=1000),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_building_db),
 ):
     """Lista alertas por edificio con información del piso"""
-    building = db.query(Building).filter_by(code=edificio).first()
-    if not building:
-        raise HTTPException(status_code=404, detail="Edificio no encontrado")
-
-    q = (
-        db.query(Alert, Floor.number.label("piso"))
-        .join(Floor, Floor.id == Alert.floor_id)
-        .filter(Floor.building_id == building.id)
-    )
-    if piso is not None:
-        q = q.filter(Floor.number == piso)
-    if nivel is not None:
-        q = q.filter(Alert.level == nivel)
-    if status is not None:
-        q = q.filter(Alert.status == status)
-
-    rows = q.order_by(Alert.created_at.desc()).limit(limit).all()
-
-    out = []
-    for alert, piso_num in rows:
-        out.append({
-            "id": alert.id,
-            "timestamp": alert.created_at.isoformat(),
-            "piso": piso_num,
-            "variable": alert.variable.value,
-            "nivel": alert.level.value,
-            "status": alert.status.value,
-            "mensaje": alert.message,
-            "recomendacion": alert.recommendation,
-        })
-    return out
+    not_modified = conditional_response(request, response, edificio, piso)
+    if not_modified:
+        return not_modified
+
+    def compute():
+        building = db.query(Building).filter_by(code=edificio).first()
+        if not building:
+            raise HTTPException(status_code=404, detail="Edificio no encontrado")
+
+        q = (
+            db.query(Alert, Floor.number.label("piso"))
+            .join(Floor, Floor.id == Alert.floor_id)
+            .filter(Floor.building_id == building.id)
+        )
+        if piso is not None:
+            q = q.filter(Floor.number == piso)
+        if nivel is not None:
+            q = q.filter(Alert.level == nivel)
+        if status is not None:
+            q = q.filter(Alert.status == status)
+
+        rows = q.order_by(Alert.created_at.desc()).limit(limit).all()
+
+        out = []
+        for alert, piso_num in rows:
+            out.append({
+                "id": alert.id,
+                "timestamp": alert.created_at.isoformat(),
+                "piso": piso_num,
+                "variable": alert.variable.value,
+                "nivel": alert.level.value,
+                "status": alert.status.value,
+                "mensaje": alert.message,
+                "recomendacion": alert.recommendation,
+                "prevista": alert.is_predicted,
+                "eta": alert.breach_eta.isoformat() if alert.breach_eta else None,
+            })
+        return out
+
+    return cached_response(request, response, compute, edificio, piso)
 
 @router.patch("/{alert_id}/status", response_model=AlertOut)
 def update_alert_status(
     alert_id: int,
     status: AlertStatus,
-    db: Session = Depends(get_db),
 ):
     """Actualiza el estado de una alerta"""
-    alert = db.query(Alert).filter(Alert.id == alert_id).first()
-    if not alert:
-        raise HTTPException(status_code=404, detail="Alerta no encontrada")
-    
-    alert.status = status
-    db.commit()
-    db.refresh(alert)
-    return alert
+    with shard_router.for_id(alert_id).session() as db:
+        alert = db.query(Alert).filter(Alert.id == alert_id).first()
+        if not alert:
+            raise HTTPException(status_code=404, detail="Alerta no encontrada")
+
+        alert.status = status
+        db.commit()
+        db.refresh(alert)
+        data_versions.bump_floor(db, alert.floor_id)
+        return AlertOut.model_validate(alert)
 
 @router.get("/stats", response_model=dict)
 def get_alert_stats(
+    request: Request,
+    response: Response,
     edificio: str,
     hours: int = Query(24, ge=1, le=168),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_building_db),
 ):
     """Obtiene estadísticas de alertas"""
-    building = db.query(Building).filter_by(code=edificio).first()
-    if not building:
-        raise HTTPException(status_code=404, detail="Edificio no encontrado")
+    def compute():
+        building = db.query(Building).filter_by(code=edificio).first()
+        if not building:
+            raise HTTPException(status_code=404, detail="Edificio no encontrado")
 
-    since = datetime.utcnow() - timedelta(hours=hours)
+        since = datetime.utcnow() - timedelta(hours=hours)
     
-    q = (
-        db.query(Alert, Floor.number.label("piso"))
-        .join(Floor, Floor.id == Alert.floor_id)
-        .filter(
-            Floor.building_id == building.id,
-            Alert.created_at >= since
+        q = (
+            db.query(Alert, Floor.number.label("piso"))
+            .join(Floor, Floor.id == Alert.floor_id)
+            .filter(
+                Floor.building_id == building.id,
+                Alert.created_at >= since
+            )
         )
-    )
     
-    alerts = q.all()
+        alerts = q.all()
     
-    stats = {
-        "total": len(alerts),
-        "por_nivel": {
-            "critical": sum(1 for a, _ in alerts if a.level == AlertLevel.critical),
-            "medium": sum(1 for a, _ in alerts if a.level == AlertLevel.medium),
-            "info": sum(1 for a, _ in alerts if a.level == AlertLevel.info),
-        },
-        "por_variable": {
-            "temperature": sum(1 for a, _ in alerts if a.variable == Variable.temperature),
-            "humidity": sum(1 for a, _ in alerts if a.variable == Variable.humidity),
-            "energy": sum(1 for a, _ in alerts if a.variable == Variable.energy),
-        },
-        "por_status": {
-            "open": sum(1 for a, _ in alerts if a.status == AlertStatus.open),
-            "acknowledged": sum(1 for a, _ in alerts if a.status == AlertStatus.acknowledged),
-            "closed": sum(1 for a, _ in alerts if a.status == AlertStatus.closed),
+        stats = {
+            "total": len(alerts),
+            "por_nivel": {
+                "critical": sum(1 for a, _ in alerts if a.level == AlertLevel.critical),
+                "medium": sum(1 for a, _ in alerts if a.level == AlertLevel.medium),
+                "info": sum(1 for a, _ in alerts if a.level == AlertLevel.info),
+            },
+            "por_variable": {
+                "temperature": sum(1 for a, _ in alerts if a.variable == Variable.temperature),
+                "humidity": sum(1 for a, _ in alerts if a.variable == Variable.humidity),
+                "energy": sum(1 for a, _ in alerts if a.variable == Variable.energy),
+            },
+            "por_status": {
+                "open": sum(1 for a, _ in alerts if a.status == AlertStatus.open),
+                "acknowledged": sum(1 for a, _ in alerts if a.status == AlertStatus.acknowledged),
+                "closed": sum(1 for a, _ in alerts if a.status == AlertStatus.closed),
+            }
         }
-    }
     
-    return stats
+        return stats
+
+    return cached_response(request, response, compute, edificio)
+
+_DAYS = ["lun", "mar", "mié", "jue", "vie", "sáb", "dom"]
+
+@router.get("/heatmap", response_model=dict)
+def get_alert_heatmap(
+    request: Request,
+    response: Response,
+    edificio: str,
+    eje: Literal["piso", "dia"] = Query("piso", description="Filas: piso o día de la semana; columnas: hora"),
+    desde: Optional[datetime] = Query(None, description="Default: 7 días antes de `hasta`"),
+    hasta: Optional[datetime] = Query(None, description="Default: ahora"),
+    variable: Optional[Variable] = Query(None, description="temperature | humidity | energy"),
+    nivel: Optional[AlertLevel] = Query(None, description="info | medium | critical"),
+    tz: str = Query("UTC", description="Zona horaria para la hora y el día (p. ej. America/Bogota)"),
+    db: Session = Depends(get_building_db),
+):
+    """
+    Conteo de alertas por (piso | día de la semana) × hora del día, calculado con una sola
+    consulta agrupada. `valores[i][h]` es el conteo de la fila `filas[i]` a la hora `h`.
+    """
+    try:
+        ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Zona horaria desconocida: {tz}")
+
+    # Sin `hasta` la ventana se desplaza con el tiempo: el ETag también cambia cada minuto
+    variant = "" if hasta is not None else str(int(datetime.utcnow().timestamp() // 60))
+    not_modified = conditional_response(request, response, edificio, variant=variant)
+    if not_modified:
+        return not_modified
+
+    def compute():
+        building = db.query(Building).filter_by(code=edificio).first()
+        if not building:
+            raise HTTPException(status_code=404, detail="Edificio no encontrado")
+
+        until = hasta or datetime.now(timezone.utc)
+        since = desde or until - timedelta(days=7)
+        local = func.timezone(tz, Alert.created_at)
+        hour = func.extract("hour", local).label("hora")
+
+        conditions = [Alert.floor_id == Floor.id, Alert.created_at >= since, Alert.created_at < until]
+        if variable is not None:
+            conditions.append(Alert.variable == variable)
+        if nivel is not None:
+            conditions.append(Alert.level == nivel)
+
+        if eje == "piso":
+            # LEFT JOIN desde los pisos: los que no tienen alertas también aparecen. Se cuenta
+            # created_at (y no id) para no salir del índice
+            row = Floor.number.label("fila")
+            q = db.query(row, hour, func.count(Alert.created_at)).select_from(Floor).outerjoin(Alert, and_(*conditions))
+        else:
+            row = (func.extract("isodow", local) - 1).label("fila")
+            q = db.query(row, hour, func.count(Alert.created_at)).select_from(Floor).join(Alert, and_(*conditions))
+        counts = q.filter(Floor.building_id == building.id).group_by(row, hour).all()
+
+        if eje == "piso":
+            filas = sorted({int(r) for r, _, _ in counts})
+            etiquetas = filas
+        else:
+            filas = list(range(7))
+            etiquetas = _DAYS
+        index = {f: i for i, f in enumerate(filas)}
+        valores = [[0] * 24 for _ in filas]
+        for r, h, n in counts:
+            if h is not None:
+                valores[index[int(r)]][int(h)] = n
+
+        return {
+            "edificio": edificio,
+            "eje": eje,
+            "desde": since.isoformat(),
+            "hasta": until.isoformat(),
+            "tz": tz,
+            "filas": etiquetas,
+            "columnas": list(range(24)),
+            "valores": valores,
+            "total": sum(map(sum, valores)),
+            "max": max((max(v) for v in valores), default=0),
+        }
+
+    return cached_response(request, response, compute, edificio)
+
+
+@router.post("/reevaluate", status_code=202, response_model=dict)
+def start_reevaluation(payload: ReevaluationIn):
+    """
+    Recalcula las alertas de un rango histórico (ver `app/services/alert_reevaluation.py`).
+    Corre en segundo plano; el progreso se consulta en `/alerts/reevaluate/{job_id}`.
+    """
+    # Import diferido: el servicio usa helpers de metrics y numpy
+    from app.services import alert_reevaluation
+
+    params = payload.model_dump()
+    # El pool no puede crecer más allá de lo configurado para el servidor
+    params["workers"] = min(params["workers"] or settings.ALERT_REEVAL_WORKERS, settings.ALERT_REEVAL_WORKERS)
+    try:
+        job = alert_reevaluation.plan(**params)
+        job_id = alert_reevaluation.start_job(job)
+    except alert_reevaluation.ReevaluationBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except alert_reevaluation.ReevaluationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "job_id": job_id,
+        "status_url": f"/api/v1/alerts/reevaluate/{job_id}",
+        "floors": len(job["floors"]),
+        "chunks": len(job["groups"]) * len(job["windows"]),
+        "workers": job["workers"],
+        "dry_run": job["dry_run"],
+    }
+
+@router.get("/reevaluate/{job_id}", response_model=dict)
+def reevaluation_status(job_id: str):
+    """Estado de un job de reevaluación: running (con progreso), done (con el resumen) o failed"""
+    from app.services import alert_reevaluation
+
+    state = alert_reevaluation.job_state(job_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    return state
@@ -1,20 +1,25 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter
 from sqlalchemy.orm import Session
 from typing import List
-from app.api.deps import get_db
 from app.db.models.building import Building
 from app.db.schemas.building import BuildingCreate, BuildingOut
+from app.db.shards import shard_router
 
 router = APIRouter()
 
 @router.get("/", response_model=List[BuildingOut])
-def list_buildings(db: Session = Depends(get_db)):
-    return db.query(Building).order_by(Building.id).all()
+def list_buildings():
+    def query(db: Session) -> List[BuildingOut]:
+        return [BuildingOut.model_validate(b) for b in db.query(Building).order_by(Building.id).all()]
+
+    # Un shard tras otro: dentro de cada uno, por id
+    return [b for part in shard_router.fan_out(query) for b in part]
 
 @router.post("/", response_model=BuildingOut, status_code=201)
-def create_building(payload: BuildingCreate, db: Session = Depends(get_db)):
-    obj = Building(**payload.model_dump())
-    db.add(obj)
-    db.commit()
-    db.refresh(obj)
-    return obj
+def create_building(payload: BuildingCreate):
+    with shard_router.for_building(payload.code).session() as db:
+        obj = Building(**payload.model_dump())
+        db.add(obj)
+        db.commit()
+        db.refresh(obj)
+        return BuildingOut.model_validate(obj)
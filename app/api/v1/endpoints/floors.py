@@ -1,24 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
-from app.api.deps import get_db
 from app.db.models.floor import Floor
 from app.db.schemas.floor import FloorCreate, FloorOut
+from app.db.shards import shard_router
 
 router = APIRouter()
 
 @router.get("/", response_model=List[FloorOut])
-def list_floors(db: Session = Depends(get_db)):
-    return db.query(Floor).order_by(Floor.id).all()
+def list_floors():
+    def query(db: Session) -> List[FloorOut]:
+        return [FloorOut.model_validate(f) for f in db.query(Floor).order_by(Floor.id).all()]
+
+    return [f for part in shard_router.fan_out(query) for f in part]
 
 @router.post("/", response_model=FloorOut, status_code=201)
-def create_floor(payload: FloorCreate, db: Session = Depends(get_db)):
-    obj = Floor(**payload.model_dump())
-    db.add(obj)
-    try:
-        db.commit()
-    except Exception:
-        db.rollback()
-        raise HTTPException(status_code=400, detail="Error creando piso (¿duplicado de nombre por edificio?)")
-    db.refresh(obj)
-    return obj
+def create_floor(payload: FloorCreate):
+    # El id del edificio indica en qué shard vive
+    with shard_router.for_id(payload.building_id).session() as db:
+        obj = Floor(**payload.model_dump())
+        db.add(obj)
+        try:
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise HTTPException(status_code=400, detail="Error creando piso (¿duplicado de nombre por edificio?)")
+        db.refresh(obj)
+        return FloorOut.model_validate(obj)
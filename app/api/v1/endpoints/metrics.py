@@ -1,21 +1,42 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter, ValidationError
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, or_, literal_column, select, true
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
 from typing import List, Optional, Tuple, Dict
-from datetime import datetime, timedelta
-import csv, io
-
-from app.api.deps import get_db
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import csv, io, json, math
+import logging
+
+from app.api import ingest_formats
+from app.api.deps import get_building_db, get_shard_sessions, track_ingest
+from app.api.conditional import conditional_response
+from app.api.caching import cached_response
 from app.db.models.metric import Metric
 from app.db.models.floor import Floor
 from app.db.models.building import Building
 from app.db.models.threshold import Threshold
 from app.db.models.alert import Alert
-from app.db.models.enums import Variable, AlertLevel, AlertStatus
+from app.db.models.enums import Variable, AlertLevel, AlertStatus, ConflictMode
+from app.db.shards import ShardSessions, shard_router
 
 from app.db.schemas.metric import MetricIn, MetricInBatch
-from app.services.gemini_service import gemini_service
+from app.services.recommendations import recommendation_provider
+from app.services.realtime_hub import realtime_hub
+from app.services.data_version import data_versions
+from app.services.detector_state import detector_state
+from app.services.ingest_spool import SpoolFull, ingest_spool
+from app.services.energy import daily_kwh, invalidate_days, spans_of
 from app.db.schemas.alert import AlertCreate
+from app.core.config import settings
+from app.core.instrumentation import INGEST_ROWS, INGEST_DUPLICATES, ALERTS_CREATED
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -114,6 +135,12 @@ def _level_for(value: Optional[float], lo: float, hi: float) -> Optional[AlertLe
     ratio = dist / span
     return AlertLevel.critical if ratio >= 0.25 else AlertLevel.medium
 
+def _evaluate_energy(energy: Optional[float], band: Tuple[float, float]) -> Tuple[Optional[AlertLevel], str]:
+    """Evalúa energía con la banda del piso (umbral activo o el por defecto)"""
+    if energy is None:
+        return None, "Sin datos de energía"
+    return _level_for(energy, *band), f"Consumo de energía fuera de rango: {energy} kW"
+
 def _generate_detailed_summary(
     temp: Optional[float],
     humidity: Optional[float],
@@ -176,65 +203,494 @@ def _brief_summary(values: dict, levels: dict[Variable, Optional[AlertLevel]]) -
     return ", ".join(msgs) if msgs else "Dentro de rangos"
 
 
+def _empty_card(floor_number: int) -> dict:
+    """Tarjeta de un piso sin lecturas"""
+    return {
+        "piso": floor_number,
+        "estado": "sin datos",
+        "resumen": "—",
+        "detalle": {
+            "temperatura": {"valor": None, "nivel": None, "recomendacion": "Sin datos"},
+            "humedad": {"valor": None, "nivel": None, "recomendacion": "Sin datos"},
+            "energia": {"valor": None, "nivel": None, "recomendacion": "Sin datos"}
+        }
+    }
+
+def _build_card(floor_number: int, last: Metric, energy_band: Tuple[float, float]) -> dict:
+    """
+    Construye la tarjeta de estado de un piso a partir de su último registro
+    """
+    # Obtener valores
+    temp = float(last.temp_c) if last.temp_c is not None else None
+    humidity = float(last.humidity_pct) if last.humidity_pct is not None else None
+    energy = float(last.energy_kw) if last.energy_kw is not None else None
+
+    # Evaluar usando los umbrales específicos de la imagen
+    temp_level, temp_rec = _evaluate_temperature(temp)
+    humidity_level, hum_rec = _evaluate_humidity(humidity)
+    energy_level = _level_for(energy, *energy_band)
+
+    # Generar resumen detallado
+    detalle = _generate_detailed_summary(
+        temp, humidity, energy,
+        temp_level, humidity_level, energy_level
+    )
+
+    # Estado general = peor de los niveles presentes
+    order = {None: 0, AlertLevel.info: 1, AlertLevel.medium: 2, AlertLevel.critical: 3}
+    worst = max(
+        [temp_level, humidity_level, energy_level],
+        key=lambda x: order.get(x, 0)
+    )
+    estado = {
+        None: "OK",
+        AlertLevel.info: "OK",
+        AlertLevel.medium: "Media",
+        AlertLevel.critical: "Crítica"
+    }[worst]
+
+    # Resumen breve (para compatibilidad)
+    vals = {
+        "temp_C": temp,
+        "humedad_pct": humidity,
+        "energia_kW": energy,
+    }
+    levels = {
+        Variable.temperature: temp_level,
+        Variable.humidity: humidity_level,
+        Variable.energy: energy_level,
+    }
+    resumen = _brief_summary(vals, levels)
+
+    return {
+        "piso": floor_number,
+        "estado": estado,
+        "resumen": resumen,
+        "timestamp": last.time.isoformat(),
+        "valores": vals,
+        "detalle": detalle,
+    }
+
+
 # ============================================================
-# Ingesta JSON
+# Publicación en tiempo real (WebSocket / SSE)
 # ============================================================
 
-@router.post("/ingest", status_code=201)
-def ingest_metrics_json(payload: MetricIn | MetricInBatch, db: Session = Depends(get_db)):
-    items: List[MetricIn] = payload.items if isinstance(payload, MetricInBatch) else [payload]
-    if not items:
-        raise HTTPException(status_code=400, detail="No hay registros para ingresar")
+def _reading_event(m: Metric) -> dict:
+    return {
+        "timestamp": m.time.isoformat(),
+        "temp_C": float(m.temp_c) if m.temp_c is not None else None,
+        "humedad_pct": float(m.humidity_pct) if m.humidity_pct is not None else None,
+        "energia_kW": float(m.energy_kw) if m.energy_kw is not None else None,
+    }
 
-    to_insert: list[Metric] = []
-    alerts_created = []
-    
-    for it in items:
-        building = _get_or_create_building(db, code=it.edificio)
-        floor = _get_or_create_floor(db, building, it.piso)
-
-        m = Metric(
-            time=it.timestamp,
-            floor_id=floor.id,
-            temp_c=it.temp_C,
-            humidity_pct=it.humedad_pct,
-            energy_kw=it.energia_kW,
+def _alert_event(alert: Alert, floor_number: int) -> dict:
+    return {
+        "id": alert.id,
+        "timestamp": alert.created_at.isoformat(),
+        "piso": floor_number,
+        "variable": alert.variable.value,
+        "nivel": alert.level.value,
+        "status": alert.status.value,
+        "mensaje": alert.message,
+        "recomendacion": alert.recommendation,
+        "prevista": alert.is_predicted,
+        "eta": alert.breach_eta.isoformat() if alert.breach_eta else None,
+    }
+
+def _publish_realtime(
+    db: Session,
+    rows: list[Metric],
+    latest: dict[int, tuple[str, Floor, Metric]],
+    alerts: list[tuple[str, dict]],
+) -> None:
+    """
+    Empuja lecturas nuevas, cambios de estado de tarjetas y alertas nuevas a los
+    dashboards suscritos. Solo trabaja para edificios con suscriptores activos.
+    """
+    floors_by_id = {floor.id: (edificio, floor) for edificio, floor, _ in latest.values()}
+    for m in rows:
+        edificio, floor = floors_by_id[m.floor_id]
+        if realtime_hub.has_subscribers(edificio):
+            realtime_hub.publish(edificio, floor.number, "lectura", _reading_event(m))
+
+    watched = [(edificio, floor, m) for edificio, floor, m in latest.values() if realtime_hub.has_subscribers(edificio)]
+    if watched:
+        # Umbrales de energía activos de todos los pisos del lote en una sola consulta
+        bands = {
+            floor_id: (float(lower), float(upper))
+            for floor_id, lower, upper in db.query(Threshold.floor_id, Threshold.lower, Threshold.upper).filter(
+                Threshold.floor_id.in_({floor.id for _, floor, _ in watched}),
+                Threshold.variable == Variable.energy,
+                Threshold.is_active == True,
+            )
+        }
+        default_band = DEFAULT_THRESHOLDS[Variable.energy]
+        for edificio, floor, m in watched:
+            card = _build_card(floor.number, m, bands.get(floor.id, default_band))
+            if realtime_hub.card_changed(edificio, floor.number, card["estado"]):
+                realtime_hub.publish(edificio, floor.number, "tarjeta", card)
+
+    for edificio, event in alerts:
+        realtime_hub.publish(edificio, event["piso"], "alerta", event)
+
+def _mark_changed(latest: dict[int, tuple[str, Floor, Metric]]) -> None:
+    """Incrementa la versión de datos (ETag) de los edificios y pisos escritos"""
+    touched: dict[str, set[int]] = {}
+    for edificio, floor, _ in latest.values():
+        touched.setdefault(edificio, set()).add(floor.number)
+    for edificio, pisos in touched.items():
+        data_versions.bump(edificio, pisos)
+
+
+# ============================================================
+# Escritura idempotente (INSERT ... ON CONFLICT)
+# ============================================================
+
+# 6 parámetros por fila: 1000 filas quedan lejos del límite de 65535 de PostgreSQL
+UPSERT_CHUNK = 1000
+
+def _resolve_floors(db: Session, pairs: set[tuple[str, int]]) -> dict[tuple[str, int], Floor]:
+    """
+    Resuelve cada (edificio, piso) a su Floor con una consulta por tabla en lugar de
+    una por lectura. Los que no existen se crean.
+    """
+    codes = {code for code, _ in pairs}
+    buildings = {b.code: b for b in db.query(Building).filter(Building.code.in_(codes)).all()}
+    for code in codes - buildings.keys():
+        buildings[code] = _get_or_create_building(db, code=code)
+
+    code_by_id = {b.id: code for code, b in buildings.items()}
+    out: dict[tuple[str, int], Floor] = {}
+    floors = (
+        db.query(Floor)
+        .filter(Floor.building_id.in_(code_by_id), Floor.number.in_({n for _, n in pairs}))
+        .all()
+    )
+    for f in floors:
+        key = (code_by_id[f.building_id], f.number)
+        if key in pairs:
+            out[key] = f
+    for code, number in pairs - out.keys():
+        out[(code, number)] = _get_or_create_floor(db, buildings[code], number)
+    return out
+
+def _on_conflict(stmt, mode: ConflictMode):
+    """
+    Cláusula ON CONFLICT (floor_id, time) del INSERT de métricas. Con `update` solo se
+    reescriben filas cuyos valores cambian.
+    """
+    if mode == ConflictMode.update:
+        excluded = stmt.excluded
+        return stmt.on_conflict_do_update(
+            constraint="uq_metrics_floor_time",
+            set_={
+                "temp_c": excluded.temp_c,
+                "humidity_pct": excluded.humidity_pct,
+                "energy_kw": excluded.energy_kw,
+            },
+            where=or_(
+                Metric.temp_c.is_distinct_from(excluded.temp_c),
+                Metric.humidity_pct.is_distinct_from(excluded.humidity_pct),
+                Metric.energy_kw.is_distinct_from(excluded.energy_kw),
+            ),
         )
-        to_insert.append(m)
-        
-        # Detectar anomalías y crear alertas
+    return stmt.on_conflict_do_nothing(constraint="uq_metrics_floor_time")
+
+def _upsert_metrics(db: Session, values: list[dict], mode: ConflictMode) -> list:
+    """
+    Inserta lecturas con INSERT multi-fila ON CONFLICT (floor_id, time). Retorna las
+    filas escritas; `inserted` distingue las nuevas de las actualizadas.
+
+    Con `update` solo se reescriben filas cuyos valores cambian, así un reintento
+    idéntico cuenta como duplicado y no genera escrituras.
+    """
+    written = []
+    for start in range(0, len(values), UPSERT_CHUNK):
+        stmt = _on_conflict(pg_insert(Metric).values(values[start:start + UPSERT_CHUNK]), mode)
+        stmt = stmt.returning(
+            Metric.floor_id,
+            Metric.time,
+            Metric.temp_c,
+            Metric.humidity_pct,
+            Metric.energy_kw,
+            literal_column("xmax = 0").label("inserted"),
+        )
+        written.extend(db.execute(stmt).all())
+    return written
+
+def _store_readings(db: Session, readings: list[dict], mode: ConflictMode, source: str) -> dict:
+    """
+    Escribe lecturas `{edificio, piso, time, temp_c, humidity_pct, energy_kw}` de forma
+    idempotente, actualiza versiones (ETag/caché) y métricas. Retorna los conteos junto
+    con las filas escritas y el último registro de cada piso tocado.
+    """
+    floors = _resolve_floors(db, {(r["edificio"], r["piso"]) for r in readings})
+    floors_by_id = {f.id: (code, f) for (code, _), f in floors.items()}
+
+    # Dentro de un mismo lote la última repetición gana (ON CONFLICT no admite
+    # tocar la misma fila dos veces en una sentencia). La clave usa el instante en UTC:
+    # un timestamp naive y uno con zona para el mismo instante son la misma fila
+    unique: dict[tuple[int, datetime], dict] = {}
+    for r in readings:
+        floor = floors[(r["edificio"], r["piso"])]
+        time = ingest_formats.as_utc(r["time"])
+        unique[(floor.id, time)] = {
+            "time": time,
+            "floor_id": floor.id,
+            "temp_c": r["temp_c"],
+            "humidity_pct": r["humidity_pct"],
+            "energy_kw": r["energy_kw"],
+        }
+
+    written = _upsert_metrics(db, list(unique.values()), mode)
+    # Una lectura atrasada cambia el consumo de días ya cerrados
+    invalidate_days(db, spans_of(written))
+    db.commit()
+    detector_state.update_rows(w for w in written if w.inserted)
+
+    inserted = sum(1 for w in written if w.inserted)
+    duplicates = len(readings) - len(written)
+    INGEST_ROWS.labels(source=source).inc(len(written))
+    if duplicates:
+        INGEST_DUPLICATES.labels(source=source).inc(duplicates)
+
+    latest: dict[int, tuple[str, Floor, Metric]] = {}
+    for w in written:
+        if w.floor_id not in latest or latest[w.floor_id][2].time <= w.time:
+            edificio, floor = floors_by_id[w.floor_id]
+            latest[w.floor_id] = (edificio, floor, w)
+    _mark_changed(latest)
+
+    return {
+        "inserted": inserted,
+        "updated": len(written) - inserted,
+        "duplicates": duplicates,
+        "written": written,
+        "latest": latest,
+        "floors_by_id": floors_by_id,
+    }
+
+
+# ============================================================
+# Ingesta JSON
+# ============================================================
+
+def _ingest_readings(db: Session, readings: list[dict], mode: ConflictMode, source: str) -> dict:
+    """Escribe un lote, detecta anomalías en las lecturas nuevas y publica en tiempo real"""
+    result = _store_readings(db, readings, mode, source=source)
+
+    # Detectar anomalías solo sobre lecturas nuevas: un reintento no repite alertas
+    alerts_created: list[tuple[str, dict]] = []
+    for w in result["written"]:
+        if not w.inserted:
+            continue
+        edificio, floor = result["floors_by_id"][w.floor_id]
         try:
-            _detect_and_create_alerts(
+            created = _detect_and_create_alerts(
                 db,
                 floor,
-                float(it.temp_C) if it.temp_C else None,
-                float(it.humedad_pct) if it.humedad_pct else None,
-                float(it.energia_kW) if it.energia_kW else None
+                float(w.temp_c) if w.temp_c is not None else None,
+                float(w.humidity_pct) if w.humidity_pct is not None else None,
+                float(w.energy_kw) if w.energy_kw is not None else None,
             )
+            alerts_created.extend((edificio, _alert_event(a, floor.number)) for a in created)
         except Exception as e:
-            print(f"Error detectando anomalías: {e}")
+            logger.error(f"❌ Error detectando anomalías: {e}")
 
-    db.bulk_save_objects(to_insert)
-    db.commit()
+    # Las alertas se guardan después del incremento de `_store_readings`: una consulta en
+    # ese intervalo ya tiene el ETag nuevo sin las alertas, así que se vuelve a incrementar
+    touched: dict[str, set[int]] = {}
+    for edificio, event in alerts_created:
+        touched.setdefault(edificio, set()).add(event["piso"])
+    for edificio, pisos in touched.items():
+        data_versions.bump(edificio, pisos)
 
-    return {
-        "ingested": len(to_insert),
-        "first_ts": str(min(i.timestamp for i in items)),
-        "last_ts": str(max(i.timestamp for i in items)),
-        "buildings": sorted({i.edificio for i in items}),
+    _publish_realtime(db, result["written"], result["latest"], alerts_created)
+    return result
+
+
+def _ingest_sharded(sessions: ShardSessions, readings: list[dict], mode: ConflictMode, source: str) -> list[tuple[list[dict], dict]]:
+    """Reparte las lecturas por shard y escribe cada parte; retorna (lecturas, resultado) por shard"""
+    return [
+        (part, _ingest_readings(sessions.get(shard), part, mode, source))
+        for shard, part in shard_router.partition(readings).items()
+    ]
+
+
+# Errores de conexión, caída o bloqueo de la base (no de datos): el lote puede ir al spool
+_DB_UNAVAILABLE = (OperationalError, InterfaceError, PoolTimeoutError)
+
+
+async def _write_or_spool(
+    sessions: ShardSessions,
+    readings: list[dict],
+    mode: ConflictMode,
+    source: str,
+    summary: ingest_formats.IngestSummary,
+) -> None:
+    """
+    Escribe el lote en la base o, si la base no responde (o quedan lotes anteriores sin
+    reaplicar), lo deja en el spool local. Sin spool el error sube como antes.
+    """
+    if not ingest_spool.enabled:
+        for part, result in await run_in_threadpool(_ingest_sharded, sessions, readings, mode, source):
+            summary.add(part, result)
+        return
+
+    if not ingest_spool.pending:
+        try:
+            for part, result in await run_in_threadpool(_ingest_sharded, sessions, readings, mode, source):
+                summary.add(part, result)
+            return
+        except _DB_UNAVAILABLE as e:
+            logger.warning(f"⚠️ Base no disponible, lote de {len(readings)} lecturas al spool: {e.__class__.__name__}")
+            # Las sesiones quedaron con conexiones rotas: el próximo lote abre otras
+            sessions.close()
+    try:
+        await run_in_threadpool(ingest_spool.append, readings, mode.value, source)
+    except SpoolFull as e:
+        raise HTTPException(status_code=503, detail=f"Base no disponible y {e}", headers={"Retry-After": "30"})
+    summary.add_spooled(readings)
+
+
+def _ingest_response(summary: ingest_formats.IngestSummary):
+    """201 si todo quedó en la base; 202 si parte quedó en el spool para reaplicarse"""
+    if summary.spooled:
+        return JSONResponse(summary.to_dict(), status_code=202)
+    return summary.to_dict()
+
+
+def replay_spooled(readings: list[dict], mode: str) -> None:
+    """Escritura del replayer del spool: misma ingesta (alertas y tiempo real incluidos)"""
+    sessions = ShardSessions(shard_router)
+    try:
+        _ingest_sharded(sessions, readings, ConflictMode(mode), "spool")
+    finally:
+        sessions.close()
+
+
+_INGEST_JSON = TypeAdapter(MetricIn | MetricInBatch)
+
+# El body se lee a mano (según Content-Type), así que el esquema se declara aquí
+_METRIC_IN_SCHEMA = MetricIn.model_json_schema()
+_INGEST_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": {"anyOf": [
+                _METRIC_IN_SCHEMA,
+                {"type": "object", "properties": {"items": {"type": "array", "items": _METRIC_IN_SCHEMA}}, "required": ["items"]},
+            ]}},
+            "application/x-ndjson": {"schema": {"type": "string", "description": "Una lectura (mismos campos que JSON) por línea"}},
+            "application/msgpack": {"schema": {"type": "string", "format": "binary", "description": "Mapa columnar: listas por campo"}},
+        },
     }
+}
+
+
+@router.post("/ingest", status_code=201, dependencies=[Depends(track_ingest)], openapi_extra=_INGEST_OPENAPI)
+async def ingest_metrics(
+    request: Request,
+    on_conflict: ConflictMode = Query(ConflictMode.ignore, description="ignore | update"),
+    sessions: ShardSessions = Depends(get_shard_sessions),
+):
+    """
+    Ingesta de lecturas. Según `Content-Type`:
+    - `application/json` (default): una lectura o `{"items": [...]}`, validado con Pydantic.
+    - `application/x-ndjson`: una lectura por línea; se escribe por lotes mientras llega.
+    - `application/msgpack`: mapa columnar (ver `app/api/ingest_formats.py`).
+
+    Con `INGEST_SPOOL_ENABLED`, si la base no responde el lote queda en el spool local y
+    se responde 202 con `spooled` (ver `app/services/ingest_spool.py`).
+    """
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip().lower()
+
+    if content_type in ingest_formats.NDJSON_TYPES:
+        return await _ingest_batches(sessions, ingest_formats.ndjson_batches(request), on_conflict, "ndjson")
+
+    if content_type in ingest_formats.MSGPACK_TYPES:
+        return await _ingest_batches(sessions, _msgpack_batches(await request.body()), on_conflict, "msgpack")
+
+    if content_type != "application/json" and not content_type.endswith("+json"):
+        raise HTTPException(status_code=415, detail=f"Content-Type no soportado: {content_type}")
+
+    # Validar miles de lecturas es CPU: va al threadpool como la escritura
+    readings = await run_in_threadpool(_json_readings, await request.body())
+    summary = ingest_formats.IngestSummary()
+    await _write_or_spool(sessions, readings, on_conflict, "json", summary)
+    return _ingest_response(summary)
+
+
+def _json_readings(body: bytes) -> list[dict]:
+    """Valida el body JSON (una lectura o `{"items": [...]}`) y lo convierte en lecturas"""
+    try:
+        payload = _INGEST_JSON.validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError([{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)])
+    items: List[MetricIn] = payload.items if isinstance(payload, MetricInBatch) else [payload]
+    if not items:
+        raise HTTPException(status_code=400, detail="No hay registros para ingresar")
+
+    return [
+        {
+            "edificio": it.edificio,
+            "piso": it.piso,
+            "time": it.timestamp,
+            "temp_c": it.temp_C,
+            "humidity_pct": it.humedad_pct,
+            "energy_kw": it.energia_kW,
+        }
+        for it in items
+    ]
+
+
+async def _msgpack_batches(body: bytes):
+    readings = await run_in_threadpool(ingest_formats.msgpack_readings, body)
+    for i in range(0, len(readings), ingest_formats.STREAM_CHUNK):
+        yield readings[i:i + ingest_formats.STREAM_CHUNK]
+
+
+async def _ingest_batches(sessions: ShardSessions, batches, mode: ConflictMode, source: str) -> dict:
+    """
+    Escribe cada lote apenas está validado. Si una lectura es inválida se responde 422
+    con lo ya escrito: reenviar todo es seguro porque la ingesta es idempotente.
+    """
+    summary = ingest_formats.IngestSummary()
+    try:
+        async for batch in batches:
+            if batch:
+                await _write_or_spool(sessions, batch, mode, source, summary)
+    except ingest_formats.InvalidReading as e:
+        raise HTTPException(
+            status_code=422,
+            detail={"error": str(e), "written_before_error": summary.to_dict() if summary.readings else None},
+        )
+    if not summary.readings:
+        raise HTTPException(status_code=400, detail="No hay registros para ingresar")
+    return _ingest_response(summary)
 
 
 # ============================================================
 # Ingesta CSV
 # ============================================================
 
-@router.post("/upload-csv", status_code=201)
-async def upload_metrics_csv(file: UploadFile = File(...), db: Session = Depends(get_db)):
+@router.post("/upload-csv", status_code=201, dependencies=[Depends(track_ingest)])
+async def upload_metrics_csv(
+    file: UploadFile = File(...),
+    on_conflict: ConflictMode = Query(ConflictMode.ignore, description="ignore | update"),
+    sessions: ShardSessions = Depends(get_shard_sessions),
+):
     if not file.filename.lower().endswith(".csv"):
         raise HTTPException(status_code=400, detail="El archivo debe ser .csv")
 
     content = await file.read()
+    # Parseo y escritura son síncronos: corren en el threadpool, fuera del event loop
+    return await run_in_threadpool(_store_csv, sessions, content, on_conflict)
+
+
+def _store_csv(sessions: ShardSessions, content: bytes, on_conflict: ConflictMode) -> dict:
+    """Parsea el CSV y lo escribe por shard; retorna el cuerpo de la respuesta"""
     try:
         text = content.decode("utf-8")
     except UnicodeDecodeError:
@@ -245,8 +701,7 @@ async def upload_metrics_csv(file: UploadFile = File(...), db: Session = Depends
     if set(reader.fieldnames or []) != expected:
         raise HTTPException(status_code=400, detail=f"Encabezado esperado: {','.join(sorted(expected))}")
 
-    rows: list[Metric] = []
-    count = 0
+    readings: list[dict] = []
     min_ts: datetime | None = None
     max_ts: datetime | None = None
 
@@ -257,31 +712,86 @@ async def upload_metrics_csv(file: UploadFile = File(...), db: Session = Depends
         except Exception:
             raise HTTPException(status_code=400, detail=f"timestamp inválido: {r['timestamp']}")
 
-        edificio = (r["edificio"] or "A").strip()
-        piso = int(r["piso"])
-
-        building = _get_or_create_building(db, code=edificio)
-        floor = _get_or_create_floor(db, building, piso)
-
-        metric = Metric(
-            time=ts,
-            floor_id=floor.id,
-            temp_c=float(r["temp_C"]) if r["temp_C"] else None,
-            humidity_pct=float(r["humedad_pct"]) if r["humedad_pct"] else None,
-            energy_kw=float(r["energia_kW"]) if r["energia_kW"] else None,
-        )
-        rows.append(metric)
-        count += 1
+        readings.append({
+            "edificio": (r["edificio"] or "A").strip(),
+            "piso": int(r["piso"]),
+            "time": ts,
+            "temp_c": float(r["temp_C"]) if r["temp_C"] else None,
+            "humidity_pct": float(r["humedad_pct"]) if r["humedad_pct"] else None,
+            "energy_kw": float(r["energia_kW"]) if r["energia_kW"] else None,
+        })
         min_ts = ts if (min_ts is None or ts < min_ts) else min_ts
         max_ts = ts if (max_ts is None or ts > max_ts) else max_ts
 
-    if not rows:
+    if not readings:
         raise HTTPException(status_code=400, detail="CSV vacío")
 
-    db.bulk_save_objects(rows)
-    db.commit()
+    totals = {"inserted": 0, "updated": 0, "duplicates": 0}
+    for shard, part in shard_router.partition(readings).items():
+        db = sessions.get(shard)
+        result = _store_readings(db, part, on_conflict, source="csv")
+        # Para cargas históricas solo se empuja la última lectura de cada piso
+        _publish_realtime(db, [m for _, _, m in result["latest"].values()], result["latest"], [])
+        for key in totals:
+            totals[key] += result[key]
 
-    return {"ingested": count, "first_ts": str(min_ts), "last_ts": str(max_ts)}
+    return {
+        "ingested": totals["inserted"] + totals["updated"],
+        **totals,
+        "first_ts": str(min_ts),
+        "last_ts": str(max_ts),
+    }
+
+
+# ============================================================
+# Importación masiva (Parquet / Arrow IPC)
+# ============================================================
+
+@router.post("/import", status_code=201, dependencies=[Depends(track_ingest)])
+def import_metrics_file(
+    file: UploadFile = File(..., description="Parquet o Arrow IPC"),
+    mapping: Optional[str] = Query(
+        None, description='JSON campo → columna del archivo, p. ej. {"timestamp": "ts", "temp_C": "temperature"}'
+    ),
+    edificio: Optional[str] = Query(None, description="Código de edificio para todo el archivo"),
+    piso: Optional[int] = Query(None, description="Número de piso para todo el archivo"),
+    on_conflict: ConflictMode = Query(ConflictMode.ignore, description="ignore | update"),
+    batch_rows: int = Query(200_000, ge=1_000, le=2_000_000),
+    epoch_unit: str = Query("s", pattern="^(s|ms|us)$", description="Unidad si el tiempo viene como número"),
+    sessions: ShardSessions = Depends(get_shard_sessions),
+):
+    """
+    Backfill de historial: lee el archivo por lotes y los carga con COPY (ver
+    `app/services/bulk_import.py`). No corre la detección de anomalías.
+    """
+    # Import diferido: el servicio usa helpers de este módulo y pyarrow es opcional
+    from app.services import bulk_import
+
+    try:
+        columns = json.loads(mapping) if mapping else {}
+        if not isinstance(columns, dict):
+            raise ValueError("se esperaba un objeto")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"mapping inválido: {e}")
+
+    # Con varios shards, un archivo sin `edificio` fijo se carga en el shard por defecto
+    db = sessions.for_building(edificio) if edificio else sessions.get(shard_router.default)
+    try:
+        return bulk_import.import_file(
+            db,
+            file.file,
+            filename=file.filename or "",
+            mapping=columns,
+            edificio=edificio,
+            piso=piso,
+            mode=on_conflict,
+            batch_rows=batch_rows,
+            epoch_unit=epoch_unit,
+        )
+    except bulk_import.BulkImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=415, detail=str(e))
 
 
 # ============================================================
@@ -290,66 +800,52 @@ async def upload_metrics_csv(file: UploadFile = File(...), db: Session = Depends
 
 @router.get("/", summary="Listar métricas", response_model=list[dict])
 def list_metrics(
+    request: Request,
+    response: Response,
     edificio: str,
     piso: int,
     since: Optional[datetime] = None,
     until: Optional[datetime] = None,
     limit: int = Query(200, ge=1, le=2000),
     offset: int = Query(0, ge=0),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_building_db),
 ):
-    building = db.query(Building).filter_by(code=edificio).first()
-    if not building:
-        raise HTTPException(status_code=404, detail="Edificio no encontrado")
+    def compute():
+        building = db.query(Building).filter_by(code=edificio).first()
+        if not building:
+            raise HTTPException(status_code=404, detail="Edificio no encontrado")
 
-    floor = db.query(Floor).filter(Floor.building_id == building.id, Floor.number == piso).first()
-    if not floor:
-        raise HTTPException(status_code=404, detail="Piso no encontrado")
+        floor = db.query(Floor).filter(Floor.building_id == building.id, Floor.number == piso).first()
+        if not floor:
+            raise HTTPException(status_code=404, detail="Piso no encontrado")
 
-    q = db.query(Metric).filter(Metric.floor_id == floor.id)
-    if since: q = q.filter(Metric.time >= since)
-    if until: q = q.filter(Metric.time <= until)
+        q = db.query(Metric).filter(Metric.floor_id == floor.id)
+        if since: q = q.filter(Metric.time >= since)
+        if until: q = q.filter(Metric.time <= until)
 
-    total = q.count()
-    rows = q.order_by(Metric.time.desc()).offset(offset).limit(limit).all()
+        total = q.count()
+        rows = q.order_by(Metric.time.desc()).offset(offset).limit(limit).all()
 
-    payload = [
-        {
-            "timestamp": m.time.isoformat(),
-            "temp_C": float(m.temp_c) if m.temp_c is not None else None,
-            "humedad_pct": float(m.humidity_pct) if m.humidity_pct is not None else None,
-            "energia_kW": float(m.energy_kw) if m.energy_kw is not None else None,
-        }
-        for m in rows
-    ]
-    return [{"total": total, "count": len(payload), "data": payload}]
+        payload = [
+            {
+                "timestamp": m.time.isoformat(),
+                "temp_C": float(m.temp_c) if m.temp_c is not None else None,
+                "humedad_pct": float(m.humidity_pct) if m.humidity_pct is not None else None,
+                "energia_kW": float(m.energy_kw) if m.energy_kw is not None else None,
+            }
+            for m in rows
+        ]
+        return [{"total": total, "count": len(payload), "data": payload}]
+
+    return cached_response(request, response, compute, edificio, piso)
 
 
 # ============================================================
 # TENDENCIAS (últimas N horas)
 # ============================================================
 
-@router.get("/trends", summary="Series de tiempo para gráficas", response_model=dict)
-def trends(
-    edificio: str,
-    piso: int,
-    hours: int = Query(4, ge=1, le=24),
-    db: Session = Depends(get_db),
-):
-    building = db.query(Building).filter_by(code=edificio).first()
-    if not building:
-        raise HTTPException(status_code=404, detail="Edificio no encontrado")
-    floor = db.query(Floor).filter(Floor.building_id == building.id, Floor.number == piso).first()
-    if not floor:
-        raise HTTPException(status_code=404, detail="Piso no encontrado")
-
-    since = datetime.utcnow() - timedelta(hours=hours)
-    qs = (
-        db.query(Metric)
-        .filter(Metric.floor_id == floor.id, Metric.time >= since)
-        .order_by(Metric.time.asc())
-        .all()
-    )
+def _trends_payload(qs: List[Metric]) -> dict:
+    """Series paralelas para gráficas a partir de registros ordenados por tiempo"""
     return {
         "timestamps": [m.time.isoformat() for m in qs],
         "temp_C": [float(m.temp_c) if m.temp_c is not None else None for m in qs],
@@ -357,97 +853,344 @@ def trends(
         "energia_kW": [float(m.energy_kw) if m.energy_kw is not None else None for m in qs],
     }
 
+# Puntos del eje compartido con `bucket` automático
+_TRENDS_TARGET_POINTS = 240
+
+
+def _aligned_trends(db: Session, edificio: str, pisos: List[str], hours: int, bucket: Optional[int]) -> dict:
+    """
+    Series de varios pisos sobre un mismo eje de tiempo en buckets de `bucket` minutos
+    (promedio por bucket; None si el piso no tuvo lecturas). Dos consultas: pisos del
+    edificio y una agregación agrupada por piso y bucket sobre el índice (floor_id, time).
+    """
+    rows = db.execute(
+        select(Building.id, Floor.id, Floor.number)
+        .select_from(Building)
+        .outerjoin(Floor, Floor.building_id == Building.id)
+        .where(Building.code == edificio)
+        .order_by(Floor.number)
+    ).all()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Edificio no encontrado")
+    floors = {number: floor_id for _, floor_id, number in rows if floor_id is not None}
+
+    if any(p.strip().lower() == "all" for p in pisos):
+        numbers = sorted(floors)
+    else:
+        try:
+            numbers = sorted({int(p) for p in pisos})
+        except ValueError:
+            raise HTTPException(status_code=400, detail="pisos debe ser una lista de números o 'all'")
+        missing = [n for n in numbers if n not in floors]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Pisos no encontrados: {', '.join(map(str, missing))}")
+
+    step = (bucket or max(1, math.ceil(hours * 60 / _TRENDS_TARGET_POINTS))) * 60
+    now = datetime.now(timezone.utc)
+    since = now - timedelta(hours=hours)
+    # Buckets alineados a la época: el mismo instante cae en el mismo bucket en cualquier piso
+    first = int(since.timestamp()) // step * step
+    last = int(now.timestamp()) // step * step
+    size = (last - first) // step + 1
+
+    series = {n: {"temp_C": [None] * size, "humedad_pct": [None] * size, "energia_kW": [None] * size} for n in numbers}
+    if numbers:
+        bucket_col = (func.floor(func.extract("epoch", Metric.time) / step) * step).label("bucket")
+        by_id = {floors[n]: n for n in numbers}
+        aggregated = db.execute(
+            select(
+                Metric.floor_id,
+                bucket_col,
+                func.avg(Metric.temp_c),
+                func.avg(Metric.humidity_pct),
+                func.avg(Metric.energy_kw),
+            )
+            .where(Metric.floor_id.in_(list(by_id)), Metric.time >= since)
+            .group_by(Metric.floor_id, bucket_col)
+        )
+        for floor_id, epoch, temp, humidity, energy in aggregated:
+            i = (int(epoch) - first) // step
+            if not 0 <= i < size:
+                continue
+            values = series[by_id[floor_id]]
+            values["temp_C"][i] = round(float(temp), 2) if temp is not None else None
+            values["humedad_pct"][i] = round(float(humidity), 2) if humidity is not None else None
+            values["energia_kW"][i] = round(float(energy), 3) if energy is not None else None
+
+    return {
+        "edificio": edificio,
+        "bucket_minutos": step // 60,
+        "timestamps": [
+            datetime.fromtimestamp(first + i * step, timezone.utc).isoformat() for i in range(size)
+        ],
+        "pisos": [{"piso": n, **series[n]} for n in numbers],
+    }
+
+
+@router.get("/trends", summary="Series de tiempo para gráficas", response_model=dict)
+def trends(
+    request: Request,
+    response: Response,
+    edificio: str,
+    piso: Optional[int] = Query(None, description="Un piso: lecturas crudas"),
+    pisos: Optional[List[str]] = Query(
+        None, description="Varios pisos (repetible) o 'all': eje común en buckets y series alineadas"
+    ),
+    hours: int = Query(4, ge=1, le=24),
+    bucket: Optional[int] = Query(None, ge=1, le=60, description="Minutos por bucket con `pisos` (automático si se omite)"),
+    db: Session = Depends(get_building_db),
+):
+    if piso is None and not pisos:
+        raise HTTPException(status_code=400, detail="Indica piso o pisos")
+    if piso is not None and pisos:
+        raise HTTPException(status_code=400, detail="Usa piso o pisos, no ambos")
+
+    # La ventana se desplaza con el tiempo: el ETag también cambia cada minuto. Con varios
+    # pisos la versión es la del edificio
+    not_modified = conditional_response(
+        request, response, edificio, piso, variant=str(int(datetime.utcnow().timestamp() // 60))
+    )
+    if not_modified:
+        return not_modified
+
+    if pisos:
+        return cached_response(
+            request, response, lambda: _aligned_trends(db, edificio, pisos, hours, bucket), edificio
+        )
+
+    def compute():
+        building = db.query(Building).filter_by(code=edificio).first()
+        if not building:
+            raise HTTPException(status_code=404, detail="Edificio no encontrado")
+        floor = db.query(Floor).filter(Floor.building_id == building.id, Floor.number == piso).first()
+        if not floor:
+            raise HTTPException(status_code=404, detail="Piso no encontrado")
+
+        since = datetime.utcnow() - timedelta(hours=hours)
+        qs = (
+            db.query(Metric)
+            .filter(Metric.floor_id == floor.id, Metric.time >= since)
+            .order_by(Metric.time.asc())
+            .all()
+        )
+        return _trends_payload(qs)
+
+    return cached_response(request, response, compute, edificio, piso)
+
+
+# ============================================================
+# ENERGÍA consumida (kWh por día)
+# ============================================================
+
+@router.get("/energy", summary="Energía consumida por piso y día (kWh)", response_model=dict)
+def energy(
+    request: Request,
+    response: Response,
+    edificio: str,
+    desde: Optional[date] = Query(None, description="Primer día (por defecto, 6 días antes de `hasta`)"),
+    hasta: Optional[date] = Query(None, description="Último día (por defecto, hoy en `tz`)"),
+    tz: Optional[str] = Query(None, description="Zona horaria que corta los días (por defecto ENERGY_TIMEZONE)"),
+    pisos: Optional[List[int]] = Query(None, description="Pisos (repetible); todos si se omite"),
+    db: Session = Depends(get_building_db),
+):
+    tz = tz or settings.ENERGY_TIMEZONE
+    try:
+        zone = ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Zona horaria desconocida: {tz}")
+    today = datetime.now(zone).date()
+    hasta = hasta or today
+    desde = desde or hasta - timedelta(days=6)
+    if desde > hasta:
+        raise HTTPException(status_code=400, detail="desde debe ser anterior o igual a hasta")
+    if (hasta - desde).days + 1 > settings.ENERGY_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Máximo {settings.ENERGY_MAX_DAYS} días por consulta")
+
+    # El día en curso cambia con cada lectura: el ETag depende también del día y la zona
+    not_modified = conditional_response(request, response, edificio, None, variant=f"{today.isoformat()}:{tz}")
+    if not_modified:
+        return not_modified
+
+    def compute():
+        building = db.query(Building).filter_by(code=edificio).first()
+        if not building:
+            raise HTTPException(status_code=404, detail="Edificio no encontrado")
+        q = db.query(Floor.id, Floor.number).filter(Floor.building_id == building.id)
+        if pisos:
+            q = q.filter(Floor.number.in_(pisos))
+        floors = q.order_by(Floor.number).all()
+        if not floors:
+            raise HTTPException(status_code=404, detail="Pisos no encontrados")
+
+        kwh, partial = daily_kwh(db, [f.id for f in floors], desde, hasta, tz)
+        days = (hasta - desde).days + 1
+        per_day = [round(sum(kwh[f.id][i] for f in floors), 3) for i in range(days)]
+        return {
+            "edificio": edificio,
+            "tz": tz,
+            "desde": desde.isoformat(),
+            "hasta": hasta.isoformat(),
+            "max_gap_minutos": settings.ENERGY_MAX_GAP_MINUTES,
+            "dias": [(desde + timedelta(days=i)).isoformat() for i in range(days)],
+            "pisos": [
+                {"piso": f.number, "kwh": kwh[f.id], "total_kwh": round(sum(kwh[f.id]), 3)}
+                for f in floors
+            ],
+            "total_kwh_por_dia": per_day,
+            "total_kwh": round(sum(per_day), 3),
+            # Día en curso incluido (todavía puede cambiar)
+            "parcial": partial.isoformat() if partial else None,
+        }
+
+    return cached_response(request, response, compute, edificio)
+
 
 # ============================================================
 # TARJETAS por piso (estado + resumen MEJORADO)
 # ============================================================
 
+def _latest_cards(db: Session, building_ids: List[int]) -> dict[int, list[dict]]:
+    """
+    Tarjetas de todos los pisos de los edificios indicados, agrupadas por building_id y
+    ordenadas por número de piso. Usa dos consultas en total, sin importar cuántos
+    pisos haya: pisos + último registro (LATERAL) y umbrales de energía activos.
+    """
+    last = (
+        select(Metric.time, Metric.temp_c, Metric.humidity_pct, Metric.energy_kw)
+        .where(Metric.floor_id == Floor.id)
+        .order_by(Metric.time.desc())
+        .limit(1)
+        .lateral("last")
+    )
+    rows = db.execute(
+        select(Floor.id, Floor.building_id, Floor.number, last)
+        .select_from(Floor)
+        .outerjoin(last, true())
+        .where(Floor.building_id.in_(building_ids))
+        .order_by(Floor.building_id, Floor.number)
+    ).all()
+
+    # Para energía, usar umbrales legacy si existen
+    bands = {
+        floor_id: (float(lower), float(upper))
+        for floor_id, lower, upper in db.query(Threshold.floor_id, Threshold.lower, Threshold.upper)
+        .join(Floor, Floor.id == Threshold.floor_id)
+        .filter(
+            Floor.building_id.in_(building_ids),
+            Threshold.variable == Variable.energy,
+            Threshold.is_active == True,
+        )
+    }
+    default_band = DEFAULT_THRESHOLDS[Variable.energy]
+
+    out: dict[int, list[dict]] = {b: [] for b in building_ids}
+    for row in rows:
+        if row.time is None:
+            card = _empty_card(row.number)
+        else:
+            card = _build_card(row.number, row, bands.get(row.id, default_band))
+        out[row.building_id].append(card)
+    return out
+
+
 @router.get("/cards", summary="Tarjetas por piso (estado y resumen con recomendaciones)", response_model=list[dict])
 def floor_cards(
+    request: Request,
+    response: Response,
     edificio: str,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_building_db),
 ):
-    building = db.query(Building).filter_by(code=edificio).first()
-    if not building:
-        raise HTTPException(status_code=404, detail="Edificio no encontrado")
+    not_modified = conditional_response(request, response, edificio)
+    if not_modified:
+        return not_modified
 
-    result = []
-    for floor in db.query(Floor).filter(Floor.building_id == building.id).order_by(Floor.number.asc()):
-        # último registro del piso
-        last: Metric | None = (
-            db.query(Metric)
-            .filter(Metric.floor_id == floor.id)
-            .order_by(Metric.time.desc())
-            .first()
-        )
-        if not last:
-            result.append({
-                "piso": floor.number,
-                "estado": "sin datos",
-                "resumen": "—",
-                "detalle": {
-                    "temperatura": {"valor": None, "nivel": None, "recomendacion": "Sin datos"},
-                    "humedad": {"valor": None, "nivel": None, "recomendacion": "Sin datos"},
-                    "energia": {"valor": None, "nivel": None, "recomendacion": "Sin datos"}
-                }
-            })
-            continue
+    def compute():
+        building = db.query(Building).filter_by(code=edificio).first()
+        if not building:
+            raise HTTPException(status_code=404, detail="Edificio no encontrado")
+        return _latest_cards(db, [building.id])[building.id]
 
-        # Obtener valores
-        temp = float(last.temp_c) if last.temp_c is not None else None
-        humidity = float(last.humidity_pct) if last.humidity_pct is not None else None
-        energy = float(last.energy_kw) if last.energy_kw is not None else None
+    return cached_response(request, response, compute, edificio)
 
-        # Evaluar usando los umbrales específicos de la imagen
-        temp_level, temp_rec = _evaluate_temperature(temp)
-        humidity_level, hum_rec = _evaluate_humidity(humidity)
-        
-        # Para energía, usar umbrales legacy si existen
-        th = _active_thresholds_map(db, floor.id)
-        energy_level = _level_for(energy, *th.get(Variable.energy, (0.0, 10.0)))
 
-        # Generar resumen detallado
-        detalle = _generate_detailed_summary(
-            temp, humidity, energy,
-            temp_level, humidity_level, energy_level
-        )
+# ============================================================
+# PORTAFOLIO (todos los edificios en una petición)
+# ============================================================
+
+_SEVERITY = {"sin datos": 0, "OK": 1, "Media": 2, "Crítica": 3}
+
+
+def _rollup(building: Building, cards: list[dict]) -> dict:
+    """Resumen compacto de un edificio a partir de sus tarjetas"""
+    counts = {estado: 0 for estado in _SEVERITY}
+    for card in cards:
+        counts[card["estado"]] += 1
+    timestamps = [card["timestamp"] for card in cards if "timestamp" in card]
+    return {
+        "edificio": building.code,
+        "nombre": building.name,
+        "estado": max((card["estado"] for card in cards), key=_SEVERITY.get, default="sin datos"),
+        "pisos": len(cards),
+        "conteo": counts,
+        "ultima_lectura": max(timestamps, default=None),
+    }
 
-        # Estado general = peor de los niveles presentes
-        order = {None: 0, AlertLevel.info: 1, AlertLevel.medium: 2, AlertLevel.critical: 3}
-        worst = max(
-            [temp_level, humidity_level, energy_level],
-            key=lambda x: order.get(x, 0)
+
+def _portfolio(edificios: Optional[List[str]], with_cards: bool) -> list[dict]:
+    """
+    Resumen (y tarjetas) por edificio. Con varios shards se consulta cada uno en paralelo
+    y se unen los resultados ordenados por código.
+    """
+    def per_shard(codes: Optional[List[str]]):
+        def run(db: Session) -> list[dict]:
+            q = db.query(Building)
+            if codes:
+                q = q.filter(Building.code.in_(codes))
+            buildings = q.order_by(Building.code.asc()).all()
+            cards = _latest_cards(db, [b.id for b in buildings])
+            return [
+                {**_rollup(b, cards[b.id]), "tarjetas": cards[b.id]} if with_cards else _rollup(b, cards[b.id])
+                for b in buildings
+            ]
+        return run
+
+    if edificios:
+        parts = shard_router.fan_out_each(
+            {shard: per_shard(codes) for shard, codes in shard_router.group_codes(edificios).items()}
         )
-        estado = {
-            None: "OK",
-            AlertLevel.info: "OK",
-            AlertLevel.medium: "Media",
-            AlertLevel.critical: "Crítica"
-        }[worst]
-
-        # Resumen breve (para compatibilidad)
-        vals = {
-            "temp_C": temp,
-            "humedad_pct": humidity,
-            "energia_kW": energy,
-        }
-        levels = {
-            Variable.temperature: temp_level,
-            Variable.humidity: humidity_level,
-            Variable.energy: energy_level,
-        }
-        resumen = _brief_summary(vals, levels)
-
-        result.append({
-            "piso": floor.number,
-            "estado": estado,
-            "resumen": resumen,
-            "timestamp": last.time.isoformat(),
-            "valores": vals,
-            "detalle": detalle,
-        })
+    else:
+        parts = shard_router.fan_out(per_shard(None))
+    out = sorted((item for part in parts for item in part), key=lambda item: item["edificio"])
+
+    if edificios:
+        missing = set(edificios) - {item["edificio"] for item in out}
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Edificios no encontrados: {', '.join(sorted(missing))}")
+    return out
 
-    return result
+
+@router.get("/portfolio", summary="Tarjetas de todos los pisos de todos los edificios", response_model=list[dict])
+def portfolio(
+    request: Request,
+    response: Response,
+    edificios: Optional[List[str]] = Query(None, description="Códigos de edificio (repetible); por defecto todos"),
+):
+    not_modified = conditional_response(request, response, None)
+    if not_modified:
+        return not_modified
+    return cached_response(request, response, lambda: _portfolio(edificios, with_cards=True))
+
+
+@router.get("/portfolio/rollup", summary="Resumen compacto por edificio (mapa general)", response_model=list[dict])
+def portfolio_rollup(
+    request: Request,
+    response: Response,
+    edificios: Optional[List[str]] = Query(None, description="Códigos de edificio (repetible); por defecto todos"),
+):
+    not_modified = conditional_response(request, response, None)
+    if not_modified:
+        return not_modified
+    return cached_response(request, response, lambda: _portfolio(edificios, with_cards=False))
 
 
 # ============================================================
@@ -456,39 +1199,48 @@ def floor_cards(
 
 @router.get("/alerts", summary="Tabla de alertas", response_model=list[dict])
 def alerts_table(
+    request: Request,
+    response: Response,
     edificio: str,
     piso: Optional[int] = None,
     nivel: Optional[AlertLevel] = Query(None, description="info | medium | critical"),
     limit: int = Query(200, ge=1, le=1000),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_building_db),
 ):
-    building = db.query(Building).filter_by(code=edificio).first()
-    if not building:
-        raise HTTPException(status_code=404, detail="Edificio no encontrado")
+    not_modified = conditional_response(request, response, edificio, piso)
+    if not_modified:
+        return not_modified
+
+    def compute():
+        building = db.query(Building).filter_by(code=edificio).first()
+        if not building:
+            raise HTTPException(status_code=404, detail="Edificio no encontrado")
+
+        q = (
+            db.query(Alert, Floor.number.label("piso"))
+            .join(Floor, Floor.id == Alert.floor_id)
+            .filter(Floor.building_id == building.id)
+        )
+        if piso is not None:
+            q = q.filter(Floor.number == piso)
+        if nivel is not None:
+            q = q.filter(Alert.level == nivel)
+
+        rows = q.order_by(Alert.created_at.desc()).limit(limit).all()
+
+        out = []
+        for alert, piso_num in rows:
+            out.append({
+                "timestamp": alert.created_at.isoformat(),
+                "piso": piso_num,
+                "variable": alert.variable.value,
+                "nivel": alert.level.value,
+                "recomendacion": alert.recommendation,
+                "mensaje": alert.message,
+            })
+        return out
 
-    q = (
-        db.query(Alert, Floor.number.label("piso"))
-        .join(Floor, Floor.id == Alert.floor_id)
-        .filter(Floor.building_id == building.id)
-    )
-    if piso is not None:
-        q = q.filter(Floor.number == piso)
-    if nivel is not None:
-        q = q.filter(Alert.level == nivel)
-
-    rows = q.order_by(Alert.created_at.desc()).limit(limit).all()
-
-    out = []
-    for alert, piso_num in rows:
-        out.append({
-            "timestamp": alert.created_at.isoformat(),
-            "piso": piso_num,
-            "variable": alert.variable.value,
-            "nivel": alert.level.value,
-            "recomendacion": alert.recommendation,
-            "mensaje": alert.message,
-        })
-    return out
+    return cached_response(request, response, compute, edificio, piso)
 
 
 # ============================================================
@@ -507,13 +1259,15 @@ def _should_create_alert(
     if level == AlertLevel.info:
         return False  # No crear alertas informativas automáticamente
     
-    # Buscar alertas similares abiertas en los últimos 30 minutos
+    # Buscar alertas similares abiertas en los últimos 30 minutos. Las previstas por el
+    # pronóstico no cuentan: un aviso anticipado no debe ocultar la alerta real
     recent = (
         db.query(Alert)
         .filter(
             Alert.floor_id == floor_id,
             Alert.variable == variable,
             Alert.status == AlertStatus.open,
+            Alert.is_predicted == False,
             Alert.created_at >= datetime.utcnow() - timedelta(minutes=30)
         )
         .first()
@@ -529,30 +1283,16 @@ def _create_alert_from_anomaly(
     message: str
 ) -> Optional[Alert]:
     """
-    Crea una alerta con recomendación generada por Gemini AI
+    Crea una alerta con la recomendación del proveedor configurado (Gemini por defecto)
     """
     if not _should_create_alert(db, floor.id, variable, level):
         return None
     
-    # Obtener contexto histórico reciente (últimas 2 horas)
-    historical = (
-        db.query(Metric)
-        .filter(
-            Metric.floor_id == floor.id,
-            Metric.time >= datetime.utcnow() - timedelta(hours=2)
-        )
-        .order_by(Metric.time.desc())
-        .limit(10)
-        .all()
-    )
-    
-    historical_context = {
-        "count": len(historical),
-        "trend": "increasing" if len(historical) > 1 and historical[0].temp_c and historical[-1].temp_c and historical[0].temp_c > historical[-1].temp_c else "stable"
-    }
+    # Contexto histórico de la variable (tendencia, ritmo, z-score) desde el estado en memoria
+    historical_context = detector_state.context(floor.id, variable)
     
-    # Generar recomendación con Gemini
-    recommendation = gemini_service.generate_recommendation(
+    # Generar recomendación (Gemini, reglas o stub según RECOMMENDATION_PROVIDER)
+    recommendation = recommendation_provider.generate_recommendation(
         variable=variable,
         level=level,
         floor_number=floor.number,
@@ -572,6 +1312,7 @@ def _create_alert_from_anomaly(
     db.add(alert)
     db.commit()
     db.refresh(alert)
+    ALERTS_CREATED.labels(level=level.value, variable=variable.value).inc()
     return alert
 
 def _detect_and_create_alerts(
@@ -580,32 +1321,36 @@ def _detect_and_create_alerts(
     temp: Optional[float],
     humidity: Optional[float],
     energy: Optional[float]
-):
+) -> List[Alert]:
     """
-    Detecta anomalías y crea alertas automáticamente
+    Detecta anomalías y crea alertas automáticamente.
+    Retorna las alertas creadas.
     """
+    created: List[Alert] = []
+
     # Evaluar temperatura
     if temp is not None:
         temp_level, temp_msg = _evaluate_temperature(temp)
         if temp_level in (AlertLevel.medium, AlertLevel.critical):
-            _create_alert_from_anomaly(
+            created.append(_create_alert_from_anomaly(
                 db, floor, Variable.temperature, temp_level, temp, temp_msg
-            )
+            ))
     
     # Evaluar humedad
     if humidity is not None:
         hum_level, hum_msg = _evaluate_humidity(humidity)
         if hum_level in (AlertLevel.medium, AlertLevel.critical):
-            _create_alert_from_anomaly(
+            created.append(_create_alert_from_anomaly(
                 db, floor, Variable.humidity, hum_level, humidity, hum_msg
-            )
+            ))
     
     # Evaluar energía (usar umbrales legacy)
     if energy is not None:
         th = _active_thresholds_map(db, floor.id)
-        energy_level = _level_for(energy, *th.get(Variable.energy, (0.0, 10.0)))
+        energy_level, energy_msg = _evaluate_energy(energy, th.get(Variable.energy, (0.0, 10.0)))
         if energy_level in (AlertLevel.medium, AlertLevel.critical):
-            energy_msg = f"Consumo de energía fuera de rango: {energy} kW"
-            _create_alert_from_anomaly(
+            created.append(_create_alert_from_anomaly(
                 db, floor, Variable.energy, energy_level, energy, energy_msg
-            )
+            ))
+
+    return [a for a in created if a is not None]
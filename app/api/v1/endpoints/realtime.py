@@ -0,0 +1,94 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from typing import Optional
+import json
+
+from app.api.deps import get_building_db
+from app.core.config import settings
+from app.db.models.building import Building
+from app.services.realtime_hub import realtime_hub
+
+router = APIRouter()
+
+
+def _building_exists(db: Session, edificio: str) -> bool:
+    """
+    Verifica el edificio y libera la sesión: la suscripción puede durar horas y no debe
+    retener una conexión del pool. Se llama con `run_in_threadpool` desde los handlers async.
+    """
+    try:
+        return db.query(Building.id).filter_by(code=edificio).first() is not None
+    finally:
+        db.close()
+
+
+# ============================================================
+# WebSocket
+# ============================================================
+
+@router.websocket("/ws")
+async def stream_ws(
+    websocket: WebSocket,
+    edificio: str,
+    piso: Optional[int] = None,
+    db: Session = Depends(get_building_db),
+):
+    """
+    Suscripción en tiempo real a un edificio (opcionalmente a un piso).
+    Empuja eventos `lectura`, `tarjeta` y `alerta` a medida que la ingesta los confirma.
+    """
+    if not await run_in_threadpool(_building_exists, db, edificio):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Edificio no encontrado")
+        return
+
+    await websocket.accept()
+    sub = realtime_hub.subscribe(edificio, piso)
+    try:
+        while True:
+            event = await sub.get(timeout=settings.REALTIME_HEARTBEAT_SECONDS)
+            if event is None:
+                event = {"tipo": "ping", "edificio": edificio, "piso": piso, "data": {}}
+            await websocket.send_text(json.dumps(event, default=str))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        realtime_hub.unsubscribe(sub)
+
+
+# ============================================================
+# Server-Sent Events (fallback)
+# ============================================================
+
+@router.get("/sse", summary="Suscripción en tiempo real (Server-Sent Events)")
+async def stream_sse(
+    request: Request,
+    edificio: str,
+    piso: Optional[int] = None,
+    db: Session = Depends(get_building_db),
+):
+    """Mismo flujo que `/ws` para clientes que no pueden abrir un WebSocket"""
+    if not await run_in_threadpool(_building_exists, db, edificio):
+        raise HTTPException(status_code=404, detail="Edificio no encontrado")
+
+    sub = realtime_hub.subscribe(edificio, piso)
+
+    async def event_source():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                event = await sub.get(timeout=settings.REALTIME_HEARTBEAT_SECONDS)
+                if event is None:
+                    # comentario SSE para mantener viva la conexión
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: {event['tipo']}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            realtime_hub.unsubscribe(sub)
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
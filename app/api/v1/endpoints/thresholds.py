@@ -1,26 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
-from app.api.deps import get_db
 from app.db.models.threshold import Threshold
 from app.db.schemas.threshold import ThresholdCreate, ThresholdOut
+from app.db.shards import shard_router
+from app.services.data_version import data_versions
 
 router = APIRouter()
 
 @router.get("/", response_model=List[ThresholdOut])
-def list_thresholds(db: Session = Depends(get_db)):
-    return db.query(Threshold).all()
+def list_thresholds():
+    def query(db: Session) -> List[ThresholdOut]:
+        return [ThresholdOut.model_validate(t) for t in db.query(Threshold).all()]
+
+    return [t for part in shard_router.fan_out(query) for t in part]
 
 @router.post("/", response_model=ThresholdOut, status_code=201)
-def create_threshold(payload: ThresholdCreate, db: Session = Depends(get_db)):
+def create_threshold(payload: ThresholdCreate):
     if payload.lower > payload.upper:
         raise HTTPException(status_code=400, detail="lower no puede ser mayor que upper")
-    obj = Threshold(**payload.model_dump())
-    db.add(obj)
-    try:
-        db.commit()
-    except Exception:
-        db.rollback()
-        raise HTTPException(status_code=400, detail="Ya existe un umbral activo para esa variable y piso")
-    db.refresh(obj)
-    return obj
+    # El id del piso indica en qué shard vive
+    with shard_router.for_id(payload.floor_id).session() as db:
+        obj = Threshold(**payload.model_dump())
+        db.add(obj)
+        try:
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise HTTPException(status_code=400, detail="Ya existe un umbral activo para esa variable y piso")
+        db.refresh(obj)
+        # Los umbrales cambian el estado de las tarjetas del piso
+        data_versions.bump_floor(db, obj.floor_id)
+        return ThresholdOut.model_validate(obj)
@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.api.v1.endpoints import buildings, floors, thresholds, metrics, alerts
+from app.api.v1.endpoints import buildings, floors, thresholds, metrics, alerts, realtime
 
 api_router = APIRouter()
 api_router.include_router(buildings.router, prefix="/buildings", tags=["buildings"])
@@ -7,3 +7,4 @@ api_router.include_router(floors.router, prefix="/floors", tags=["floors"])
 api_router.include_router(thresholds.router, prefix="/thresholds", tags=["thresholds"])
 api_router.include_router(metrics.router, prefix="/metrics", tags=["metrics"])
 api_router.include_router(alerts.router, prefix="/alerts", tags=["alerts"])
+api_router.include_router(realtime.router, prefix="/stream", tags=["stream"])
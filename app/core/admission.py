@@ -0,0 +1,175 @@
+"""
+Control de admisión por clase de tráfico.
+
+Cada clase (ingesta, lecturas interactivas, cargas masivas) tiene su propio cupo de
+peticiones simultáneas y una cola acotada. Así una ráfaga de ingesta no ocupa todo el
+thread pool ni el pool de conexiones de los dashboards, y viceversa.
+
+- Si el cupo está lleno la petición espera en la cola de su clase, ordenada por prioridad
+  (header `ADMISSION_PRIORITY_HEADER`: critical | high | normal | low).
+- Con la cola llena se rechaza al instante con 429. Si vence la espera, con 503. Ambas
+  respuestas llevan `Retry-After`.
+- Las peticiones `critical` no cuentan para el límite de la cola y tienen
+  `ADMISSION_CRITICAL_RESERVED` lugares extra por clase: la ingesta de alertas críticas
+  sigue entrando aunque el resto esté saturado.
+
+Los cupos son por worker (un event loop por proceso).
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from typing import Dict, List, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+from app.core.config import settings
+from app.core.instrumentation import ADMISSION_SHED, ADMISSION_WAIT
+
+PRIORITIES = {"critical": 0, "high": 1, "normal": 2, "low": 3}
+CRITICAL = PRIORITIES["critical"]
+NORMAL = PRIORITIES["normal"]
+
+_INGEST_PATHS = {"/api/v1/metrics/ingest", "/api/v1/metrics/upload-csv"}
+_BULK_PATHS = {"/api/v1/metrics/import", "/api/v1/metrics/portfolio"}
+
+
+def traffic_class(method: str, path: str) -> Optional[str]:
+    """ingest | bulk | interactive, o None si la petición no pasa por el control"""
+    if method == "OPTIONS" or not path.startswith("/api/v1/") or path.startswith("/api/v1/stream/"):
+        return None
+    path = path.rstrip("/")
+    if path in _INGEST_PATHS:
+        return "ingest"
+    if path in _BULK_PATHS:
+        return "bulk"
+    return "interactive"
+
+
+class Shed(Exception):
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Budget:
+    """Cupo de concurrencia con cola acotada y ordenada por prioridad (un solo event loop)."""
+
+    def __init__(self, name: str, limit: int, max_queue: int, timeout: float, reserved: int = 0):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.reserved = reserved
+        self.active = 0
+        self._waiters: List[list] = []  # heap de [prioridad, orden de llegada, future]
+        self._seq = itertools.count()
+        self._service_time = 0.1       # EWMA de la duración de una petición, para Retry-After
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _capacity(self, priority: int) -> int:
+        return self.limit + (self.reserved if priority == CRITICAL else 0)
+
+    def retry_after(self) -> int:
+        """Segundos estimados hasta que se libere lugar para la cola actual"""
+        wait = self._service_time * (self.queued + 1) / max(self.limit, 1)
+        return min(max(math.ceil(wait), 1), 30)
+
+    async def acquire(self, priority: int = NORMAL) -> None:
+        # Entra directo si hay lugar y nadie de igual o mayor prioridad está esperando
+        if self.active < self._capacity(priority) and (not self._waiters or self._waiters[0][0] > priority):
+            self.active += 1
+            return
+        if priority != CRITICAL and self.queued >= self.max_queue:
+            raise Shed(429, "queue_full", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._seq), future]
+        heapq.heappush(self._waiters, entry)
+        try:
+            await asyncio.wait_for(future, self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # El lugar se asignó justo al vencer: se devuelve
+                self.release()
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            if isinstance(e, asyncio.TimeoutError):
+                raise Shed(503, "timeout", self.retry_after()) from None
+            raise
+
+    def release(self, elapsed: Optional[float] = None) -> None:
+        if elapsed is not None:
+            self._service_time += 0.2 * (elapsed - self._service_time)
+        self.active -= 1
+        # Se despierta en orden de prioridad mientras el primero de la cola tenga lugar
+        while self._waiters and self.active < self._capacity(self._waiters[0][0]):
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.active += 1
+                future.set_result(None)
+
+
+def _budgets() -> Dict[str, Budget]:
+    s = settings
+    return {
+        "ingest": Budget(
+            "ingest", s.ADMISSION_INGEST_LIMIT, s.ADMISSION_INGEST_QUEUE,
+            s.ADMISSION_INGEST_TIMEOUT_SECONDS, s.ADMISSION_CRITICAL_RESERVED,
+        ),
+        "interactive": Budget(
+            "interactive", s.ADMISSION_INTERACTIVE_LIMIT, s.ADMISSION_INTERACTIVE_QUEUE,
+            s.ADMISSION_INTERACTIVE_TIMEOUT_SECONDS, s.ADMISSION_CRITICAL_RESERVED,
+        ),
+        "bulk": Budget(
+            "bulk", s.ADMISSION_BULK_LIMIT, s.ADMISSION_BULK_QUEUE,
+            s.ADMISSION_BULK_TIMEOUT_SECONDS, s.ADMISSION_CRITICAL_RESERVED,
+        ),
+    }
+
+
+class AdmissionMiddleware:
+    """Aplica el cupo de la clase de tráfico a cada petición HTTP (ver docstring del módulo)."""
+
+    def __init__(self, app, budgets: Optional[Dict[str, Budget]] = None):
+        self.app = app
+        self.budgets = budgets if budgets is not None else _budgets()
+        self.priority_header = settings.ADMISSION_PRIORITY_HEADER.lower()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        name = traffic_class(scope["method"], scope["path"])
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        budget = self.budgets[name]
+        priority = PRIORITIES.get(Headers(scope=scope).get(self.priority_header, "").strip().lower(), NORMAL)
+        start = time.perf_counter()
+        try:
+            await budget.acquire(priority)
+        except Shed as shed:
+            ADMISSION_SHED.labels(name, shed.reason).inc()
+            response = JSONResponse(
+                {"detail": f"Servidor saturado ({name}), reintenta en {shed.retry_after}s"},
+                status_code=shed.status_code,
+                headers={"Retry-After": str(shed.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        admitted = time.perf_counter()
+        ADMISSION_WAIT.labels(name).observe(admitted - start)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            budget.release(time.perf_counter() - admitted)
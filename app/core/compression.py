@@ -0,0 +1,269 @@
+"""
+Compresión transparente de peticiones y respuestas (gzip y zstd).
+
+- Peticiones con `Content-Encoding: gzip | zstd` se descomprimen a medida que llega cada
+  trozo del body: los endpoints (JSON, NDJSON en streaming, multipart del CSV) reciben
+  el contenido plano sin que se bufferee el body comprimido.
+- Respuestas de al menos `COMPRESSION_MIN_BYTES` se comprimen según `Accept-Encoding`
+  (zstd si el cliente lo acepta y el paquete `zstandard` está instalado, si no gzip).
+  No se tocan los streams SSE ni las respuestas que ya traen `Content-Encoding`.
+"""
+import zlib
+from typing import Optional
+
+from fastapi import HTTPException
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+from app.core.config import settings
+
+
+def _zstd():
+    """`zstandard` es opcional: sin él solo se usa gzip."""
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+# ============================================================
+# Decodificación de peticiones
+# ============================================================
+
+class _GzipDecoder:
+    """gzip (admite varios miembros concatenados) con límite de tamaño descomprimido"""
+
+    def __init__(self):
+        self._obj = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+
+    def feed(self, data: bytes, limit: int) -> bytes:
+        out = b""
+        while data:
+            # max_length = límite + 1: si se alcanza, el body descomprimido es demasiado grande
+            chunk = self._obj.decompress(data, limit - len(out) + 1)
+            out += chunk
+            if len(out) > limit:
+                raise HTTPException(status_code=413, detail="Body descomprimido demasiado grande")
+            data = self._obj.unused_data
+            if data:
+                self._obj = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        return out
+
+    def finish(self) -> None:
+        if not self._obj.eof:
+            raise HTTPException(status_code=400, detail="Body gzip truncado")
+
+
+class _ZstdDecoder:
+    """
+    zstd con límite de tamaño descomprimido. `decompressobj` no acepta un máximo de salida,
+    así que la entrada se pasa de a `_SLICE` bytes: un bloque zstd (3 bytes de encabezado + 1)
+    se expande a lo sumo a 128 KB, y cada llamada produce como mucho ~4 MB antes de revisar
+    el límite (una bomba de pocos KB no llega a inflarse en memoria).
+    """
+
+    _SLICE = 128
+
+    def __init__(self, zstandard):
+        self._zstandard = zstandard
+        self._obj = zstandard.ZstdDecompressor().decompressobj()
+
+    def feed(self, data: bytes, limit: int) -> bytes:
+        out = b""
+        for start in range(0, len(data), self._SLICE):
+            pending = data[start:start + self._SLICE]
+            while pending:
+                if self._obj.eof:
+                    # Otro frame concatenado después del anterior
+                    self._obj = self._zstandard.ZstdDecompressor().decompressobj()
+                out += self._obj.decompress(pending)
+                if len(out) > limit:
+                    raise HTTPException(status_code=413, detail="Body descomprimido demasiado grande")
+                pending = self._obj.unused_data if self._obj.eof else b""
+        return out
+
+    def finish(self) -> None:
+        if not self._obj.eof:
+            raise HTTPException(status_code=400, detail="Body zstd truncado")
+
+
+def _decoder_for(encoding: str):
+    if encoding in ("gzip", "x-gzip"):
+        return _GzipDecoder()
+    if encoding == "zstd":
+        zstandard = _zstd()
+        if zstandard is not None:
+            return _ZstdDecoder(zstandard)
+    return None
+
+
+# ============================================================
+# Codificación de respuestas
+# ============================================================
+
+def _accepted(accept_encoding: str) -> dict[str, float]:
+    """`Accept-Encoding` → {codificación: q}"""
+    out: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            out[name.strip().lower()] = q
+    return out
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = _accepted(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    if accepted.get("zstd", wildcard) > 0 and _zstd() is not None:
+        return "zstd"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+class _GzipEncoder:
+    def __init__(self):
+        self._obj = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, last: bool) -> bytes:
+        out = self._obj.compress(data)
+        return out + self._obj.flush() if last else out
+
+
+class _ZstdEncoder:
+    def __init__(self, zstandard):
+        self._obj = zstandard.ZstdCompressor(level=settings.COMPRESSION_ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes, last: bool) -> bytes:
+        out = self._obj.compress(data)
+        return out + self._obj.flush() if last else out
+
+
+def _encoder_for(encoding: str):
+    return _ZstdEncoder(_zstd()) if encoding == "zstd" else _GzipEncoder()
+
+
+# ============================================================
+# Middleware ASGI
+# ============================================================
+
+class CompressionMiddleware:
+    """Descomprime bodies de peticiones y comprime respuestas grandes (ver docstring del módulo)."""
+
+    def __init__(self, app, minimum_size: Optional[int] = None, max_request_bytes: Optional[int] = None):
+        self.app = app
+        self.minimum_size = settings.COMPRESSION_MIN_BYTES if minimum_size is None else minimum_size
+        self.max_request_bytes = (
+            settings.REQUEST_MAX_DECOMPRESSED_BYTES if max_request_bytes is None else max_request_bytes
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        content_encoding = headers.get("content-encoding", "").strip().lower()
+        if content_encoding and content_encoding != "identity":
+            decoder = _decoder_for(content_encoding)
+            if decoder is None:
+                response = JSONResponse(
+                    {"detail": f"Content-Encoding no soportado: {content_encoding}"},
+                    status_code=415,
+                    headers={"Accept-Encoding": "gzip, zstd" if _zstd() else "gzip"},
+                )
+                await response(scope, receive, send)
+                return
+            scope, receive = self._decoding(scope, receive, decoder, content_encoding)
+
+        encoding = choose_encoding(headers.get("accept-encoding", ""))
+        if encoding is None or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, self._encoding(send, encoding))
+
+    def _decoding(self, scope, receive, decoder, content_encoding: str):
+        # El body que ve la app ya no está comprimido ni tiene el largo original. Se modifica
+        # el mismo scope: los middlewares de afuera leen de él la ruta resuelta
+        scope["headers"] = [
+            (k, v) for k, v in scope["headers"] if k not in (b"content-encoding", b"content-length")
+        ]
+        remaining = self.max_request_bytes
+        done = False
+
+        async def receive_decoded():
+            nonlocal remaining, done
+            if done:
+                return {"type": "http.request", "body": b"", "more_body": False}
+            while True:
+                message = await receive()
+                if message["type"] != "http.request":
+                    return message
+                more = message.get("more_body", False)
+                try:
+                    body = decoder.feed(message.get("body", b""), remaining)
+                    if not more:
+                        decoder.finish()
+                except HTTPException:
+                    raise
+                except Exception as e:  # zlib.error / zstandard.ZstdError
+                    raise HTTPException(status_code=400, detail=f"Body {content_encoding} inválido: {e}") from e
+                remaining -= len(body)
+                done = not more
+                # Un trozo comprimido puede no producir salida todavía: se sigue leyendo
+                if body or not more:
+                    return {"type": "http.request", "body": body, "more_body": more}
+
+        return scope, receive_decoded
+
+    def _encoding(self, send, encoding: str):
+        start_message = None
+        encoder = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, encoder, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if encoder is None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                headers.add_vary_header("Accept-Encoding")
+                if (
+                    "content-encoding" in headers
+                    or headers.get("content-type", "").startswith("text/event-stream")
+                    or start_message["status"] in (204, 304)
+                    or (not more and len(body) < self.minimum_size)
+                ):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                encoder = _encoder_for(encoding)
+                data = encoder.compress(body, last=not more)
+                headers["Content-Encoding"] = encoding
+                if more:
+                    del headers["Content-Length"]
+                else:
+                    headers["Content-Length"] = str(len(data))
+                await send(start_message)
+                await send({"type": "http.response.body", "body": data, "more_body": more})
+                return
+
+            await send({"type": "http.response.body", "body": encoder.compress(body, last=not more), "more_body": more})
+
+        return send_compressed
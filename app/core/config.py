@@ -13,6 +13,113 @@ class Settings(BaseSettings):
     # Gemini AI Configuration
     GEMINI_API_KEY: str = ""
     GEMINI_MODEL: str = "gemini-1.5-flash"  # Modelo gratuito disponible
+    GEMINI_RESOLVED_MODEL: str = ""        # lo fija el launcher tras probar los modelos una vez
+
+    # Proveedor de recomendaciones (app/services/recommendations.py): gemini | rules | stub
+    RECOMMENDATION_PROVIDER: str = "gemini"
+    RECOMMENDATION_STUB_LATENCY: str = "lognormal"   # fixed | uniform | lognormal
+    RECOMMENDATION_STUB_LATENCY_MS: float = 800.0    # valor fijo, centro (uniform) o mediana (lognormal)
+    RECOMMENDATION_STUB_LATENCY_SPREAD: float = 0.5  # ± fracción (uniform) o sigma (lognormal)
+    RECOMMENDATION_STUB_MAX_LATENCY_MS: float = 30000.0
+    RECOMMENDATION_STUB_ERROR_RATE: float = 0.0
+    RECOMMENDATION_STUB_SEED: int | None = None
+
+    # Servidor (python -m app.serve)
+    HOST: str = "0.0.0.0"
+    PORT: int = 8000
+    WEB_CONCURRENCY: int = 1               # procesos worker; 0 = uno por núcleo
+    GRACEFUL_SHUTDOWN_SECONDS: float = 30.0
+    CHANGE_BUS_ENABLED: bool = False       # LISTEN/NOTIFY entre workers; el launcher lo activa con >1 worker
+
+    # Sharding por edificio (app/db/shards.py). Sin SHARD_URLS todo va a la base de db_url
+    SHARD_URLS: dict[str, str] = {}        # nombre → URL de cada shard adicional (JSON en el .env)
+    SHARD_BUILDINGS: dict[str, str] = {}   # código de edificio → shard; los demás van a "default"
+    SHARD_ID_SPAN: int = 100_000_000       # ids por shard: el shard k numera desde k * SPAN
+
+    # Estado de detección por piso (tendencia, tasa de cambio, z-score)
+    DETECTOR_WINDOW: int = 64              # lecturas por variable en el ring buffer
+    DETECTOR_EWMA_ALPHA: float = 0.1
+    DETECTOR_WARMUP_HOURS: float = 6.0     # historia que se carga al arrancar
+
+    # Alertas predictivas (app/services/forecast.py)
+    FORECAST_ENABLED: bool = True
+    FORECAST_INTERVAL_SECONDS: float = 300.0
+    FORECAST_HORIZON_MINUTES: float = 60.0  # se alerta si el cruce se espera dentro de este plazo
+    FORECAST_METHOD: str = "linear"        # linear | holt
+    FORECAST_POINTS: int = 32              # lecturas por piso que entran al ajuste
+    FORECAST_MIN_POINTS: int = 6
+    FORECAST_LOOKBACK_MINUTES: float = 120.0
+    FORECAST_HOLT_ALPHA: float = 0.5
+    FORECAST_HOLT_BETA: float = 0.3
+
+    # Energía consumida (app/services/energy.py)
+    ENERGY_MAX_GAP_MINUTES: float = 15.0   # un hueco más largo entre lecturas cuenta como este largo
+    ENERGY_TIMEZONE: str = "UTC"           # zona por defecto para cortar los días
+    ENERGY_MAX_DAYS: int = 366
+
+    # Reevaluación histórica de alertas (app/services/alert_reevaluation.py)
+    ALERT_REEVAL_WORKERS: int = 2          # procesos del pool (máximo para la API)
+    ALERT_REEVAL_MAX_JOBS: int = 1         # jobs simultáneos por host lanzados por la API
+    ALERT_REEVAL_CHUNK_HOURS: int = 24     # ventana de tiempo por lectura en bloque
+    ALERT_REEVAL_DIR: str = "reevaluations"  # estado de los jobs lanzados por la API
+    ALERT_REEVAL_SAMPLE: int = 50          # alertas de muestra en el diff (dry-run)
+
+    # Arranque
+    SCHEMA_CHECK: str = "create_all"       # create_all | alembic | off
+    STARTUP_REPORT: bool = False           # detalle de imports; se lee del entorno antes que settings
+
+    # Tiempo real (WebSocket / SSE)
+    REALTIME_BUFFER_SIZE: int = 256        # eventos en cola por cliente
+    REALTIME_HEARTBEAT_SECONDS: float = 15.0
+
+    # Caché de respuestas GET (memory | redis | off)
+    RESPONSE_CACHE_BACKEND: str = "memory"
+    RESPONSE_CACHE_TTL_SECONDS: float = 5.0
+    RESPONSE_CACHE_MAX_ENTRIES: int = 2048
+    REDIS_URL: str = "redis://localhost:6379/0"
+
+    # Compresión (app/core/compression.py)
+    COMPRESSION_MIN_BYTES: int = 1024      # respuestas más chicas salen sin comprimir
+    COMPRESSION_GZIP_LEVEL: int = 5
+    COMPRESSION_ZSTD_LEVEL: int = 3
+    REQUEST_MAX_DECOMPRESSED_BYTES: int = 512 * 1024 * 1024
+
+    # Control de admisión por clase de tráfico (app/core/admission.py). La suma de los
+    # cupos debería caber en el pool de conexiones (5 + 10 de overflow por defecto)
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_PRIORITY_HEADER: str = "X-Priority"  # critical | high | normal | low
+    ADMISSION_CRITICAL_RESERVED: int = 2   # lugares extra por clase solo para `critical`
+    ADMISSION_INGEST_LIMIT: int = 6
+    ADMISSION_INGEST_QUEUE: int = 64
+    ADMISSION_INGEST_TIMEOUT_SECONDS: float = 5.0
+    ADMISSION_INTERACTIVE_LIMIT: int = 6
+    ADMISSION_INTERACTIVE_QUEUE: int = 32
+    ADMISSION_INTERACTIVE_TIMEOUT_SECONDS: float = 2.0
+    ADMISSION_BULK_LIMIT: int = 2
+    ADMISSION_BULK_QUEUE: int = 8
+    ADMISSION_BULK_TIMEOUT_SECONDS: float = 10.0
+
+    # Spool local de ingesta para caídas de la base (app/services/ingest_spool.py)
+    INGEST_SPOOL_ENABLED: bool = False
+    INGEST_SPOOL_DIR: str = "spool"
+    INGEST_SPOOL_SEGMENT_BYTES: int = 16 * 1024 * 1024
+    INGEST_SPOOL_MAX_BYTES: int = 1024 * 1024 * 1024   # con el spool lleno la ingesta vuelve a fallar (503)
+    INGEST_SPOOL_REPLAY_BATCH: int = 5000              # lecturas por lote al reaplicar
+    INGEST_SPOOL_REPLAY_INTERVAL_SECONDS: float = 2.0
+    INGEST_SPOOL_FSYNC: bool = True
+
+    # Perfilado a pedido de una petición (app/core/profiling.py). Fuera de PROFILING_ENVS
+    # el middleware no se instala
+    PROFILING_ENVS: list[str] = ["dev", "staging"]
+    PROFILING_TOKEN: str = ""              # valor esperado en X-Profile / __profile (vacío: 1 | true, solo con ENV=dev)
+    PROFILING_INTERVAL_MS: float = 2.0
+    PROFILING_MAX_SECONDS: float = 60.0
+    PROFILING_DIR: str = "profiles"
+    PROFILING_KEEP: int = 50               # perfiles guardados que se conservan
+
+    # Diagnóstico SQL por petición
+    SQL_DEBUG_HEADERS: bool = False        # agrega X-DB-Queries a cada respuesta
+    SQL_N_PLUS_ONE_THRESHOLD: int = 5      # repeticiones de la misma consulta que se reportan
 
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
@@ -0,0 +1,149 @@
+import time
+
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.core.query_stats import statement_observers, track_queries
+
+# ============================================================
+# Métricas Prometheus
+# ============================================================
+
+HTTP_REQUEST_DURATION = Histogram(
+    "smartfloors_http_request_duration_seconds",
+    "Latencia de las peticiones HTTP por ruta",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "smartfloors_db_queries_per_request",
+    "Cantidad de sentencias SQL ejecutadas por petición",
+    ["route"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 250, 500, 1000),
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "smartfloors_db_time_per_request_seconds",
+    "Tiempo total en base de datos por petición",
+    ["route"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+DB_QUERY_DURATION = Histogram(
+    "smartfloors_db_query_duration_seconds",
+    "Duración de cada sentencia SQL",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+INGEST_ROWS = Counter(
+    "smartfloors_ingest_rows_total",
+    "Lecturas ingresadas (rate() = filas por segundo)",
+    ["source"],
+)
+INGEST_DUPLICATES = Counter(
+    "smartfloors_ingest_duplicates_total",
+    "Lecturas descartadas por ya existir (floor_id, time)",
+    ["source"],
+)
+ALERTS_CREATED = Counter(
+    "smartfloors_alerts_created_total",
+    "Alertas creadas por nivel y variable",
+    ["level", "variable"],
+)
+PREDICTED_ALERTS = Counter(
+    "smartfloors_predicted_alerts_total",
+    "Alertas predictivas creadas por el pronóstico, por variable",
+    ["variable"],
+)
+FORECAST_RUN_DURATION = Histogram(
+    "smartfloors_forecast_run_duration_seconds",
+    "Duración de cada corrida del pronóstico (todos los pisos)",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+ADMISSION_SHED = Counter(
+    "smartfloors_admission_shed_total",
+    "Peticiones rechazadas por el control de admisión (queue_full = 429, timeout = 503)",
+    ["traffic_class", "reason"],
+)
+ADMISSION_WAIT = Histogram(
+    "smartfloors_admission_wait_seconds",
+    "Espera en la cola de admisión antes de atender la petición",
+    ["traffic_class"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+INGEST_SPOOL_ROWS = Counter(
+    "smartfloors_ingest_spool_rows_total",
+    "Lecturas guardadas en el spool local (spooled), reaplicadas en la base (replayed) o apartadas por la base (rejected)",
+    ["action"],
+)
+INGEST_SPOOL_BYTES = Gauge(
+    "smartfloors_ingest_spool_bytes",
+    "Bytes pendientes de reaplicar en el spool local de ingesta",
+)
+INGEST_SPOOL_CORRUPT = Counter(
+    "smartfloors_ingest_spool_corrupt_segments_total",
+    "Segmentos del spool apartados por un registro truncado o con crc inválido",
+)
+GEMINI_REQUEST_DURATION = Histogram(
+    "smartfloors_gemini_request_duration_seconds",
+    "Latencia de las llamadas a Gemini",
+    ["outcome"],
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0),
+)
+RECOMMENDATION_DURATION = Histogram(
+    "smartfloors_recommendation_duration_seconds",
+    "Latencia de la recomendación al crear una alerta, por proveedor",
+    ["provider", "outcome"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0),
+)
+RECOMMENDATION_FALLBACKS = Counter(
+    "smartfloors_recommendation_fallback_total",
+    "Recomendaciones servidas por las reglas predefinidas en vez del proveedor configurado",
+)
+
+
+# Cada sentencia SQL alimenta el histograma de duración
+statement_observers.append(lambda statement, elapsed: DB_QUERY_DURATION.observe(elapsed))
+
+
+# ============================================================
+# Middleware ASGI
+# ============================================================
+
+class PrometheusMiddleware:
+    """
+    Mide latencia por ruta (plantilla, no URL concreta) y el número y tiempo de
+    consultas SQL de cada petición HTTP.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        with track_queries() as stats:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                route_path = getattr(route, "path", "unmatched")
+                HTTP_REQUEST_DURATION.labels(scope["method"], route_path, str(status_code)).observe(
+                    time.perf_counter() - start
+                )
+                DB_QUERIES_PER_REQUEST.labels(route_path).observe(stats.count)
+                DB_TIME_PER_REQUEST.labels(route_path).observe(stats.db_time)
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    """Exposición en formato de texto de Prometheus"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,45 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class InflightTracker:
+    """
+    Cuenta operaciones en curso (p. ej. ingestas) para que el apagado espere a que
+    terminen antes de cerrar el pool de conexiones.
+    """
+
+    def __init__(self):
+        self._count = 0
+        self._cond = threading.Condition()
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @contextmanager
+    def track(self) -> Iterator[None]:
+        with self._cond:
+            self._count += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._count -= 1
+                if self._count == 0:
+                    self._cond.notify_all()
+
+    def wait_idle(self, timeout: float) -> bool:
+        """Bloquea hasta que no quede nada en curso. Retorna False si venció el timeout."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+
+ingest_inflight = InflightTracker()
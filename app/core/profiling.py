@@ -0,0 +1,351 @@
+"""
+Perfilado a pedido de una sola petición (muestreo de pilas).
+
+Solo se instala si `ENV` está en `PROFILING_ENVS`: en los demás entornos el middleware no
+existe y no hay costo alguno. Instalado, una petición se perfila si trae el header
+`X-Profile` (o el query param `__profile`) con el valor de `PROFILING_TOKEN`. Sin token
+alcanza con `1`/`true`, pero solo con `ENV=dev`: en cualquier otro entorno sin token el
+middleware no se instala.
+
+Mientras dura la petición, un hilo toma cada `PROFILING_INTERVAL_MS` las pilas de todos
+los hilos (`sys._current_frames`) y se queda con las que pasan por el endpoint de esa
+petición: el event loop para endpoints `async` y el hilo del threadpool para los
+síncronos. Si hay otra petición concurrente al mismo endpoint, la primera sentencia SQL
+de la petición perfilada fija cuál es su frame y desde ahí se descartan las ajenas. Lo
+que un endpoint `async` delega al threadpool se muestrea desde su primera sentencia SQL.
+
+Resultado (`PROFILING_DIR/<id>.folded` y `<id>.json`, header `X-Profile-Id`):
+- pilas colapsadas (formato de flamegraph.pl / speedscope),
+- árbol de llamadas con muestras por nodo,
+- sentencias SQL con su duración y llamadas al proveedor de recomendaciones.
+
+Con `X-Profile-Output: inline` (o `__profile_output=inline`) la respuesta es el JSON del
+perfil en vez del body del endpoint.
+"""
+import asyncio
+import hmac
+import inspect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+from app.core.config import settings
+from app.core.query_stats import statement_observers, statement_shape
+from app.services.recommendations import recommendation_observers
+
+logger = logging.getLogger(__name__)
+
+_TRUE = ("1", "true", "yes")
+_current: ContextVar[Optional["ProfileSession"]] = ContextVar("profile_session", default=None)
+
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_APP_DIR = os.path.join(_PROJECT_ROOT, "app") + os.sep
+_LIB_MARKERS = ("site-packages" + os.sep, "lib" + os.sep + f"python{sys.version_info[0]}.{sys.version_info[1]}" + os.sep)
+
+
+def _short_path(path: str) -> str:
+    if path.startswith(_PROJECT_ROOT + os.sep):
+        return path[len(_PROJECT_ROOT) + 1:]
+    for marker in _LIB_MARKERS:
+        i = path.find(marker)
+        if i >= 0:
+            return path[i + len(marker):]
+    return path
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_qualname} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+class ProfileSession:
+    """Muestras, sentencias SQL y recomendaciones de una petición perfilada."""
+
+    def __init__(self, scope, interval: float, max_seconds: float):
+        self.id = uuid.uuid4().hex[:12]
+        self.scope = scope
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.sql: List[Tuple[float, str, float]] = []            # (inicio relativo, sentencia, duración)
+        self.recommendations: List[Tuple[str, str, float]] = []  # (proveedor, resultado, duración)
+        self.root_frame = None   # frame del endpoint de esta petición (ver `claim`)
+        self.entry_frames: Dict[int, object] = {}  # entradas al threadpool de esta petición
+        self._root_code = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.started = 0.0
+        self.elapsed = 0.0
+
+    # ---------------------------------------------------------- muestreo
+
+    def _endpoint_code(self):
+        if self._root_code is None:
+            endpoint = self.scope.get("endpoint")
+            if endpoint is not None:
+                self._root_code = getattr(inspect.unwrap(endpoint), "__code__", None)
+        return self._root_code
+
+    def _stack_from_root(self, frame, root_code) -> Optional[Tuple[str, ...]]:
+        """
+        Pila desde el frame del endpoint (o desde un frame de entrada al threadpool de esta
+        petición) hasta la hoja, o None si el hilo no está trabajando para la petición.
+        """
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            if frame.f_code is root_code:
+                if self.root_frame is not None and frame is not self.root_frame:
+                    return None
+                return tuple(_frame_label(code) for code in reversed(codes))
+            if id(frame) in self.entry_frames and self.entry_frames[id(frame)] is frame:
+                # Trabajo enviado al threadpool desde un endpoint async
+                return (_frame_label(root_code), "[threadpool]") + tuple(_frame_label(c) for c in reversed(codes))
+            frame = frame.f_back
+        return None
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        deadline = time.perf_counter() + self.max_seconds
+        while not self._stop.wait(self.interval) and time.perf_counter() < deadline:
+            root_code = self._endpoint_code()
+            if root_code is None:
+                continue
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = self._stack_from_root(frame, root_code)
+                if stack is not None:
+                    self.stacks[stack] += 1
+                    self.samples += 1
+
+    def claim(self) -> None:
+        """
+        Llamado desde código que corre dentro de la petición (hook SQL). Si la pila pasa por
+        el endpoint, fija su frame para no mezclar muestras de otra petición al mismo
+        endpoint. Si no (endpoint async que delegó al threadpool), registra el frame más
+        externo de la app en este hilo como entrada de la petición.
+        """
+        root_code = self._endpoint_code()
+        outermost = None
+        frame = sys._getframe(1)
+        while frame is not None:
+            if frame.f_code is root_code:
+                if self.root_frame is None:
+                    self.root_frame = frame
+                return
+            if frame.f_code.co_filename.startswith(_APP_DIR):
+                outermost = frame
+            frame = frame.f_back
+        if outermost is not None:
+            self.entry_frames[id(outermost)] = outermost
+
+    def start(self) -> None:
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name=f"profile-{self.id}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.elapsed = time.perf_counter() - self.started
+        self._stop.set()
+        self._thread.join()
+        self.root_frame = None
+        self.entry_frames.clear()
+
+    # ---------------------------------------------------------- resultado
+
+    def folded(self) -> str:
+        return "".join(f"{';'.join(stack)} {n}\n" for stack, n in self.stacks.most_common())
+
+    def call_tree(self) -> dict:
+        root = {"name": "root", "samples": self.samples, "children": {}}
+        for stack, n in self.stacks.items():
+            node = root
+            for label in stack:
+                node = node["children"].setdefault(label, {"name": label, "samples": 0, "children": {}})
+                node["samples"] += n
+
+        def freeze(node: dict) -> dict:
+            children = sorted(node["children"].values(), key=lambda c: -c["samples"])
+            return {"name": node["name"], "samples": node["samples"], "children": [freeze(c) for c in children]}
+
+        return freeze(root)
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "samples": self.samples,
+            "wall_ms": round(self.elapsed * 1000, 1),
+            "sql_count": len(self.sql),
+            "sql_ms": round(sum(d for _, _, d in self.sql) * 1000, 1),
+            "recommendation_ms": round(sum(d for _, _, d in self.recommendations) * 1000, 1),
+        }
+
+    def to_dict(self, status: Optional[int]) -> dict:
+        by_shape: Dict[str, List[float]] = {}
+        for _, statement, elapsed in self.sql:
+            by_shape.setdefault(statement_shape(statement), []).append(elapsed)
+        return {
+            "id": self.id,
+            "method": self.scope["method"],
+            "path": self.scope["path"],
+            "query": self.scope.get("query_string", b"").decode("latin-1"),
+            "status": status,
+            "interval_ms": self.interval * 1000,
+            **self.summary(),
+            "sql": [
+                {"start_ms": round(start * 1000, 2), "ms": round(elapsed * 1000, 2), "statement": statement[:2000]}
+                for start, statement, elapsed in self.sql
+            ],
+            "sql_by_shape": sorted(
+                (
+                    {"shape": shape[:500], "count": len(d), "ms": round(sum(d) * 1000, 2)}
+                    for shape, d in by_shape.items()
+                ),
+                key=lambda x: -x["ms"],
+            ),
+            "recommendations": [
+                {"provider": provider, "outcome": outcome, "ms": round(elapsed * 1000, 2)}
+                for provider, outcome, elapsed in self.recommendations
+            ],
+            "call_tree": self.call_tree(),
+        }
+
+
+# ============================================================
+# Observadores (SQL y recomendaciones)
+# ============================================================
+
+def _observe_statement(statement: str, elapsed: float) -> None:
+    session = _current.get()
+    if session is not None:
+        session.claim()
+        session.sql.append((time.perf_counter() - elapsed - session.started, statement, elapsed))
+
+
+def _observe_recommendation(provider: str, outcome: str, elapsed: float) -> None:
+    session = _current.get()
+    if session is not None:
+        session.recommendations.append((provider, outcome, elapsed))
+
+
+def _store(session: ProfileSession, profile: dict) -> None:
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    base = os.path.join(settings.PROFILING_DIR, session.id)
+    with open(base + ".folded", "w", encoding="utf-8") as f:
+        f.write(session.folded())
+    with open(base + ".json", "w", encoding="utf-8") as f:
+        json.dump(profile, f, ensure_ascii=False)
+
+    # Solo se conservan los últimos PROFILING_KEEP perfiles
+    entries = sorted(
+        (e for e in os.scandir(settings.PROFILING_DIR) if e.name.endswith(".json")),
+        key=lambda e: e.stat().st_mtime,
+    )
+    for entry in entries[:-settings.PROFILING_KEEP]:
+        for ext in (".json", ".folded"):
+            try:
+                os.remove(entry.path[: -len(".json")] + ext)
+            except FileNotFoundError:
+                pass
+
+
+# ============================================================
+# Middleware ASGI
+# ============================================================
+
+def profiling_allowed() -> bool:
+    if settings.ENV not in settings.PROFILING_ENVS:
+        return False
+    if not settings.PROFILING_TOKEN and settings.ENV != "dev":
+        # Sin token cualquiera podría perfilar (archivos en disco, SQL y rutas del código)
+        logger.warning(f"⚠️ Perfilado desactivado en ENV={settings.ENV}: falta PROFILING_TOKEN")
+        return False
+    return True
+
+
+class ProfilingMiddleware:
+    """Perfila las peticiones marcadas (ver docstring del módulo). Solo se instala si `profiling_allowed()`."""
+
+    def __init__(self, app):
+        self.app = app
+        self.token = settings.PROFILING_TOKEN
+        self.interval = settings.PROFILING_INTERVAL_MS / 1000
+        self.max_seconds = settings.PROFILING_MAX_SECONDS
+        if _observe_statement not in statement_observers:
+            statement_observers.append(_observe_statement)
+            recommendation_observers.append(_observe_recommendation)
+
+    def _requested(self, scope) -> Tuple[bool, bool]:
+        """(perfilar, devolver el perfil en lugar de la respuesta)"""
+        headers = Headers(scope=scope)
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        value = headers.get("x-profile") or (query.get("__profile") or [""])[0]
+        if not value:
+            return False, False
+        if self.token:
+            enabled = hmac.compare_digest(value, self.token)
+        else:
+            # Sin token solo en desarrollo (ver `profiling_allowed`)
+            enabled = settings.ENV == "dev" and value.lower() in _TRUE
+        output = headers.get("x-profile-output") or (query.get("__profile_output") or [""])[0]
+        return enabled, output.lower() == "inline"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        enabled, inline = self._requested(scope)
+        if not enabled:
+            await self.app(scope, receive, send)
+            return
+
+        session = ProfileSession(scope, self.interval, self.max_seconds)
+        status = None
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if inline:
+                    return
+                # El resumen va en los headers: se calcula con lo medido hasta aquí
+                summary = "; ".join(f"{k}={v}" for k, v in session.summary().items() if k != "wall_ms")
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", session.id.encode()),
+                    (b"x-profile-summary", summary.encode()),
+                ]
+            elif message["type"] == "http.response.body" and inline:
+                return
+            await send(message)
+
+        token = _current.set(session)
+        session.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            session.stop()
+            profile = session.to_dict(status)
+            try:
+                await asyncio.to_thread(_store, session, profile)
+            except OSError as e:
+                logger.warning(f"⚠️ No se pudo guardar el perfil {session.id}: {e}")
+            logger.info(
+                f"🔬 Perfil {session.id} de {scope['method']} {scope['path']}: "
+                f"{session.samples} muestras, {profile['wall_ms']} ms, SQL {profile['sql_ms']} ms"
+            )
+
+        if inline:
+            await JSONResponse(profile, headers={"X-Profile-Id": session.id})(scope, receive, send)
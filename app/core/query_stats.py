@@ -0,0 +1,165 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_NUMBER_RE = re.compile(r"\b\d+(\.\d+)?\b")
+_SPACE_RE = re.compile(r"\s+")
+_IN_LIST_RE = re.compile(r"\(\s*(%\([^)]+\)s|\?|\$\d+)(\s*,\s*(%\([^)]+\)s|\?|\$\d+))*\s*\)")
+
+
+def statement_shape(statement: str) -> str:
+    """
+    Forma normalizada de una sentencia: sin literales numéricos, listas IN colapsadas
+    y espacios compactados. Dos consultas con la misma forma y distintos parámetros
+    son la firma típica de un N+1.
+    """
+    shape = _SPACE_RE.sub(" ", statement).strip()
+    shape = _IN_LIST_RE.sub("(?)", shape)
+    return _NUMBER_RE.sub("?", shape)
+
+
+class QueryStats:
+    """Sentencias SQL ejecutadas dentro de una petición (o de un bloque `track_queries`)."""
+
+    def __init__(self):
+        self.count = 0
+        self.db_time = 0.0
+        self.shapes: Counter = Counter()
+
+    def record(self, statement: str, elapsed: float) -> None:
+        self.count += 1
+        self.db_time += elapsed
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """Formas ejecutadas al menos `threshold` veces, de más a menos frecuente."""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+    def header_value(self, threshold: int) -> str:
+        repeated = self.repeated(threshold)
+        return f"count={self.count}; time_ms={self.db_time * 1000:.1f}; repeated={sum(n for _, n in repeated)}"
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+# Observadores por sentencia (p. ej. histogramas de Prometheus)
+statement_observers: List[Callable[[str, float], None]] = []
+
+
+def current_query_stats() -> Optional[QueryStats]:
+    return _current.get()
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """
+    Cuenta las sentencias ejecutadas dentro del bloque. Si ya hay un conteo activo
+    (p. ej. el de la petición) se reutiliza, así varias capas comparten el mismo objeto.
+    """
+    existing = _current.get()
+    if existing is not None:
+        yield existing
+        return
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def query_budget(max_queries: int, max_repeated: Optional[int] = None) -> Iterator[QueryStats]:
+    """
+    Falla (AssertionError) si el bloque ejecuta más de `max_queries` sentencias o si alguna
+    forma se repite más de `max_repeated` veces. Pensado para fijar presupuestos en pruebas:
+
+        with query_budget(5, max_repeated=1):
+            floor_cards(...)
+    """
+    with track_queries() as stats:
+        yield stats
+    if stats.count > max_queries:
+        raise AssertionError(f"Presupuesto de consultas excedido: {stats.count} > {max_queries}")
+    if max_repeated is not None:
+        offenders = [(s, n) for s, n in stats.shapes.items() if n > max_repeated]
+        if offenders:
+            shape, n = max(offenders, key=lambda x: x[1])
+            raise AssertionError(f"Consulta repetida {n} veces (máximo {max_repeated}): {shape[:200]}")
+
+
+def parse_header(value: str) -> dict:
+    """Convierte el header `X-DB-Queries` en dict (para aserciones sobre respuestas HTTP)."""
+    out = {}
+    for part in value.split(";"):
+        key, _, raw = part.strip().partition("=")
+        out[key] = float(raw) if "." in raw else int(raw)
+    return out
+
+
+def install_query_hooks(engine: Engine) -> None:
+    """Registra los eventos del engine que miden cada sentencia SQL."""
+
+    # El inicio va en el contexto de ejecución y no en `conn.info`: una sentencia que falla
+    # no dispara `after_cursor_execute` y dejaría el valor colgado en la conexión del pool
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_start
+        for observer in statement_observers:
+            observer(statement, elapsed)
+        stats = _current.get()
+        if stats is not None:
+            stats.record(statement, elapsed)
+
+
+# ============================================================
+# Middleware ASGI
+# ============================================================
+
+class QueryStatsMiddleware:
+    """
+    Cuenta las sentencias SQL de cada petición. Con `SQL_DEBUG_HEADERS` agrega el header
+    `X-DB-Queries` (cantidad, tiempo y repeticiones) y registra un warning cuando una misma
+    forma de consulta se repite `SQL_N_PLUS_ONE_THRESHOLD` veces o más.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.threshold = settings.SQL_N_PLUS_ONE_THRESHOLD
+        self.debug_headers = settings.SQL_DEBUG_HEADERS
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries() as stats:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start" and self.debug_headers:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-db-queries", stats.header_value(self.threshold).encode()))
+                    message["headers"] = headers
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+
+        repeated = stats.repeated(self.threshold)
+        if repeated:
+            route = getattr(scope.get("route"), "path", scope["path"])
+            shape, n = repeated[0]
+            logger.warning(f"⚠️ Posible N+1 en {scope['method']} {route}: {n}x {shape[:160]}")
@@ -0,0 +1,133 @@
+"""
+Reporte de tiempo de arranque: imports por módulo y fases del lifespan.
+
+`app/main.py` importa este módulo antes que cualquier otro, así el reloj arranca con el
+primer import de la aplicación. Con la variable de entorno `STARTUP_REPORT=1` se instala
+además un medidor de imports (equivalente a `python -X importtime`, pero dentro del
+reporte). Se lee del entorno y no de `settings` porque tiene que activarse antes de
+importar pydantic.
+
+Solo usa la biblioteca estándar: lo que importe aquí cuenta en el arranque.
+"""
+import importlib.machinery
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_ENABLED = os.getenv("STARTUP_REPORT", "").lower() in ("1", "true", "yes")
+
+
+class _ImportTimer:
+    """
+    Finder de `sys.meta_path` que no resuelve nada por sí mismo: le pide el spec a los
+    demás finders y envuelve `exec_module` del loader para medir tiempo propio y
+    acumulado de cada módulo.
+    """
+
+    def __init__(self):
+        self.records: Dict[str, Tuple[float, float]] = {}  # módulo -> (propio, acumulado)
+        self._stack: List[List] = []
+        self._resolving = False
+
+    def find_spec(self, name, path=None, target=None):
+        if self._resolving:
+            return None
+        self._resolving = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(name, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._resolving = False
+
+        # Solo loaders por instancia: los importadores built-in/frozen son clases compartidas
+        loader = spec.loader
+        if isinstance(loader, (importlib.machinery.SourceFileLoader, importlib.machinery.ExtensionFileLoader)):
+            loader.exec_module = self._timed(name, loader.exec_module)
+        return spec
+
+    def _timed(self, name, exec_module):
+        def wrapper(module):
+            frame = [name, time.perf_counter(), 0.0]
+            self._stack.append(frame)
+            try:
+                exec_module(module)
+            finally:
+                self._stack.pop()
+                total = time.perf_counter() - frame[1]
+                self.records[name] = (total - frame[2], total)
+                if self._stack:
+                    self._stack[-1][2] += total
+        return wrapper
+
+
+class StartupReport:
+    """Tiempos del arranque de este proceso (cada worker tiene el suyo)."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.ready_at: Optional[float] = None
+        self.phases: List[Tuple[str, float]] = []
+        self.import_timer: Optional[_ImportTimer] = None
+
+    def install_import_timer(self) -> None:
+        if self.import_timer is None:
+            self.import_timer = _ImportTimer()
+            sys.meta_path.insert(0, self.import_timer)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def mark_ready(self) -> None:
+        self.ready_at = time.perf_counter()
+        if self.import_timer is not None:
+            sys.meta_path.remove(self.import_timer)
+
+    def summary(self, top: int = 15) -> dict:
+        total = (self.ready_at or time.perf_counter()) - self.started
+        lifespan = sum(t for _, t in self.phases)
+        out = {
+            "total_s": round(total, 4),
+            "before_lifespan_s": round(total - lifespan, 4),
+            "phases": {name: round(t, 4) for name, t in self.phases},
+        }
+        if self.import_timer is not None:
+            records = self.import_timer.records
+            out["slowest_imports"] = [
+                {"module": name, "self_s": round(own, 4), "cumulative_s": round(cum, 4)}
+                for name, (own, cum) in sorted(records.items(), key=lambda r: r[1][0], reverse=True)[:top]
+            ]
+            out["app_imports"] = {
+                name: round(cum, 4) for name, (_, cum) in sorted(records.items()) if name.startswith("app.")
+            }
+        return out
+
+    def log(self) -> None:
+        s = self.summary()
+        phases = ", ".join(f"{name} {t * 1000:.0f}ms" for name, t in s["phases"].items())
+        logger.info(f"🚀 Arranque en {s['total_s'] * 1000:.0f}ms (carga de la app {s['before_lifespan_s'] * 1000:.0f}ms; {phases})")
+        for item in s.get("slowest_imports", []):
+            logger.info(
+                f"   import {item['module']:<55} propio {item['self_s'] * 1000:7.1f}ms"
+                f"  acumulado {item['cumulative_s'] * 1000:7.1f}ms"
+            )
+
+
+startup_report = StartupReport()
+if _ENABLED:
+    startup_report.install_import_timer()
@@ -4,3 +4,4 @@ from app.db.models.floor import Floor        # noqa
 from app.db.models.threshold import Threshold  # noqa
 from app.db.models.metric import Metric      # noqa
 from app.db.models.alert import Alert        # noqa
+from app.db.models.energy_daily import EnergyDaily  # noqa
@@ -0,0 +1,119 @@
+import logging
+import re
+from pathlib import Path
+from typing import Set
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import ProgrammingError
+
+from app.core.config import settings
+from app.db.session import Base, engine
+
+logger = logging.getLogger(__name__)
+
+VERSIONS_DIR = Path(__file__).resolve().parents[2] / "alembic" / "versions"
+
+_REVISION_RE = re.compile(r"^revision\b[^=]*=\s*['\"](\w+)['\"]", re.M)
+_DOWN_REVISION_RE = re.compile(r"^down_revision\b[^=]*=(.*)$", re.M)
+_QUOTED_RE = re.compile(r"['\"](\w+)['\"]")
+
+# Revisión equivalente al esquema que creaba `create_all` antes de exigir migraciones: una
+# base creada así no tiene `alembic_version` y se marca con `alembic stamp` antes de migrar
+CREATE_ALL_REVISION = "7627f8570073"
+
+
+def alembic_heads() -> Set[str]:
+    """
+    Revisiones head según los scripts de `alembic/versions`: las que ninguna otra
+    revisión tiene como `down_revision`. Los scripts se leen como texto para no importar
+    Alembic al arrancar (~0.5 s); el formato es el de la plantilla `script.py.mako`.
+    """
+    revisions: Set[str] = set()
+    parents: Set[str] = set()
+    for path in VERSIONS_DIR.glob("*.py"):
+        source = path.read_text(encoding="utf-8")
+        revision = _REVISION_RE.search(source)
+        if revision is None:
+            continue
+        revisions.add(revision.group(1))
+        down = _DOWN_REVISION_RE.search(source)
+        if down is not None:
+            parents.update(_QUOTED_RE.findall(down.group(1)))
+    return revisions - parents
+
+
+def current_revisions(bind: Engine = engine) -> Set[str]:
+    """Revisiones aplicadas en la base de datos (vacío si nunca se corrió Alembic)."""
+    with bind.connect() as conn:
+        try:
+            return {row[0] for row in conn.execute(text("SELECT version_num FROM alembic_version"))}
+        except ProgrammingError:
+            return set()
+
+
+def _has_tables(bind: Engine) -> bool:
+    with bind.connect() as conn:
+        return conn.execute(text("SELECT to_regclass('metrics') IS NOT NULL")).scalar()
+
+
+def _stamp(bind: Engine, heads: Set[str]) -> None:
+    """Lo mismo que `alembic stamp head` (misma tabla), sin importar Alembic"""
+    with bind.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS alembic_version ("
+            "version_num VARCHAR(32) NOT NULL, CONSTRAINT alembic_version_pkc PRIMARY KEY (version_num))"
+        ))
+        conn.execute(text("DELETE FROM alembic_version"))
+        for head in sorted(heads):
+            conn.execute(text("INSERT INTO alembic_version (version_num) VALUES (:v)"), {"v": head})
+
+
+def _upgrade_steps(current: Set[str]) -> str:
+    if current:
+        return "Ejecuta `alembic upgrade head`."
+    return (
+        f"Si la base se creó con `create_all` (sin `alembic_version`), márcala con "
+        f"`alembic stamp {CREATE_ALL_REVISION}` y luego ejecuta `alembic upgrade head`."
+    )
+
+
+def ensure_schema(bind: Engine = engine, name: str = "") -> None:
+    """
+    Verifica el esquema según `SCHEMA_CHECK`:
+    - `create_all` (default): en una base vacía crea las tablas y la marca en el head de
+      Alembic; en una base en el head crea las tablas que falten, como antes de las
+      migraciones. Una base existente que no está en el head no se toca (Alembic crearía
+      después las mismas tablas) y se avisa con los pasos para migrarla.
+    - `alembic`: una consulta a `alembic_version` comparada con el head de los scripts.
+      Falla si la base no está migrada en vez de arrancar con un esquema incompleto.
+    - `off`: no verifica nada (p. ej. cuando un job de despliegue ya migró).
+
+    Con varios shards se llama una vez por engine; `name` solo aparece en los mensajes.
+    """
+    where = f" [{name}]" if name else ""
+    mode = settings.SCHEMA_CHECK.lower()
+    if mode == "off":
+        return
+
+    heads = alembic_heads()
+    current = current_revisions(bind)
+    if mode == "create_all":
+        if current != heads and _has_tables(bind):
+            logger.warning(
+                f"⚠️ El esquema{where} no está en el head de Alembic (BD: {sorted(current) or 'sin migrar'}, "
+                f"head: {sorted(heads)}). {_upgrade_steps(current)}"
+            )
+            return
+        Base.metadata.create_all(bind=bind)
+        if current != heads:
+            _stamp(bind, heads)
+        logger.info(f"✅ Tablas verificadas / creadas correctamente{where}.")
+        return
+
+    if current != heads:
+        raise RuntimeError(
+            f"El esquema{where} no está en el head de Alembic (BD: {sorted(current) or 'sin migrar'}, "
+            f"head: {sorted(heads)}). {_upgrade_steps(current)}"
+        )
+    logger.info(f"✅ Esquema{where} en la revisión head ({', '.join(sorted(heads))}).")
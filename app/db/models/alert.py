@@ -1,4 +1,4 @@
-from sqlalchemy import Column, BigInteger, Integer, DateTime, String, Enum, ForeignKey, func, Index
+from sqlalchemy import Column, BigInteger, Boolean, Integer, DateTime, String, Enum, ForeignKey, func, Index, false
 from sqlalchemy.orm import relationship
 from app.db.session import Base
 from app.db.models.enums import Variable, AlertLevel, AlertStatus
@@ -6,7 +6,8 @@ from app.db.models.enums import Variable, AlertLevel, AlertStatus
 class Alert(Base):
     __tablename__ = "alerts"
     __table_args__ = (
-        Index("ix_alerts_floor_created", "floor_id", "created_at"),
+        # variable y level en la hoja: el heatmap se resuelve solo con el índice
+        Index("ix_alerts_floor_created", "floor_id", "created_at", postgresql_include=["variable", "level"]),
     )
 
     id = Column(BigInteger, primary_key=True)
@@ -20,4 +21,8 @@ class Alert(Base):
     message = Column(String(300), nullable=False)
     recommendation = Column(String(300))
 
+    # Alertas del pronóstico: el umbral todavía no se cruzó, se espera para `breach_eta`
+    is_predicted = Column(Boolean, nullable=False, default=False, server_default=false())
+    breach_eta = Column(DateTime(timezone=True))
+
     floor = relationship("Floor", back_populates="alerts")
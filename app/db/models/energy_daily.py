@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, String, Date, DateTime, Numeric, ForeignKey, func
+from app.db.session import Base
+
+class EnergyDaily(Base):
+    """kWh integrados de un piso en un día ya cerrado (ver app/services/energy.py)"""
+    __tablename__ = "energy_daily"
+
+    floor_id = Column(Integer, ForeignKey("floors.id", ondelete="CASCADE"), primary_key=True)
+    # Zona horaria en la que se cortó el día: el mismo piso puede tener totales por varias
+    tz = Column(String(64), primary_key=True)
+    day = Column(Date, primary_key=True)
+
+    kwh = Column(Numeric(12, 3), nullable=False)
+    readings = Column(Integer, nullable=False)
+    computed_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
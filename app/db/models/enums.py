@@ -14,3 +14,7 @@ class AlertStatus(str, Enum):
     open = "open"
     acknowledged = "acknowledged"
     closed = "closed"
+
+class ConflictMode(str, Enum):
+    ignore = "ignore"   # ON CONFLICT DO NOTHING: los reintentos no escriben
+    update = "update"   # ON CONFLICT DO UPDATE: la lectura reenviada reemplaza los valores
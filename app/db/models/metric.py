@@ -1,11 +1,12 @@
-from sqlalchemy import Column, BigInteger, Integer, DateTime, Numeric, ForeignKey, Index
+from sqlalchemy import Column, BigInteger, Integer, DateTime, Numeric, ForeignKey, UniqueConstraint
 from sqlalchemy.orm import relationship
 from app.db.session import Base
 
 class Metric(Base):
     __tablename__ = "metrics"
     __table_args__ = (
-        Index("ix_metrics_floor_time", "floor_id", "time"),
+        # Una lectura por piso e instante: los reintentos de ingesta no duplican filas
+        UniqueConstraint("floor_id", "time", name="uq_metrics_floor_time"),
     )
 
     id = Column(BigInteger, primary_key=True)
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional
 from app.db.models.enums import Variable, AlertLevel, AlertStatus
 from datetime import datetime
 
@@ -14,5 +14,17 @@ class AlertCreate(BaseModel):
 class AlertOut(AlertCreate):
     id: int
     created_at: datetime
+    is_predicted: bool = False
+    breach_eta: Optional[datetime] = None
     class Config:
         from_attributes = True
+
+class ReevaluationIn(BaseModel):
+    desde: datetime
+    hasta: Optional[datetime] = None          # por defecto, ahora
+    edificios: Optional[List[str]] = None     # todos si se omite
+    pisos: Optional[List[int]] = None
+    variables: Optional[List[Variable]] = None
+    dry_run: bool = False
+    workers: Optional[int] = Field(None, ge=1, le=32)
+    chunk_hours: Optional[int] = Field(None, ge=1, le=744)
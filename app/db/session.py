@@ -1,3 +1,4 @@
+import os
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.core.config import settings
@@ -18,10 +19,21 @@ SessionLocal = sessionmaker(
 Base = declarative_base()
 
 
-def check_connection() -> None:
+def _discard_inherited_connections() -> None:
+    """
+    Tras un fork, el hijo hereda los sockets del pool del padre. `close=False` los
+    descarta sin cerrarlos (siguen siendo del padre) y el hijo abre los suyos.
+    """
+    engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_discard_inherited_connections)
+
+
+def check_connection(bind=engine) -> None:
     """
     Intento simple de conexión para validar credenciales/red.
     Lanza excepción si falla.
     """
-    with engine.connect() as conn:
+    with bind.connect() as conn:
         conn.execute(text("SELECT 1"))
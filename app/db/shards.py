@@ -0,0 +1,201 @@
+"""
+Sharding por edificio.
+
+`SHARD_URLS` define bases adicionales (nombre → URL) y `SHARD_BUILDINGS` asigna códigos
+de edificio a esas bases. Los edificios sin asignar van al shard `default`, que es la base
+de `DATABASE_URL` (el engine de `app/db/session.py`). Sin configuración hay un solo shard
+y todo funciona como antes.
+
+Cada shard tiene el esquema completo y sus propios edificios, pisos, métricas, alertas y
+umbrales. Para que los ids sigan siendo únicos entre shards, el shard en la posición `k`
+(0 = default) numera desde `k * SHARD_ID_SPAN` (`python -m app.db.shards init`). Así un
+endpoint que recibe solo un id (piso, alerta) sabe a qué shard ir.
+"""
+import argparse
+import contextvars
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, TypeVar
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.core.config import settings
+from app.db import session as default_session
+
+T = TypeVar("T")
+
+DEFAULT = "default"
+# Tablas cuyos ids llegan a los endpoints (metrics no: sus ids nunca se exponen)
+_SERIAL_TABLES = ("buildings", "floors", "alerts", "thresholds")
+
+
+class Shard:
+    def __init__(self, name: str, index: int, engine: Engine, session_factory: sessionmaker):
+        self.name = name
+        self.index = index
+        self.engine = engine
+        self.SessionLocal = session_factory
+
+    def session(self) -> Session:
+        return self.SessionLocal()
+
+    def __repr__(self) -> str:
+        return f"Shard({self.name!r})"
+
+
+def _engine_for(url: str) -> Engine:
+    # Mismas opciones que el engine por defecto
+    return create_engine(url, pool_pre_ping=True, future=True)
+
+
+class ShardRouter:
+    """Resuelve el shard de un edificio o de un id, y reparte consultas entre todos."""
+
+    def __init__(self, urls: Dict[str, str], buildings: Dict[str, str], id_span: int):
+        self.shards: List[Shard] = [
+            Shard(DEFAULT, 0, default_session.engine, default_session.SessionLocal)
+        ]
+        for name, url in urls.items():
+            if name == DEFAULT:
+                raise ValueError(f"'{DEFAULT}' es el nombre reservado del shard de DATABASE_URL")
+            engine = _engine_for(url)
+            factory = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+            self.shards.append(Shard(name, len(self.shards), engine, factory))
+        self._by_name = {s.name: s for s in self.shards}
+        unknown = set(buildings.values()) - self._by_name.keys()
+        if unknown:
+            raise ValueError(f"SHARD_BUILDINGS usa shards no definidos en SHARD_URLS: {', '.join(sorted(unknown))}")
+        self._by_building = {code: self._by_name[name] for code, name in buildings.items()}
+        self.id_span = id_span
+        # Un worker creado por fork abre sus propias conexiones (igual que el engine por defecto)
+        os.register_at_fork(after_in_child=self._discard_inherited_connections)
+
+    def _discard_inherited_connections(self) -> None:
+        for shard in self.shards[1:]:
+            shard.engine.dispose(close=False)
+
+    @property
+    def default(self) -> Shard:
+        return self.shards[0]
+
+    @property
+    def sharded(self) -> bool:
+        return len(self.shards) > 1
+
+    def for_building(self, edificio: str) -> Shard:
+        return self._by_building.get(edificio, self.default)
+
+    def for_id(self, record_id: int) -> Shard:
+        """Shard dueño de un id (edificio, piso, alerta, umbral) según su rango"""
+        index = record_id // self.id_span
+        return self.shards[index] if 0 < index < len(self.shards) else self.default
+
+    def partition(self, readings: List[dict]) -> Dict[Shard, List[dict]]:
+        """Agrupa lecturas `{edificio, ...}` por shard, conservando el orden"""
+        if not self.sharded:
+            return {self.default: readings}
+        out: Dict[Shard, List[dict]] = {}
+        for r in readings:
+            out.setdefault(self.for_building(r["edificio"]), []).append(r)
+        return out
+
+    def group_codes(self, codes: Iterable[str]) -> Dict[Shard, List[str]]:
+        out: Dict[Shard, List[str]] = {}
+        for code in codes:
+            out.setdefault(self.for_building(code), []).append(code)
+        return out
+
+    def fan_out(self, fn: Callable[[Session], T], shards: Optional[Iterable[Shard]] = None) -> List[T]:
+        """
+        Ejecuta `fn(db)` en cada shard (todos por defecto), en paralelo y con una sesión
+        propia por shard. Retorna los resultados en el orden de los shards.
+        """
+        return self.fan_out_each({shard: fn for shard in (self.shards if shards is None else shards)})
+
+    def fan_out_each(self, tasks: Dict[Shard, Callable[[Session], T]]) -> List[T]:
+        """Igual que `fan_out` pero con una función distinta por shard"""
+        def run(item) -> T:
+            shard, fn = item
+            with shard.session() as db:
+                return fn(db)
+
+        if len(tasks) <= 1:
+            return [run(item) for item in tasks.items()]
+        # Cada hilo con una copia del contexto: las consultas siguen contando en la petición
+        with ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="shard") as pool:
+            futures = [pool.submit(contextvars.copy_context().run, run, item) for item in tasks.items()]
+            return [f.result() for f in futures]
+
+    def dispose(self) -> None:
+        for shard in self.shards:
+            shard.engine.dispose()
+
+
+class ShardSessions:
+    """Sesiones por shard abiertas a pedido durante una petición (ingesta multi-edificio)."""
+
+    def __init__(self, router: ShardRouter):
+        self.router = router
+        self._sessions: Dict[str, Session] = {}
+
+    def get(self, shard: Shard) -> Session:
+        if shard.name not in self._sessions:
+            self._sessions[shard.name] = shard.session()
+        return self._sessions[shard.name]
+
+    def for_building(self, edificio: str) -> Session:
+        return self.get(self.router.for_building(edificio))
+
+    def close(self) -> None:
+        for db in self._sessions.values():
+            db.close()
+        self._sessions.clear()
+
+
+shard_router = ShardRouter(settings.SHARD_URLS, settings.SHARD_BUILDINGS, settings.SHARD_ID_SPAN)
+
+
+# ============================================================
+# CLI: python -m app.db.shards status | init
+# ============================================================
+
+def _init_id_range(db: Session, shard: Shard) -> Dict[str, int]:
+    """Mueve cada secuencia de id al inicio del rango del shard (si todavía está por debajo)"""
+    start = shard.index * shard_router.id_span
+    out = {}
+    for table in _SERIAL_TABLES:
+        current = db.execute(text(f"SELECT COALESCE(MAX(id), 0) FROM {table}")).scalar()
+        if current >= start + shard_router.id_span:
+            raise RuntimeError(f"{shard.name}.{table}: id {current} fuera del rango del shard")
+        if shard.index and current < start:
+            db.execute(
+                text("SELECT setval(pg_get_serial_sequence(:t, 'id'), :v, false)"),
+                {"t": table, "v": start + 1},
+            )
+        out[table] = max(current, start)
+    db.commit()
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Shards por edificio")
+    parser.add_argument("command", choices=("status", "init"),
+                        help="status: edificios por shard; init: fija los rangos de ids")
+    args = parser.parse_args(argv)
+
+    for shard in shard_router.shards:
+        with shard.session() as db:
+            if args.command == "init":
+                info = _init_id_range(db, shard)
+            else:
+                codes = [c for (c,) in db.execute(text("SELECT code FROM buildings ORDER BY code"))]
+                misplaced = [c for c in codes if shard_router.for_building(c) is not shard]
+                info = {"buildings": codes, "misplaced": misplaced}
+        print(json.dumps({"shard": shard.name, **info}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
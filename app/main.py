@@ -1,14 +1,31 @@
-import os
+# Primero: el reloj del reporte de arranque empieza con este import
+from app.core.startup import startup_report
+
+import asyncio
 import logging
+import threading
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
 from sqlalchemy.exc import SQLAlchemyError
 
-from app.db.session import check_connection, engine, Base
+from app.core.config import settings
+from app.db.session import check_connection
+from app.db.shards import shard_router
+from app.db.migrations import ensure_schema
 from app.api.v1.router import api_router
-
-from app.db.models import building, floor, metric, threshold, alert 
+from app.api.v1.endpoints.metrics import _DB_UNAVAILABLE, replay_spooled
+from app.core.admission import AdmissionMiddleware
+from app.core.compression import CompressionMiddleware
+from app.core.instrumentation import PrometheusMiddleware, metrics_endpoint
+from app.core.profiling import ProfilingMiddleware, profiling_allowed
+from app.core.lifecycle import ingest_inflight
+from app.core.query_stats import QueryStatsMiddleware, install_query_hooks
+from app.services.change_bus import start_change_bus
+from app.services.detector_state import detector_state
+from app.services.ingest_spool import ingest_spool
+from app.services.recommendations import recommendation_provider
+
+from app.db.models import building, floor, metric, threshold, alert, energy_daily
 
 from contextlib import asynccontextmanager
 
@@ -19,20 +36,91 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+def _run_forecast() -> None:
+    # numpy se importa con la primera corrida, no en el arranque
+    from app.services.forecast import run_scheduled
+    run_scheduled()
+
+
+async def _forecast_loop() -> None:
+    """Alertas predictivas cada FORECAST_INTERVAL_SECONDS (un advisory lock evita corridas simultáneas entre workers)"""
+    while True:
+        await asyncio.sleep(settings.FORECAST_INTERVAL_SECONDS)
+        await asyncio.to_thread(_run_forecast)
+
+
+def _replay_spool(stop: threading.Event) -> int:
+    # Cuenta como ingesta en curso: el apagado espera a que termine el lote que se escribe
+    with ingest_inflight.track():
+        return ingest_spool.replay(replay_spooled, stop, retry_on=_DB_UNAVAILABLE)
+
+
+async def _spool_loop(stop: threading.Event) -> None:
+    """Reaplica el spool de ingesta cuando la base vuelve a responder"""
+    while True:
+        await asyncio.sleep(settings.INGEST_SPOOL_REPLAY_INTERVAL_SECONDS)
+        if not ingest_spool.pending:
+            continue
+        try:
+            replayed = await asyncio.to_thread(_replay_spool, stop)
+        except _DB_UNAVAILABLE as e:
+            logger.warning(f"⏸️ Spool de ingesta: la base sigue sin responder ({e.__class__.__name__}), se reintenta")
+            continue
+        except Exception as e:
+            # Disco u otro error local: el lazo sigue y se reintenta en el próximo intervalo
+            logger.error(f"❌ Spool de ingesta: error al reaplicar: {e}")
+            continue
+        if replayed:
+            logger.info(f"📼 Spool de ingesta: {replayed} lecturas reaplicadas")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
-    Lifecycle moderno de FastAPI (reemplaza startup/shutdown)
+    Lifecycle moderno de FastAPI (reemplaza startup/shutdown).
+    Corre en cada worker, así que aquí se inicializa todo lo que no debe compartirse
+    entre procesos.
     """
     try:
-        # 1️ Verificar conexión a la base de datos
-        check_connection()
-        logger.info("✅ Conexión a PostgreSQL establecida correctamente.")
-
-        # 2️ Crear tablas si no existen
-        logger.info("Verificando existencia de tablas...")
-        Base.metadata.create_all(bind=engine)
-        logger.info("✅ Tablas verificadas / creadas correctamente.")
+        # 1️ Verificar conexión a la base de datos (cada shard)
+        with startup_report.phase("conexión"):
+            for shard in shard_router.shards:
+                check_connection(shard.engine)
+        logger.info(f"✅ Conexión a PostgreSQL establecida correctamente ({len(shard_router.shards)} shard(s)).")
+
+        # 2️ Verificar esquema (create_all por defecto, head de Alembic opcional; ver SCHEMA_CHECK)
+        with startup_report.phase("esquema"):
+            for shard in shard_router.shards:
+                ensure_schema(shard.engine, shard.name if shard_router.sharded else "")
+
+        # 3️ Estado de detección por piso desde las lecturas recientes (una consulta por shard)
+        with startup_report.phase("detector"):
+            loaded = 0
+            for shard in shard_router.shards:
+                with shard.session() as db:
+                    loaded += detector_state.rebuild(db, reset=shard is shard_router.default)
+        logger.info(f"✅ Estado de detección reconstruido con {loaded} lecturas.")
+
+        # 4️ Bus entre workers (propio de este proceso)
+        with startup_report.phase("bus"):
+            bus = start_change_bus()
+
+        # El proveedor de recomendaciones (con Gemini: import pesado + posibles llamadas de
+        # prueba) se prepara en segundo plano: el worker empieza a atender sin esperarlo
+        threading.Thread(
+            target=recommendation_provider.ensure_configured, name="recommendation-warmup", daemon=True
+        ).start()
+
+        # 5️ Pronóstico periódico de cruces de umbral
+        forecast_task = asyncio.create_task(_forecast_loop()) if settings.FORECAST_ENABLED else None
+
+        # 6️ Spool local de ingesta (lo pendiente de una corrida anterior se reaplica primero)
+        spool_stop = threading.Event()
+        spool_task = None
+        if settings.INGEST_SPOOL_ENABLED:
+            ingest_spool.open()
+            spool_task = asyncio.create_task(_spool_loop(spool_stop))
     except SQLAlchemyError as e:
         logger.error(f"❌ Error de SQLAlchemy: {e}")
         raise e
@@ -40,12 +128,33 @@ async def lifespan(app: FastAPI):
         logger.error(f"❌ Error general conectando a la base de datos: {e}")
         raise e
 
+    startup_report.mark_ready()
+    startup_report.log()
+
     # yield = mientras la app esté corriendo
     yield
 
-    # 3️Cierre limpio
+    if forecast_task is not None:
+        forecast_task.cancel()
+    if spool_task is not None:
+        spool_stop.set()
+        spool_task.cancel()
+
+    # 7️ Drenar ingestas en curso antes de cerrar el pool
+    pending = ingest_inflight.count
+    if pending:
+        logger.info(f"⏳ Esperando {pending} ingesta(s) en curso...")
+    drained = await asyncio.to_thread(ingest_inflight.wait_idle, settings.GRACEFUL_SHUTDOWN_SECONDS)
+    if not drained:
+        logger.warning(f"⚠️ {ingest_inflight.count} ingesta(s) no terminaron en {settings.GRACEFUL_SHUTDOWN_SECONDS}s")
+
+    # 8️ Cierre limpio
+    if bus is not None:
+        bus.stop()
+    if ingest_spool.enabled:
+        ingest_spool.close()
     try:
-        engine.dispose()
+        shard_router.dispose()
         logger.info("🧹 Conexión a PostgreSQL cerrada.")
     except Exception as e:
         logger.error(f"⚠️ Error al cerrar conexión: {e}")
@@ -57,6 +166,16 @@ async def lifespan(app: FastAPI):
 
 app = FastAPI(lifespan=lifespan)
 
+# Perfilado a pedido (header X-Profile), solo en los entornos de PROFILING_ENVS. Es el más
+# interno: la espera en la cola de admisión no cuenta en el perfil
+if profiling_allowed():
+    app.add_middleware(ProfilingMiddleware)
+
+# Cupos por clase de tráfico (ingesta / lecturas / cargas masivas). Va por dentro de CORS
+# para que los 429/503 lleven sus headers
+if settings.ADMISSION_ENABLED:
+    app.add_middleware(AdmissionMiddleware)
+
 # Configurar CORS - Permitir acceso desde cualquier origen
 app.add_middleware(
     CORSMiddleware,
@@ -64,10 +183,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Permite todos los métodos (GET, POST, PUT, DELETE, etc.)
     allow_headers=["*"],  # Permite todos los headers
+    expose_headers=["Retry-After"],
 )
 
+# gzip/zstd: bodies de ingesta comprimidos y respuestas grandes según Accept-Encoding
+app.add_middleware(CompressionMiddleware)
+
+# Instrumentación Prometheus (latencia por ruta + consultas SQL por petición)
+for shard in shard_router.shards:
+    install_query_hooks(shard.engine)
+app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(PrometheusMiddleware)
+
 app.include_router(api_router, prefix="/api/v1")
 
+# Fuera de /api/v1 para no chocar con el router de métricas de sensores
+app.add_route("/metrics", metrics_endpoint, include_in_schema=False)
+
 
 @app.get("/")
 async def root():
@@ -75,5 +207,5 @@ async def root():
 
 
 if __name__ == "__main__":
-    port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    from app.serve import main
+    main()
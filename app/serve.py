@@ -0,0 +1,70 @@
+"""
+Launcher de producción: `python -m app.serve`
+
+Corre `WEB_CONCURRENCY` procesos worker de uvicorn (0 = uno por núcleo). Cada worker
+importa la aplicación por su cuenta, así que engine, cachés y cliente de Gemini se crean
+dentro del worker y no se comparten sockets entre procesos. Lo que sí es costoso y
+común a todos (elegir el modelo de Gemini con llamadas de prueba) se resuelve una vez
+aquí y se pasa a los workers por entorno.
+
+Con más de un worker se activa `CHANGE_BUS_ENABLED` para que las invalidaciones (ETag,
+caché de respuestas) y los eventos en tiempo real lleguen a todos los workers.
+
+Al recibir SIGTERM/SIGINT uvicorn deja de aceptar conexiones y espera hasta
+`GRACEFUL_SHUTDOWN_SECONDS` a las peticiones en curso; luego cada worker drena las
+ingestas que sigan corriendo antes de cerrar su pool.
+"""
+import logging
+import os
+
+import uvicorn
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def worker_count() -> int:
+    if settings.WEB_CONCURRENCY > 0:
+        return settings.WEB_CONCURRENCY
+    return os.cpu_count() or 1
+
+
+def _resolve_gemini_model() -> None:
+    """Prueba los modelos de Gemini una sola vez y fija el resultado para los workers."""
+    if (
+        settings.RECOMMENDATION_PROVIDER.strip().lower() != "gemini"
+        or not settings.GEMINI_API_KEY.strip()
+        or settings.GEMINI_RESOLVED_MODEL
+    ):
+        return
+    from app.services.gemini_service import GeminiService
+
+    probe = GeminiService()
+    probe.configure()
+    if probe.is_available:
+        os.environ["GEMINI_RESOLVED_MODEL"] = probe.model_name
+    else:
+        # Ningún modelo respondió: los workers van directo a las recomendaciones predefinidas
+        os.environ["GEMINI_API_KEY"] = ""
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    workers = worker_count()
+    if workers > 1:
+        os.environ["CHANGE_BUS_ENABLED"] = "true"
+        _resolve_gemini_model()
+
+    logger.info(f"🚀 SmartFloors en {settings.HOST}:{settings.PORT} con {workers} worker(s)")
+    uvicorn.run(
+        "app.main:app",
+        host=settings.HOST,
+        port=settings.PORT,
+        workers=workers,
+        timeout_graceful_shutdown=settings.GRACEFUL_SHUTDOWN_SECONDS,
+    )
+
+
+if __name__ == "__main__":
+    main()
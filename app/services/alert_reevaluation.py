@@ -0,0 +1,579 @@
+"""
+Reevaluación histórica de alertas.
+
+La ingesta solo detecta anomalías en lecturas nuevas: `/upload-csv` e `/import` cargan
+historial sin alertas, y un cambio de umbral no se refleja en los datos pasados. Este job
+recorre un rango de tiempo y un conjunto de pisos y crea las alertas que faltan con la
+misma lógica que la ingesta:
+
+- Bandas de `_evaluate_temperature`, `_evaluate_humidity` y `_evaluate_energy` (energía
+  con el umbral activo del piso, o el por defecto). Los umbrales actuales se aplican a
+  todo el rango.
+- Misma deduplicación que `_should_create_alert`: no se crea una alerta si el piso ya tiene
+  otra de la misma variable en los 30 minutos anteriores. Las alertas existentes cuentan
+  sin importar su estado, así repetir el job no duplica nada.
+- La alerta queda con `created_at` = hora de la lectura y la recomendación de las reglas
+  predefinidas (sin llamar al proveedor configurado por cada alerta histórica).
+
+El trabajo se parte en chunks (grupo de pisos × ventana de `ALERT_REEVAL_CHUNK_HOURS`).
+Cada chunk lee sus lecturas con una sola consulta, evalúa las bandas con numpy e inserta
+sus alertas en bloque. Los grupos de pisos corren en paralelo en un pool de procesos; las
+ventanas de un mismo grupo van en orden y se pasan el estado de deduplicación, así el
+resultado es el mismo que con un solo proceso. Cada chunk confirma lo suyo: si el job se
+corta, volver a correrlo completa lo que faltó.
+
+Con `dry_run` no se escribe nada y el resultado sirve de diff: alertas que se crearían
+(con una muestra) y alertas existentes que ya no tienen una lectura anómala que las
+respalde (p. ej. después de ampliar un umbral).
+
+CLI:
+    python -m app.services.alert_reevaluation --desde 2024-01-01 --hasta 2024-02-01 --edificio A --dry-run
+"""
+import argparse
+import fcntl
+import json
+import logging
+import math
+import multiprocessing
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import Float, cast, func, insert, select
+
+from app.api.v1.endpoints.metrics import (
+    DEFAULT_THRESHOLDS,
+    _evaluate_energy,
+    _evaluate_humidity,
+    _evaluate_temperature,
+)
+from app.core.config import settings
+from app.core.instrumentation import ALERTS_CREATED
+from app.db.models.alert import Alert
+from app.db.models.building import Building
+from app.db.models.enums import AlertLevel, AlertStatus, Variable
+from app.db.models.floor import Floor
+from app.db.models.metric import Metric
+from app.db.models.threshold import Threshold
+from app.db.shards import shard_router
+from app.services.data_version import data_versions
+from app.services.recommendations import rules_recommendation
+
+logger = logging.getLogger(__name__)
+
+DEDUP_SECONDS = 30 * 60   # misma ventana que `_should_create_alert`
+INSERT_CHUNK = 1000
+# Posición de cada variable en las filas leídas (floor_id, epoch, temp, hum, energía)
+_COLUMN = {Variable.temperature: 2, Variable.humidity: 3, Variable.energy: 4}
+_LEVELS = {1: AlertLevel.medium, 2: AlertLevel.critical}
+
+
+class ReevaluationError(Exception):
+    """Parámetros inválidos (rango vacío, pisos inexistentes)."""
+
+
+# ============================================================
+# Evaluación vectorizada
+# ============================================================
+
+def _levels(variable: Variable, values, lo: float, hi: float):
+    """
+    Nivel por lectura: 0 (sin alerta), 1 (media) o 2 (crítica). Replica las condiciones de
+    `_evaluate_*` tal cual, incluidos sus huecos (p. ej. 27.95 °C cae en crítica). NaN = sin dato.
+    """
+    import numpy as np
+
+    v = values
+    if variable == Variable.temperature:
+        medium = (v >= 28.0) & (v <= 29.4)
+        ok = (v < 26.0) | ((v >= 26.0) & (v <= 27.9)) | medium
+        critical = ~ok & ~np.isnan(v)
+    elif variable == Variable.humidity:
+        medium = ((v >= 20.0) & (v < 22.0)) | ((v > 75.0) & (v <= 80.0))
+        critical = (v < 20.0) | (v > 80.0)
+    else:
+        outside = (v < lo) | (v > hi)
+        ratio = np.where(v < lo, lo - v, v - hi) / max(hi - lo, 1e-9)
+        critical = outside & (ratio >= 0.25)
+        medium = outside & ~critical
+    return np.where(critical, 2, np.where(medium, 1, 0))
+
+
+def _dedup(times, anchors, last: float) -> Tuple[List[int], float]:
+    """
+    Índices de `times` (lecturas anómalas, ordenadas) que crean alerta: la primera lectura
+    sin otra alerta (`anchors` existentes o las que se van creando) en los 30 minutos
+    anteriores. Retorna (índices, hora de la última alerta).
+    """
+    import numpy as np
+
+    selected = []
+    i, n = 0, len(times)
+    while i < n:
+        t = times[i]
+        j = np.searchsorted(anchors, t, side="right") - 1
+        recent = max(last, anchors[j] if j >= 0 else -math.inf)
+        if t - recent <= DEDUP_SECONDS:
+            # Todo lo que cae dentro de la ventana de esa alerta también se descarta
+            i = max(i + 1, int(np.searchsorted(times, recent + DEDUP_SECONDS, side="right")))
+            continue
+        selected.append(i)
+        last = t
+        i = int(np.searchsorted(times, t + DEDUP_SECONDS, side="right"))
+    return selected, last
+
+
+def _message(variable: Variable, value: float, band: Tuple[float, float]) -> Tuple[Optional[AlertLevel], str]:
+    if variable == Variable.temperature:
+        return _evaluate_temperature(value)
+    if variable == Variable.humidity:
+        return _evaluate_humidity(value)
+    return _evaluate_energy(value, band)
+
+
+# ============================================================
+# Chunk (corre en un proceso del pool)
+# ============================================================
+
+def _evaluate_chunk(task: dict) -> dict:
+    """
+    Evalúa un grupo de pisos en una ventana. `task["state"]` trae, por (piso, variable), la
+    hora de la última alerta y de la última lectura anómala de la ventana anterior.
+    """
+    import numpy as np
+
+    floors = {f["id"]: f for f in task["floors"]}
+    variables = [Variable(v) for v in task["variables"]]
+    start, end = task["start"], task["end"]
+    state: Dict[Tuple[int, str], Tuple[float, float]] = dict(task["state"])
+    result = {
+        "rows": 0, "anomalies": 0, "created": {}, "existing": 0, "stale": 0,
+        "stale_ids": [], "sample": [], "touched": [], "state": state,
+    }
+
+    with shard_router.for_id(next(iter(floors))).session() as db:
+        rows = db.execute(
+            select(
+                Metric.floor_id,
+                cast(func.extract("epoch", Metric.time), Float),
+                cast(Metric.temp_c, Float),
+                cast(Metric.humidity_pct, Float),
+                cast(Metric.energy_kw, Float),
+            )
+            .where(Metric.floor_id.in_(floors), Metric.time >= start, Metric.time < end)
+            .order_by(Metric.floor_id, Metric.time)
+        ).all()
+
+        # Alertas ya creadas desde 30 minutos antes de la ventana (deduplicación)
+        anchors: Dict[Tuple[int, str], list] = {}
+        window_start = start.timestamp()
+        existing = []
+        for alert_id, floor_id, variable, created in db.execute(
+            select(Alert.id, Alert.floor_id, Alert.variable, cast(func.extract("epoch", Alert.created_at), Float))
+            .where(
+                Alert.floor_id.in_(floors),
+                Alert.variable.in_(variables),
+                Alert.is_predicted == False,
+                Alert.created_at >= start - timedelta(seconds=DEDUP_SECONDS),
+                Alert.created_at < end,
+            )
+            .order_by(Alert.created_at)
+        ):
+            anchors.setdefault((floor_id, variable.value), []).append(created)
+            if created >= window_start:
+                existing.append((alert_id, floor_id, variable.value, created))
+        result["existing"] = len(existing)
+
+        data = np.array(rows, dtype=float) if rows else np.empty((0, 5))
+        result["rows"] = len(data)
+        ids, starts = np.unique(data[:, 0].astype(np.int64), return_index=True)
+        bounds = dict(zip(ids.tolist(), zip(starts.tolist(), starts[1:].tolist() + [len(data)])))
+
+        new_alerts = []
+        candidates: Dict[Tuple[int, str], object] = {}
+        for floor_id, floor in floors.items():
+            lo, hi = floor["band"]
+            a, b = bounds.get(floor_id, (0, 0))
+            series = data[a:b]
+            for variable in variables:
+                key = (floor_id, variable.value)
+                levels = _levels(variable, series[:, _COLUMN[variable]], lo, hi)
+                hits = np.flatnonzero(levels)
+                times = series[hits, 1]
+                candidates[key] = times
+                result["anomalies"] += len(hits)
+
+                last_alert, last_anomaly = state.get(key, (-math.inf, -math.inf))
+                selected, last_alert = _dedup(times, np.array(anchors.get(key, [])), last_alert)
+                state[key] = (last_alert, float(times[-1]) if len(times) else last_anomaly)
+                for i in selected:
+                    value = float(series[hits[i], _COLUMN[variable]])
+                    level, message = _message(variable, value, (lo, hi))
+                    if level not in (AlertLevel.medium, AlertLevel.critical):
+                        continue
+                    new_alerts.append({
+                        "floor_id": floor_id,
+                        "variable": variable,
+                        "level": level,
+                        "status": AlertStatus.open,
+                        "message": message,
+                        "recommendation": rules_recommendation(variable, level, floor["piso"], value),
+                        "created_at": datetime.fromtimestamp(float(times[i]), timezone.utc),
+                        "is_predicted": False,
+                    })
+
+        # Alertas existentes sin ninguna lectura anómala en los 30 minutos anteriores
+        for alert_id, floor_id, variable, created in existing:
+            times = candidates.get((floor_id, variable))
+            i = np.searchsorted(times, created, side="right") - 1 if times is not None else -1
+            previous = times[i] if i >= 0 else task["state"].get((floor_id, variable), (0, -math.inf))[1]
+            if created - previous > DEDUP_SECONDS:
+                result["stale"] += 1
+                if len(result["stale_ids"]) < task["sample"]:
+                    result["stale_ids"].append(alert_id)
+
+        if new_alerts and not task["dry_run"]:
+            for i in range(0, len(new_alerts), INSERT_CHUNK):
+                db.execute(insert(Alert), new_alerts[i:i + INSERT_CHUNK])
+            db.commit()
+
+    for a in new_alerts:
+        key = f"{a['variable'].value}:{a['level'].value}"
+        result["created"][key] = result["created"].get(key, 0) + 1
+    result["touched"] = sorted({a["floor_id"] for a in new_alerts})
+    result["sample"] = [
+        {
+            "floor_id": a["floor_id"],
+            "variable": a["variable"].value,
+            "level": a["level"].value,
+            "time": a["created_at"].isoformat(),
+            "message": a["message"],
+        }
+        for a in new_alerts[:task["sample"]]
+    ]
+    return result
+
+
+# ============================================================
+# Plan y ejecución
+# ============================================================
+
+def _utc(value: datetime) -> datetime:
+    # Sin zona horaria se interpreta como UTC (igual que la importación)
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def _resolve_floors(edificios: Optional[List[str]], pisos: Optional[List[int]]) -> List[dict]:
+    """Pisos seleccionados (de todos los shards) con su banda de energía vigente"""
+    default_band = DEFAULT_THRESHOLDS[Variable.energy]
+
+    def query(db) -> List[dict]:
+        q = select(Floor.id, Floor.number, Building.code).join(Building, Building.id == Floor.building_id)
+        if edificios:
+            q = q.where(Building.code.in_(edificios))
+        if pisos:
+            q = q.where(Floor.number.in_(pisos))
+        rows = db.execute(q.order_by(Building.code, Floor.number)).all()
+        bands = {
+            floor_id: (float(lower), float(upper))
+            for floor_id, lower, upper in db.execute(
+                select(Threshold.floor_id, Threshold.lower, Threshold.upper).where(
+                    Threshold.floor_id.in_([r.id for r in rows]),
+                    Threshold.variable == Variable.energy,
+                    Threshold.is_active == True,
+                )
+            )
+        }
+        return [
+            {"id": r.id, "edificio": r.code, "piso": r.number, "band": bands.get(r.id, default_band)}
+            for r in rows
+        ]
+
+    shards = list(shard_router.group_codes(edificios)) if edificios else None
+    return [f for part in shard_router.fan_out(query, shards) for f in part]
+
+
+def plan(
+    desde: datetime,
+    hasta: Optional[datetime] = None,
+    edificios: Optional[List[str]] = None,
+    pisos: Optional[List[int]] = None,
+    variables: Optional[List[Variable]] = None,
+    dry_run: bool = False,
+    workers: Optional[int] = None,
+    chunk_hours: Optional[int] = None,
+    floors_per_chunk: Optional[int] = None,
+) -> dict:
+    """Valida los parámetros y arma los chunks. Lanza ReevaluationError si no hay nada que hacer."""
+    desde = _utc(desde)
+    hasta = _utc(hasta) if hasta else datetime.now(timezone.utc)
+    if desde >= hasta:
+        raise ReevaluationError("desde debe ser anterior a hasta")
+    floors = _resolve_floors(edificios, pisos)
+    if not floors:
+        raise ReevaluationError("No hay pisos que coincidan con el filtro")
+
+    workers = workers or settings.ALERT_REEVAL_WORKERS
+    step = timedelta(hours=chunk_hours or settings.ALERT_REEVAL_CHUNK_HOURS)
+    windows = []
+    start = desde
+    while start < hasta:
+        windows.append((start, min(start + step, hasta)))
+        start += step
+
+    # Un grupo nunca mezcla shards: cada chunk usa una sola sesión
+    by_shard: Dict[str, List[dict]] = {}
+    for f in floors:
+        by_shard.setdefault(shard_router.for_id(f["id"]).name, []).append(f)
+    size = floors_per_chunk or max(1, math.ceil(len(floors) / workers))
+    groups = [part[i:i + size] for part in by_shard.values() for i in range(0, len(part), size)]
+
+    return {
+        "desde": desde,
+        "hasta": hasta,
+        "variables": [Variable(v).value for v in (variables or list(Variable))],
+        "dry_run": dry_run,
+        "workers": min(workers, len(groups)),
+        "floors": floors,
+        "groups": groups,
+        "windows": windows,
+    }
+
+
+def execute(job: dict, progress: Optional[Callable[[dict], None]] = None) -> dict:
+    """
+    Corre los chunks del plan. Las ventanas de cada grupo se encadenan (la siguiente sale
+    cuando termina la anterior, con su estado); los grupos avanzan en paralelo.
+    """
+    started = time.perf_counter()
+    floors = {f["id"]: f for f in job["floors"]}
+    windows = job["windows"]
+    summary = {
+        "dry_run": job["dry_run"],
+        "desde": job["desde"].isoformat(),
+        "hasta": job["hasta"].isoformat(),
+        "variables": job["variables"],
+        "floors": len(floors),
+        "chunks": len(job["groups"]) * len(windows),
+        "chunks_done": 0,
+        "rows": 0,
+        "anomalies": 0,
+        "created": 0,
+        "by_level": {},
+        "existing": 0,
+        "stale": 0,
+        "stale_ids": [],
+        "sample": [],
+    }
+
+    def task(group: int, window: int, state: dict) -> dict:
+        return {
+            "floors": [{"id": f["id"], "piso": f["piso"], "band": f["band"]} for f in job["groups"][group]],
+            "start": windows[window][0],
+            "end": windows[window][1],
+            "variables": job["variables"],
+            "dry_run": job["dry_run"],
+            "state": state,
+            "sample": settings.ALERT_REEVAL_SAMPLE,
+        }
+
+    def merge(result: dict) -> None:
+        limit = settings.ALERT_REEVAL_SAMPLE
+        summary["chunks_done"] += 1
+        for key in ("rows", "anomalies", "existing", "stale"):
+            summary[key] += result[key]
+        for key, n in result["created"].items():
+            summary["by_level"][key] = summary["by_level"].get(key, 0) + n
+            summary["created"] += n
+            if not job["dry_run"]:
+                variable, level = key.split(":")
+                ALERTS_CREATED.labels(level=level, variable=variable).inc(n)
+        summary["stale_ids"].extend(result["stale_ids"][:limit - len(summary["stale_ids"])])
+        for a in result["sample"][:limit - len(summary["sample"])]:
+            floor = floors[a["floor_id"]]
+            summary["sample"].append({"edificio": floor["edificio"], "piso": floor["piso"], **a})
+        if not job["dry_run"]:
+            # ETag y caché de los pisos con alertas nuevas
+            touched: Dict[str, set] = {}
+            for floor_id in result["touched"]:
+                touched.setdefault(floors[floor_id]["edificio"], set()).add(floors[floor_id]["piso"])
+            for code, pisos in touched.items():
+                data_versions.bump(code, pisos)
+        if progress:
+            progress(summary)
+
+    if job["workers"] <= 1:
+        for group in range(len(job["groups"])):
+            state: dict = {}
+            for window in range(len(windows)):
+                result = _evaluate_chunk(task(group, window, state))
+                state = result["state"]
+                merge(result)
+    else:
+        # spawn: los procesos no heredan hilos ni conexiones del servidor
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=job["workers"], mp_context=context) as pool:
+            running = {pool.submit(_evaluate_chunk, task(g, 0, {})): (g, 0) for g in range(len(job["groups"]))}
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    group, window = running.pop(future)
+                    result = future.result()
+                    if window + 1 < len(windows):
+                        running[pool.submit(_evaluate_chunk, task(group, window + 1, result["state"]))] = (group, window + 1)
+                    merge(result)
+
+    summary["elapsed_s"] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+# ============================================================
+# Jobs lanzados por la API (estado en ALERT_REEVAL_DIR)
+# ============================================================
+
+_JOB_ID = re.compile(r"^[0-9a-f]{12}$")
+# Un job en `running` sin latido en este tiempo quedó huérfano (p. ej. el worker se reinició)
+_HEARTBEAT_SECONDS = 10.0
+_ORPHAN_SECONDS = 3 * _HEARTBEAT_SECONDS
+
+
+class ReevaluationBusy(ReevaluationError):
+    """Ya corren ALERT_REEVAL_MAX_JOBS jobs en este host."""
+
+
+def _job_path(job_id: str) -> str:
+    return os.path.join(settings.ALERT_REEVAL_DIR, f"{job_id}.json")
+
+
+def _save_job(job_id: str, state: dict) -> None:
+    # Escritura atómica: el estado se lee desde cualquier worker mientras el job avanza
+    os.makedirs(settings.ALERT_REEVAL_DIR, exist_ok=True)
+    tmp = f"{_job_path(job_id)}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp, _job_path(job_id))
+
+
+def _load_job(path: str) -> Optional[dict]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if state.get("status") == "running" and time.time() - state.get("heartbeat", 0) > _ORPHAN_SECONDS:
+        # El proceso que lo corría ya no existe: se marca como fallido para siempre
+        state = {**state, "status": "failed", "error": "job interrumpido (el proceso que lo corría terminó)"}
+        _save_job(state["id"], state)
+    return state
+
+
+def _running_jobs() -> int:
+    if not os.path.isdir(settings.ALERT_REEVAL_DIR):
+        return 0
+    return sum(
+        1
+        for entry in os.scandir(settings.ALERT_REEVAL_DIR)
+        if entry.name.endswith(".json") and _JOB_ID.match(entry.name[:-len(".json")])
+        and (_load_job(entry.path) or {}).get("status") == "running"
+    )
+
+
+def start_job(job: dict) -> str:
+    """
+    Corre el plan en un hilo aparte; el progreso queda en `<ALERT_REEVAL_DIR>/<id>.json`.
+    Lanza ReevaluationBusy si ya corren ALERT_REEVAL_MAX_JOBS jobs (entre todos los workers).
+    """
+    job_id = uuid.uuid4().hex[:12]
+    state = {
+        "id": job_id,
+        "status": "running",
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "pid": os.getpid(),
+        "heartbeat": time.time(),
+        "progress": None,
+    }
+    lock = threading.Lock()
+    finished = threading.Event()
+
+    def update(**changes) -> None:
+        with lock:
+            state.update(changes, heartbeat=time.time())
+            _save_job(job_id, dict(state))
+
+    # El conteo y el alta van bajo un flock: dos workers no pueden pasar el límite a la vez
+    os.makedirs(settings.ALERT_REEVAL_DIR, exist_ok=True)
+    with open(os.path.join(settings.ALERT_REEVAL_DIR, "jobs.lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        if _running_jobs() >= settings.ALERT_REEVAL_MAX_JOBS:
+            raise ReevaluationBusy(f"Ya hay {settings.ALERT_REEVAL_MAX_JOBS} reevaluación(es) en curso")
+        update()
+
+    def heartbeat():
+        while not finished.wait(_HEARTBEAT_SECONDS):
+            update()
+
+    def run():
+        try:
+            summary = execute(job, progress=lambda s: update(progress=s))
+        except Exception as e:
+            logger.error(f"❌ Reevaluación {job_id} falló: {e}")
+            finished.set()
+            update(status="failed", error=str(e))
+        else:
+            logger.info(f"🔁 Reevaluación {job_id} terminada: {summary['created']} alertas")
+            finished.set()
+            update(status="done", result=summary)
+
+    threading.Thread(target=heartbeat, name=f"reevaluation-{job_id}-heartbeat", daemon=True).start()
+    threading.Thread(target=run, name=f"reevaluation-{job_id}", daemon=True).start()
+    return job_id
+
+
+def job_state(job_id: str) -> Optional[dict]:
+    if not _JOB_ID.match(job_id):
+        return None
+    return _load_job(_job_path(job_id))
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def main(argv: Optional[List[str]] = None) -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Reevalúa alertas sobre el historial de métricas")
+    parser.add_argument("--desde", required=True, type=datetime.fromisoformat, help="inicio (ISO, UTC si no trae zona)")
+    parser.add_argument("--hasta", type=datetime.fromisoformat, help="fin (por defecto, ahora)")
+    parser.add_argument("--edificio", action="append", help="código de edificio (repetible; todos si se omite)")
+    parser.add_argument("--piso", action="append", type=int, help="número de piso (repetible)")
+    parser.add_argument("--variable", action="append", choices=[v.value for v in Variable])
+    parser.add_argument("--dry-run", action="store_true", help="no escribe: reporta el diff")
+    parser.add_argument("--workers", type=int, default=settings.ALERT_REEVAL_WORKERS)
+    parser.add_argument("--chunk-hours", type=int, default=settings.ALERT_REEVAL_CHUNK_HOURS)
+    parser.add_argument("--floors-per-chunk", type=int, help="pisos por chunk (por defecto, repartidos entre los workers)")
+    args = parser.parse_args(argv)
+
+    def progress(summary):
+        logger.info(
+            f"🔁 Chunk {summary['chunks_done']}/{summary['chunks']}: {summary['rows']:,} lecturas, "
+            f"{summary['anomalies']:,} anómalas, {summary['created']:,} alertas"
+        )
+
+    try:
+        job = plan(
+            args.desde, args.hasta, edificios=args.edificio, pisos=args.piso, variables=args.variable,
+            dry_run=args.dry_run, workers=args.workers, chunk_hours=args.chunk_hours,
+            floors_per_chunk=args.floors_per_chunk,
+        )
+    except ReevaluationError as e:
+        parser.error(str(e))
+    print(json.dumps(execute(job, progress=progress), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
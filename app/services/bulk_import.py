@@ -0,0 +1,425 @@
+"""
+Importación masiva de historial desde Parquet o Arrow IPC (backfill de un edificio).
+
+El archivo se lee por record batches. Cada lote se normaliza en forma columnar con
+pyarrow, los pisos se resuelven una vez por lote (con caché entre lotes) y las filas
+entran con COPY a una tabla temporal. De ahí pasan a `metrics` con un solo
+`INSERT ... SELECT ... ON CONFLICT`, con la misma semántica idempotente que la ingesta.
+Cada lote se confirma por separado: si la importación se corta, volver a correrla
+solo agrega lo que falta.
+
+Uso:
+    python -m app.services.bulk_import historial.parquet --edificio B \\
+        --map timestamp=ts --map piso=floor --map temp_C=temperature
+
+pyarrow es opcional: solo se importa al usar esta función.
+"""
+import argparse
+import io
+import json
+import logging
+import time
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import psycopg2
+from sqlalchemy import column, func, literal_column, select, table, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import DataError
+from sqlalchemy.orm import Session
+
+from app.api.v1.endpoints.metrics import _on_conflict, _resolve_floors
+from app.core.instrumentation import INGEST_DUPLICATES, INGEST_ROWS
+from app.db.models.building import Building
+from app.db.models.enums import ConflictMode
+from app.db.models.metric import Metric
+from app.db.shards import shard_router
+from app.services.data_version import data_versions
+from app.services.energy import invalidate_days
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_ROWS = 200_000
+
+# Campos públicos (los de la ingesta) → columna de `metrics`
+FIELDS = ("timestamp", "edificio", "piso", "temp_C", "humedad_pct", "energia_kW")
+_VALUE_COLUMNS = (("temp_C", "temp_c"), ("humedad_pct", "humidity_pct"), ("energia_kW", "energy_kw"))
+
+_STAGE = "_metrics_import"
+_STAGE_DDL = f"""
+CREATE TEMP TABLE IF NOT EXISTS {_STAGE} (
+    time timestamptz,
+    floor_id integer,
+    temp_c numeric(5, 2),
+    humidity_pct numeric(5, 2),
+    energy_kw numeric(8, 3)
+) ON COMMIT DELETE ROWS
+"""
+_stage = table(_STAGE, column("time"), column("floor_id"), column("temp_c"), column("humidity_pct"), column("energy_kw"))
+
+
+class BulkImportError(ValueError):
+    """Archivo o mapeo inválido: el endpoint lo traduce a 400."""
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.csv
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError("La importación Parquet/Arrow requiere el paquete 'pyarrow'") from e
+    return pyarrow
+
+
+# ============================================================
+# Lectura por lotes
+# ============================================================
+
+def detect_format(source: BinaryIO, filename: str = "") -> str:
+    """parquet | arrow (archivo IPC) | stream (stream IPC), por magic bytes o extensión"""
+    head = source.read(6)
+    source.seek(0)
+    if head[:4] == b"PAR1":
+        return "parquet"
+    if head == b"ARROW1":
+        return "arrow"
+    name = filename.lower()
+    if name.endswith(".parquet"):
+        return "parquet"
+    if name.endswith((".arrow", ".feather", ".ipc", ".arrows")):
+        return "stream"
+    raise BulkImportError("Formato no reconocido: se espera Parquet o Arrow IPC")
+
+
+def iter_batches(source: BinaryIO, fmt: str, columns: List[str], batch_rows: int) -> Iterator:
+    """Tablas de hasta `batch_rows` filas con solo las columnas pedidas."""
+    pa = _pyarrow()
+    if fmt == "parquet":
+        reader = pa.parquet.ParquetFile(source)
+        missing = set(columns) - set(reader.schema_arrow.names)
+        if missing:
+            raise BulkImportError(f"Columnas inexistentes en el archivo: {', '.join(sorted(missing))}")
+        for batch in reader.iter_batches(batch_size=batch_rows, columns=columns):
+            yield pa.Table.from_batches([batch])
+        return
+
+    reader = pa.ipc.open_file(source) if fmt == "arrow" else pa.ipc.open_stream(source)
+    missing = set(columns) - set(reader.schema.names)
+    if missing:
+        raise BulkImportError(f"Columnas inexistentes en el archivo: {', '.join(sorted(missing))}")
+    batches = (reader.get_batch(i) for i in range(reader.num_record_batches)) if fmt == "arrow" else reader
+    pending, rows = [], 0
+    for batch in batches:
+        pending.append(batch.select(columns))
+        rows += batch.num_rows
+        if rows >= batch_rows:
+            yield pa.Table.from_batches(pending)
+            pending, rows = [], 0
+    if pending:
+        yield pa.Table.from_batches(pending)
+
+
+# ============================================================
+# Normalización columnar
+# ============================================================
+
+def _timestamps(array, epoch_unit: str):
+    """Cualquier columna de tiempo → timestamp UTC; el texto lo interpreta PostgreSQL"""
+    pa = _pyarrow()
+    utc = pa.timestamp("us", tz="UTC")
+    t = array.type
+    if pa.types.is_timestamp(t):
+        # Sin zona se asume UTC (mismo criterio que la sesión de la importación)
+        return array.cast(pa.timestamp("us", tz=t.tz)).cast(utc) if t.tz else array.cast(pa.timestamp("us")).cast(utc)
+    if pa.types.is_date(t):
+        return array.cast(pa.timestamp("us")).cast(utc)
+    if pa.types.is_integer(t) or pa.types.is_floating(t):
+        scale = {"s": 1_000_000, "ms": 1_000, "us": 1}[epoch_unit]
+        micros = pa.compute.multiply(array.cast(pa.float64()), scale).cast(pa.int64())
+        return micros.cast(pa.timestamp("us")).cast(utc)
+    if pa.types.is_string(t) or pa.types.is_large_string(t) or pa.types.is_dictionary(t):
+        return array.cast(pa.string())
+    raise BulkImportError(f"Tipo de columna de tiempo no soportado: {t}")
+
+
+def normalize(tbl, mapping: Dict[str, str], edificio: Optional[str], piso: Optional[int], epoch_unit: str):
+    """
+    Tabla del archivo → tabla (timestamp, edificio, piso, temp_C, humedad_pct, energia_kW)
+    con tipos fijos. Descarta filas sin tiempo, edificio o piso; retorna (tabla, descartadas).
+    """
+    pa = _pyarrow()
+    pc = pa.compute
+    n = tbl.num_rows
+
+    def source(field):
+        name = mapping.get(field)
+        return tbl.column(name).combine_chunks() if name else None
+
+    ts = _timestamps(source("timestamp"), epoch_unit)
+    codes = pa.array([edificio] * n, pa.string()) if edificio else source("edificio").cast(pa.string())
+    pisos = pa.array([piso] * n, pa.int32()) if piso is not None else source("piso").cast(pa.int32())
+    columns = {"timestamp": ts, "edificio": codes, "piso": pisos}
+    for field, _ in _VALUE_COLUMNS:
+        values = source(field)
+        columns[field] = values.cast(pa.float64()) if values is not None else pa.nulls(n, pa.float64())
+    out = pa.table(columns)
+
+    valid = pc.and_(pc.and_(pc.is_valid(ts), pc.is_valid(codes)), pc.is_valid(pisos))
+    kept = out.filter(valid)
+    return kept, n - kept.num_rows
+
+
+# ============================================================
+# Escritura
+# ============================================================
+
+class FloorIds:
+    """Caché (edificio, piso) → floor_id durante una importación"""
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.ids: Dict[Tuple[str, int], int] = {}
+        self.known_buildings: set[str] = set()
+
+    def table_for(self, tbl):
+        """Tabla (edificio, piso, floor_id) con los pares del lote; resuelve solo los nuevos."""
+        pa = _pyarrow()
+        pairs = tbl.group_by(["edificio", "piso"]).aggregate([])
+        keys = set(zip(pairs.column("edificio").to_pylist(), pairs.column("piso").to_pylist()))
+        unknown = keys - self.ids.keys()
+        if unknown:
+            codes = {code for code, _ in unknown} - self.known_buildings
+            if codes:
+                found = {c for (c,) in self.db.query(Building.code).filter(Building.code.in_(codes)).all()}
+                if codes - found:
+                    hint = " o importa por edificio (`edificio`) si están en otro shard" if shard_router.sharded else ""
+                    raise BulkImportError(
+                        f"Edificios inexistentes: {', '.join(sorted(codes - found))} (créalos con POST /buildings{hint})"
+                    )
+                self.known_buildings |= found
+            for key, floor in _resolve_floors(self.db, unknown).items():
+                self.ids[key] = floor.id
+        return pa.table({
+            "edificio": pa.array([k[0] for k in keys], pa.string()),
+            "piso": pa.array([k[1] for k in keys], pa.int32()),
+            "floor_id": pa.array([self.ids[k] for k in keys], pa.int32()),
+        })
+
+
+def _copy_batch(db: Session, tbl) -> None:
+    """COPY del lote (ya con floor_id) a la tabla temporal, serializado por pyarrow"""
+    pa = _pyarrow()
+    staged = pa.table({
+        "time": tbl.column("timestamp"),
+        "floor_id": tbl.column("floor_id"),
+        **{column: tbl.column(field) for field, column in _VALUE_COLUMNS},
+    })
+    buffer = io.BytesIO()
+    pa.csv.write_csv(staged, buffer, pa.csv.WriteOptions(include_header=False))
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {_STAGE} (time, floor_id, temp_c, humidity_pct, energy_kw) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+    finally:
+        cursor.close()
+
+
+def _merge_stage(db: Session, mode: ConflictMode) -> Tuple[int, int]:
+    """Tabla temporal → metrics (deduplicada por (floor_id, time)); retorna (insertadas, actualizadas)"""
+    src = (
+        select(_stage.c.time, _stage.c.floor_id, _stage.c.temp_c, _stage.c.humidity_pct, _stage.c.energy_kw)
+        .distinct(_stage.c.floor_id, _stage.c.time)
+        .order_by(_stage.c.floor_id, _stage.c.time)
+    )
+    stmt = _on_conflict(
+        pg_insert(Metric).from_select(["time", "floor_id", "temp_c", "humidity_pct", "energy_kw"], src),
+        mode,
+    )
+    written = stmt.returning(literal_column("xmax = 0").label("inserted")).cte("written")
+    inserted, total = db.execute(
+        select(func.count().filter(written.c.inserted), func.count()).select_from(written)
+    ).one()
+    return inserted, total - inserted
+
+
+def import_file(
+    db: Session,
+    source: BinaryIO,
+    filename: str = "",
+    mapping: Optional[Dict[str, str]] = None,
+    edificio: Optional[str] = None,
+    piso: Optional[int] = None,
+    mode: ConflictMode = ConflictMode.ignore,
+    batch_rows: int = DEFAULT_BATCH_ROWS,
+    epoch_unit: str = "s",
+    fmt: Optional[str] = None,
+    progress=None,
+) -> dict:
+    """
+    Importa un archivo Parquet / Arrow IPC. `mapping` va de campo de la ingesta
+    (timestamp, edificio, piso, temp_C, humedad_pct, energia_kW) a columna del archivo;
+    los campos no mapeados usan el mismo nombre si existe. `edificio` / `piso` fijan un
+    valor para todo el archivo.
+    """
+    pa = _pyarrow()
+    start = time.perf_counter()
+    fmt = fmt or detect_format(source, filename)
+    mapping = dict(mapping or {})
+    unknown = set(mapping) - set(FIELDS)
+    if unknown:
+        raise BulkImportError(f"Campos desconocidos en el mapeo: {', '.join(sorted(unknown))}")
+
+    schema_names = _schema_names(source, fmt)
+    for field in FIELDS:
+        if field not in mapping and field in schema_names:
+            mapping[field] = field
+    if edificio:
+        mapping.pop("edificio", None)
+    if piso is not None:
+        mapping.pop("piso", None)
+    required = ["timestamp"] + (["edificio"] if not edificio else []) + (["piso"] if piso is None else [])
+    missing = [f for f in required if f not in mapping]
+    if missing:
+        raise BulkImportError(f"Falta mapear: {', '.join(missing)}")
+
+    db.execute(text(_STAGE_DDL))
+    # Los textos sin zona horaria se interpretan como UTC
+    db.execute(text("SET TIME ZONE 'UTC'"))
+    floor_ids = FloorIds(db)
+    totals = {"rows": 0, "skipped": 0, "inserted": 0, "updated": 0, "duplicates": 0, "batches": 0}
+    touched: Dict[str, set] = {}
+    first_ts = last_ts = None
+
+    try:
+        for raw in iter_batches(source, fmt, sorted(set(mapping.values())), batch_rows):
+            tbl, skipped = normalize(raw, mapping, edificio, piso, epoch_unit)
+            totals["rows"] += raw.num_rows
+            totals["skipped"] += skipped
+            if not tbl.num_rows:
+                continue
+
+            floors = floor_ids.table_for(tbl)
+            tbl = tbl.join(floors, ["edificio", "piso"])
+            _copy_batch(db, tbl)
+            inserted, updated = _merge_stage(db, mode)
+            if pa.types.is_timestamp(tbl.column("timestamp").type):
+                bounds = pa.compute.min_max(tbl.column("timestamp")).as_py()
+                low, high = bounds["min"], bounds["max"]
+            else:
+                # Texto: el rango se conoce recién después de que PostgreSQL lo interpreta
+                # (antes del commit, que vacía la tabla temporal)
+                low, high = db.execute(select(func.min(_stage.c.time), func.max(_stage.c.time))).one()
+            first_ts = low if first_ts is None else min(first_ts, low)
+            last_ts = high if last_ts is None else max(last_ts, high)
+            # Totales de energía de días cerrados que cambian con este lote
+            spans = db.execute(
+                select(_stage.c.floor_id, func.min(_stage.c.time), func.max(_stage.c.time)).group_by(_stage.c.floor_id)
+            ).all()
+            invalidate_days(db, {floor_id: (low, high) for floor_id, low, high in spans})
+            db.commit()
+
+            duplicates = tbl.num_rows - inserted - updated
+            totals["inserted"] += inserted
+            totals["updated"] += updated
+            totals["duplicates"] += duplicates
+            totals["batches"] += 1
+            INGEST_ROWS.labels(source="bulk").inc(inserted + updated)
+            if duplicates:
+                INGEST_DUPLICATES.labels(source="bulk").inc(duplicates)
+            for code, number in zip(floors.column("edificio").to_pylist(), floors.column("piso").to_pylist()):
+                touched.setdefault(code, set()).add(number)
+
+            if progress:
+                progress(totals)
+    except (pa.ArrowInvalid, DataError, psycopg2.DataError) as e:
+        # Lo ya confirmado queda: reintentar la importación es idempotente
+        detail = getattr(e, "orig", e)
+        raise BulkImportError(f"Lote {totals['batches'] + 1}: {detail}".strip()) from e
+    finally:
+        db.rollback()
+        db.execute(text("RESET TIME ZONE"))
+        db.commit()
+        # Lo confirmado invalida ETag y caché aunque la importación se haya cortado
+        for code, pisos in touched.items():
+            data_versions.bump(code, pisos)
+
+    elapsed = time.perf_counter() - start
+    return {
+        **totals,
+        "ingested": totals["inserted"] + totals["updated"],
+        "first_ts": str(first_ts) if first_ts else None,
+        "last_ts": str(last_ts) if last_ts else None,
+        "buildings": sorted(touched),
+        "seconds": round(elapsed, 2),
+        "rows_per_second": round(totals["rows"] / elapsed) if elapsed > 0 else None,
+    }
+
+
+def _schema_names(source: BinaryIO, fmt: str) -> set:
+    pa = _pyarrow()
+    try:
+        if fmt == "parquet":
+            names = pa.parquet.ParquetFile(source).schema_arrow.names
+        elif fmt == "arrow":
+            names = pa.ipc.open_file(source).schema.names
+        else:
+            names = pa.ipc.open_stream(source).schema.names
+    except pa.ArrowInvalid as e:
+        raise BulkImportError(f"Archivo inválido: {e}") from e
+    finally:
+        source.seek(0)
+    return set(names)
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def _parse_mapping(items: List[str]) -> Dict[str, str]:
+    out = {}
+    for item in items:
+        field, sep, name = item.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"--map espera campo=columna, llegó '{item}'")
+        out[field.strip()] = name.strip()
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Importa historial de métricas desde Parquet / Arrow IPC")
+    parser.add_argument("path")
+    parser.add_argument("--map", action="append", default=[], metavar="CAMPO=COLUMNA",
+                        help=f"columna del archivo para cada campo ({', '.join(FIELDS)})")
+    parser.add_argument("--edificio", help="código de edificio para todo el archivo")
+    parser.add_argument("--piso", type=int, help="número de piso para todo el archivo")
+    parser.add_argument("--on-conflict", choices=[m.value for m in ConflictMode], default=ConflictMode.ignore.value)
+    parser.add_argument("--batch-rows", type=int, default=DEFAULT_BATCH_ROWS)
+    parser.add_argument("--epoch-unit", choices=("s", "ms", "us"), default="s",
+                        help="unidad si el tiempo viene como número")
+    parser.add_argument("--format", choices=("parquet", "arrow", "stream"), default=None)
+    args = parser.parse_args(argv)
+
+    def progress(totals):
+        logger.info(
+            f"📦 Lote {totals['batches']}: {totals['rows']:,} filas leídas, "
+            f"{totals['inserted']:,} insertadas, {totals['duplicates']:,} duplicadas"
+        )
+
+    shard = shard_router.for_building(args.edificio) if args.edificio else shard_router.default
+    with open(args.path, "rb") as f, shard.session() as db:
+        result = import_file(
+            db, f, filename=args.path, mapping=_parse_mapping(args.map),
+            edificio=args.edificio, piso=args.piso, mode=ConflictMode(args.on_conflict),
+            batch_rows=args.batch_rows, epoch_unit=args.epoch_unit, fmt=args.format, progress=progress,
+        )
+    print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
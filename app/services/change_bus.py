@@ -0,0 +1,196 @@
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional
+
+import psycopg2
+from sqlalchemy.engine import make_url
+
+from app.core.config import settings
+from app.services.data_version import data_versions
+from app.services.realtime_hub import realtime_hub
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "smartfloors_changes"
+# PostgreSQL rechaza payloads de NOTIFY de 8000 bytes o más
+MAX_PAYLOAD_BYTES = 7900
+SEND_BATCH = 500
+
+
+class ChangeBus:
+    """
+    Bus entre workers sobre LISTEN/NOTIFY de PostgreSQL.
+
+    Cada worker mantiene en memoria sus versiones de datos (ETag), su caché de respuestas
+    y sus suscriptores en tiempo real. El bus reenvía a los demás workers los cambios
+    originados en este proceso para que ninguno sirva un 304 o una entrada de caché
+    obsoleta, y para que un dashboard reciba los eventos sin importar qué worker hizo la
+    ingesta. La entrega es best-effort: si la conexión cae se reintenta y se pierde lo
+    enviado mientras tanto (las entradas de caché igual expiran por TTL).
+    """
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._handlers: Dict[str, Callable[[dict], None]] = {}
+        self._outbox: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._periodic: list[tuple[float, Callable[[], None]]] = []
+
+    def on(self, kind: str, handler: Callable[[dict], None]) -> None:
+        self._handlers[kind] = handler
+
+    def every(self, interval: float, fn: Callable[[], None]) -> None:
+        """Ejecuta `fn` cada `interval` segundos desde el hilo de envío."""
+        self._periodic.append((interval, fn))
+
+    def send(self, kind: str, data: dict) -> None:
+        payload = json.dumps({"o": self.origin, "k": kind, "d": data}, separators=(",", ":"), default=str)
+        if len(payload.encode("utf-8")) > MAX_PAYLOAD_BYTES:
+            logger.warning(f"⚠️ Evento '{kind}' demasiado grande para NOTIFY ({len(payload)} bytes); no se reenvía")
+            return
+        self._outbox.put(payload)
+
+    def start(self) -> None:
+        for target, name in ((self._listen_loop, "change-bus-listen"), (self._send_loop, "change-bus-send")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"✅ Bus de cambios entre workers activo (canal {CHANNEL})")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Envía lo pendiente y detiene los hilos."""
+        self._outbox.put(None)
+        for thread in self._threads:
+            if thread.name == "change-bus-send":
+                thread.join(timeout)
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn)
+        conn.autocommit = True
+        return conn
+
+    def _dispatch(self, raw: str) -> None:
+        try:
+            message = json.loads(raw)
+        except ValueError:
+            return
+        if message.get("o") == self.origin:
+            return  # NOTIFY también le llega al emisor
+        handler = self._handlers.get(message.get("k"))
+        if handler is None:
+            return
+        try:
+            handler(message["d"])
+        except Exception as e:
+            logger.error(f"❌ Error aplicando evento '{message.get('k')}' del bus: {e}")
+
+    def _listen_loop(self) -> None:
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                conn.cursor().execute(f"LISTEN {CHANNEL}")
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._dispatch(conn.notifies.pop(0).payload)
+            except Exception as e:
+                logger.warning(f"⚠️ Bus de cambios desconectado (LISTEN): {e}")
+                self._stop.wait(2.0)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _send_loop(self) -> None:
+        conn = None
+        due = [time.monotonic() + interval for interval, _ in self._periodic]
+        done = False
+        while not done:
+            timeout = max(0.0, min(due) - time.monotonic()) if due else 1.0
+            batch: list[str] = []
+            try:
+                item = self._outbox.get(timeout=timeout)
+                while True:
+                    if item is None:
+                        done = True
+                    else:
+                        batch.append(item)
+                    if done or len(batch) >= SEND_BATCH:
+                        break
+                    item = self._outbox.get_nowait()
+            except queue.Empty:
+                pass
+
+            now = time.monotonic()
+            for i, (interval, fn) in enumerate(self._periodic):
+                if now >= due[i]:
+                    due[i] = now + interval
+                    try:
+                        fn()
+                    except Exception as e:
+                        logger.error(f"❌ Error en tarea periódica del bus: {e}")
+
+            if not batch:
+                continue
+            try:
+                if conn is None or conn.closed:
+                    conn = self._connect()
+                with conn.cursor() as cur:
+                    # Un solo round-trip para todo el lote
+                    cur.execute("SELECT pg_notify(%s, p) FROM unnest(%s::text[]) AS p", (CHANNEL, batch))
+            except Exception as e:
+                logger.warning(f"⚠️ Bus de cambios: se descartan {len(batch)} eventos ({e})")
+                if conn is not None:
+                    conn.close()
+                conn = None
+        if conn is not None:
+            conn.close()
+
+
+def _libpq_dsn(url: str) -> str:
+    """URL de SQLAlchemy (postgresql+psycopg2://...) → DSN de libpq"""
+    return make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+def start_change_bus() -> Optional[ChangeBus]:
+    """
+    Conecta versiones de datos y tiempo real de este worker al bus. Solo con
+    `CHANGE_BUS_ENABLED` (el launcher lo activa cuando corre más de un worker).
+    """
+    if not settings.CHANGE_BUS_ENABLED:
+        return None
+
+    bus = ChangeBus(_libpq_dsn(settings.db_url))
+    interest_ttl = settings.REALTIME_HEARTBEAT_SECONDS * 3
+
+    data_versions.add_forwarder(lambda edificio, pisos: bus.send("bump", {"e": edificio, "p": pisos}))
+    bus.on("bump", lambda d: data_versions.bump(d["e"], d["p"], forward=False))
+
+    realtime_hub.add_forwarder(
+        lambda edificio, piso, tipo, data: bus.send("rt", {"e": edificio, "p": piso, "t": tipo, "d": data})
+    )
+    bus.on("rt", lambda d: realtime_hub.publish(d["e"], d["p"], d["t"], d["d"], forward=False))
+
+    def announce(edificios):
+        if edificios:
+            bus.send("interest", {"e": list(edificios)})
+
+    realtime_hub.add_interest_listener(lambda edificio: announce([edificio]))
+    bus.every(settings.REALTIME_HEARTBEAT_SECONDS, lambda: announce(realtime_hub.local_buildings()))
+    bus.on("interest", lambda d: realtime_hub.remote_interest(d["e"], interest_ttl))
+
+    bus.start()
+    return bus
@@ -0,0 +1,84 @@
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Iterable, Optional, Tuple, Dict, Callable, List
+from sqlalchemy.orm import Session
+from app.db.models.building import Building
+from app.db.models.floor import Floor
+
+
+class DataVersions:
+    """
+    Contador de versión de datos por edificio y por piso.
+    La ingesta y las escrituras de alertas lo incrementan; los endpoints de lectura lo usan
+    para emitir ETag / Last-Modified y responder 304 sin tocar la base de datos.
+
+    El `epoch` es distinto en cada proceso, así que un ETag emitido por otro proceso
+    (o antes de un reinicio) nunca coincide por accidente.
+    """
+
+    def __init__(self):
+        self._listeners: List[Callable[[str, List[int]], None]] = []
+        self._forwarders: List[Callable[[str, List[int]], None]] = []
+        self._reset()
+        # Un worker creado por fork no debe compartir epoch con su padre ni con sus hermanos
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self.epoch = uuid.uuid4().hex[:8]
+        self._started_at = datetime.now(timezone.utc).replace(microsecond=0)
+        self._versions: Dict[Tuple[Optional[str], Optional[int]], Tuple[int, datetime]] = {}
+        self._lock = threading.Lock()
+
+    def bump(self, edificio: str, pisos: Iterable[Optional[int]] = (), forward: bool = True) -> None:
+        """
+        Marca como modificados el edificio y los pisos indicados. Con `forward` el cambio
+        se reenvía a los demás workers (ver `app/services/change_bus.py`).
+        """
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        pisos = [p for p in pisos if p is not None]
+        # (None, None) es la versión global: cambia con cualquier edificio
+        keys = {(None, None), (edificio, None)} | {(edificio, p) for p in pisos}
+        with self._lock:
+            for key in keys:
+                version, _ = self._versions.get(key, (0, self._started_at))
+                self._versions[key] = (version + 1, now)
+        for listener in self._listeners:
+            listener(edificio, pisos)
+        if forward:
+            for forwarder in self._forwarders:
+                forwarder(edificio, pisos)
+
+    def add_listener(self, listener: Callable[[str, List[int]], None]) -> None:
+        """Registra un callback (edificio, pisos) que se invoca en cada incremento."""
+        self._listeners.append(listener)
+
+    def add_forwarder(self, forwarder: Callable[[str, List[int]], None]) -> None:
+        """Registra un callback que recibe solo los incrementos originados en este proceso."""
+        self._forwarders.append(forwarder)
+
+    def get(self, edificio: Optional[str], piso: Optional[int] = None) -> Tuple[int, datetime]:
+        """(versión, última modificación) del edificio, del piso o global (`edificio=None`)"""
+        return self._versions.get((edificio, piso), (0, self._started_at))
+
+    def etag(self, edificio: Optional[str], piso: Optional[int] = None, variant: str = "") -> str:
+        version, _ = self.get(edificio, piso)
+        tag = f"{self.epoch}-{edificio if edificio is not None else '*'}-{piso if piso is not None else '*'}-{version}"
+        if variant:
+            tag += f"-{variant}"
+        return f'W/"{tag}"'
+
+    def bump_floor(self, db: Session, floor_id: int) -> None:
+        """Igual que `bump` pero a partir del id del piso (escrituras que no conocen el código)."""
+        row = (
+            db.query(Building.code, Floor.number)
+            .join(Floor, Floor.building_id == Building.id)
+            .filter(Floor.id == floor_id)
+            .first()
+        )
+        if row:
+            self.bump(row.code, [row.number])
+
+
+data_versions = DataVersions()
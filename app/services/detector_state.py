@@ -0,0 +1,245 @@
+import logging
+import math
+import os
+import threading
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import select, true
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models.enums import Variable
+from app.db.models.floor import Floor
+from app.db.models.metric import Metric
+
+logger = logging.getLogger(__name__)
+
+# Columna de `Metric` que alimenta cada variable
+_COLUMNS = {
+    Variable.temperature: "temp_c",
+    Variable.humidity: "humidity_pct",
+    Variable.energy: "energy_kw",
+}
+
+
+class SeriesState:
+    """
+    Estado en streaming de una variable de un piso.
+
+    - Ring buffer de tamaño fijo (dos `array('d')`: tiempo en horas y valor).
+    - Media y varianza EWMA.
+    - Sumas de la regresión lineal sobre la ventana (Σt, Σx, Σtt, Σtx), que se
+      actualizan al entrar y salir cada punto. La pendiente sale en O(1).
+
+    Las sumas se recalculan desde el buffer cada vez que éste da una vuelta completa,
+    para que el error de redondeo de las restas no se acumule (costo amortizado O(1)).
+    """
+
+    __slots__ = (
+        "size", "alpha", "times", "values", "count", "head",
+        "mean", "var", "prev_mean", "prev_var", "last_time",
+        "_st", "_sx", "_stt", "_stx", "_t0", "_since_recompute",
+    )
+
+    def __init__(self, size: int, alpha: float):
+        self.size = size
+        self.alpha = alpha
+        self.times = array("d", [0.0] * size)
+        self.values = array("d", [0.0] * size)
+        self.count = 0
+        self.head = 0                      # próxima posición a escribir
+        self.mean = 0.0
+        self.var = 0.0
+        self.prev_mean = 0.0               # antes de la última lectura (para el z-score)
+        self.prev_var = 0.0
+        self.last_time: Optional[float] = None
+        self._t0: Optional[float] = None   # origen de tiempo (horas) para las sumas
+        self._st = self._sx = self._stt = self._stx = 0.0
+        self._since_recompute = 0
+
+    def update(self, ts: float, value: float) -> bool:
+        """
+        Agrega una lectura (`ts` en segundos epoch). Ignora las que no son más nuevas que
+        la última: las cargas históricas no deben mover el estado "actual".
+        """
+        if self.last_time is not None and ts <= self.last_time:
+            return False
+        hours = ts / 3600.0
+        if self._t0 is None:
+            self._t0 = hours
+        t = hours - self._t0
+
+        # EWMA (West): media y varianza en una pasada
+        self.prev_mean, self.prev_var = self.mean, self.var
+        if self.count == 0:
+            self.mean, self.var = value, 0.0
+        else:
+            diff = value - self.mean
+            incr = self.alpha * diff
+            self.mean += incr
+            self.var = (1.0 - self.alpha) * (self.var + diff * incr)
+
+        # Ring buffer + sumas de la ventana
+        if self.count == self.size:
+            old_t, old_x = self.times[self.head], self.values[self.head]
+            self._st -= old_t
+            self._sx -= old_x
+            self._stt -= old_t * old_t
+            self._stx -= old_t * old_x
+        else:
+            self.count += 1
+        self.times[self.head] = t
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.size
+        self._st += t
+        self._sx += value
+        self._stt += t * t
+        self._stx += t * value
+        self.last_time = ts
+
+        self._since_recompute += 1
+        if self._since_recompute >= self.size:
+            self._recompute()
+        return True
+
+    def _recompute(self) -> None:
+        idx = range(self.count)
+        self._st = sum(self.times[i] for i in idx)
+        self._sx = sum(self.values[i] for i in idx)
+        self._stt = sum(self.times[i] * self.times[i] for i in idx)
+        self._stx = sum(self.times[i] * self.values[i] for i in idx)
+        self._since_recompute = 0
+
+    # ---------------------------------------------------------- lecturas O(1)
+
+    @property
+    def latest(self) -> Optional[float]:
+        return self.values[(self.head - 1) % self.size] if self.count else None
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.var) if self.var > 0 else 0.0
+
+    @property
+    def span_hours(self) -> float:
+        if self.count < 2:
+            return 0.0
+        newest = self.times[(self.head - 1) % self.size]
+        oldest = self.times[self.head % self.size] if self.count == self.size else self.times[0]
+        return newest - oldest
+
+    def rate_per_hour(self) -> Optional[float]:
+        """Pendiente de la recta de mínimos cuadrados sobre la ventana (unidades/hora)."""
+        n = self.count
+        if n < 2:
+            return None
+        denom = n * self._stt - self._st * self._st
+        if abs(denom) < 1e-12:
+            return None
+        return (n * self._stx - self._st * self._sx) / denom
+
+    def zscore(self) -> Optional[float]:
+        """Desviación de la última lectura respecto a la EWMA previa a ella."""
+        if self.count < 3 or self.prev_var <= 0:
+            return None
+        return (self.latest - self.prev_mean) / math.sqrt(self.prev_var)
+
+    def trend(self) -> str:
+        """
+        increasing / decreasing / stable: el cambio que la pendiente explica en la ventana
+        se compara con el ruido (desvío EWMA), así una oscilación normal no cuenta.
+        """
+        rate = self.rate_per_hour()
+        if rate is None or self.count < 3:
+            return "stable"
+        change = rate * self.span_hours
+        if abs(change) <= max(0.5 * self.std, 1e-6):
+            return "stable"
+        return "increasing" if change > 0 else "decreasing"
+
+
+class DetectorState:
+    """
+    Estado de detección por (piso, variable), alimentado con cada lectura ingresada y
+    reconstruido desde la base al arrancar el worker. Reemplaza la consulta de historial
+    que se hacía por cada alerta.
+
+    Con varios workers, cada uno mantiene el estado de las lecturas que ingresa. Es una
+    submuestra de la serie del piso, así que tendencia y tasa siguen siendo válidas.
+    """
+
+    def __init__(self, window: int, alpha: float):
+        self.window = window
+        self.alpha = alpha
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self._series: Dict[Tuple[int, Variable], SeriesState] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, floor_id: int, variable: Variable) -> SeriesState:
+        key = (floor_id, variable)
+        state = self._series.get(key)
+        if state is None:
+            state = self._series[key] = SeriesState(self.window, self.alpha)
+        return state
+
+    def update(self, floor_id: int, ts: datetime, values: Dict[Variable, Optional[float]]) -> None:
+        epoch = ts.timestamp()
+        with self._lock:
+            for variable, value in values.items():
+                if value is not None:
+                    self._get(floor_id, variable).update(epoch, float(value))
+
+    def update_rows(self, rows: Iterable) -> None:
+        """Filas con floor_id, time, temp_c, humidity_pct, energy_kw (en cualquier orden)."""
+        for r in sorted(rows, key=lambda r: r.time):
+            self.update(r.floor_id, r.time, {v: getattr(r, col) for v, col in _COLUMNS.items()})
+
+    def context(self, floor_id: int, variable: Variable) -> dict:
+        """Contexto histórico para una alerta (y para el prompt de Gemini), en O(1)."""
+        with self._lock:
+            state = self._series.get((floor_id, variable))
+            if state is None or state.count == 0:
+                return {"count": 0, "trend": "stable"}
+            rate = state.rate_per_hour()
+            z = state.zscore()
+            return {
+                "count": state.count,
+                "trend": state.trend(),
+                "rate_per_hour": round(rate, 3) if rate is not None else None,
+                "zscore": round(z, 2) if z is not None else None,
+                "mean": round(state.mean, 3),
+                "std": round(state.std, 3),
+            }
+
+    def rebuild(self, db: Session, reset: bool = True) -> int:
+        """
+        Carga las últimas `window` lecturas de cada piso (dentro de `DETECTOR_WARMUP_HOURS`)
+        en una sola consulta: LATERAL por piso sobre el índice (floor_id, time).
+        Con `reset=False` se agrega al estado actual (un shard tras otro).
+        """
+        since = datetime.now(timezone.utc) - timedelta(hours=settings.DETECTOR_WARMUP_HOURS)
+        recent = (
+            select(Metric.time, Metric.temp_c, Metric.humidity_pct, Metric.energy_kw)
+            .where(Metric.floor_id == Floor.id, Metric.time >= since)
+            .order_by(Metric.time.desc())
+            .limit(self.window)
+            .lateral("recent")
+        )
+        stmt = (
+            select(Floor.id.label("floor_id"), recent.c.time, recent.c.temp_c, recent.c.humidity_pct, recent.c.energy_kw)
+            .select_from(Floor)
+            .join(recent, true())
+        )
+        rows = db.execute(stmt).all()
+        if reset:
+            self._reset()
+        self.update_rows(rows)
+        return len(rows)
+
+
+detector_state = DetectorState(window=settings.DETECTOR_WINDOW, alpha=settings.DETECTOR_EWMA_ALPHA)
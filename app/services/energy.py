@@ -0,0 +1,204 @@
+"""
+Energía consumida (kWh) por piso y día a partir de la potencia instantánea (`energy_kw`).
+
+Cada piso se integra con la regla del trapecio sobre su serie completa, vectorizada con
+numpy: los cortes de día se insertan como puntos interpolados, así un tramo que cruza la
+medianoche se reparte entre los dos días. Un hueco entre lecturas mayor que
+`ENERGY_MAX_GAP_MINUTES` cuenta como si durara ese máximo (potencia media del tramo
+durante el hueco acotado), para que una caída del gateway no invente consumo.
+
+Los días ya cerrados se guardan en `energy_daily` (por piso, zona horaria y día) y no se
+vuelven a integrar: solo el día en curso se calcula en cada consulta. Una escritura que
+toque un día cerrado (ingesta atrasada, replay del spool, importación) borra ese total
+con `invalidate_days` y se recalcula en la próxima consulta.
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import Float, cast, func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models.energy_daily import EnergyDaily
+from app.db.models.metric import Metric
+
+
+def _max_gap() -> timedelta:
+    return timedelta(minutes=settings.ENERGY_MAX_GAP_MINUTES)
+
+
+# ============================================================
+# Invalidación de días cerrados
+# ============================================================
+
+_INVALIDATE = text("""
+    DELETE FROM energy_daily e
+    USING unnest(CAST(:floor_ids AS integer[]), CAST(:lows AS timestamptz[]), CAST(:highs AS timestamptz[]))
+        AS s(floor_id, low, high)
+    WHERE e.floor_id = s.floor_id
+      AND e.day BETWEEN timezone(e.tz, s.low)::date AND timezone(e.tz, s.high)::date
+""")
+
+
+def invalidate_days(db: Session, spans: Dict[int, Tuple[datetime, datetime]]) -> None:
+    """
+    Borra los totales guardados de los días afectados por lecturas escritas entre
+    `(desde, hasta)` de cada piso. Se amplía en el hueco máximo porque una lectura justo
+    después de medianoche cambia el último tramo del día anterior. Va en la transacción
+    de la escritura.
+    """
+    if not spans:
+        return
+    gap = _max_gap()
+    floor_ids = list(spans)
+    db.execute(
+        _INVALIDATE,
+        {
+            "floor_ids": floor_ids,
+            "lows": [spans[f][0] - gap for f in floor_ids],
+            "highs": [spans[f][1] + gap for f in floor_ids],
+        },
+    )
+
+
+def spans_of(rows: Iterable) -> Dict[int, Tuple[datetime, datetime]]:
+    """{floor_id: (primera, última)} de filas con `floor_id` y `time`"""
+    out: Dict[int, Tuple[datetime, datetime]] = {}
+    for r in rows:
+        low, high = out.get(r.floor_id, (r.time, r.time))
+        out[r.floor_id] = (min(low, r.time), max(high, r.time))
+    return out
+
+
+# ============================================================
+# Integración (numpy)
+# ============================================================
+
+def integrate_series(t, p, bounds, max_gap: float):
+    """
+    kWh y cantidad de lecturas por día de una serie ordenada.
+
+    `t` en segundos (época), `p` en kW, `bounds` los cortes de día (n + 1 valores para
+    n días), `max_gap` en segundos. Retorna dos arreglos de largo n.
+    """
+    import numpy as np
+
+    days = len(bounds) - 1
+    reading_day = np.searchsorted(bounds, t, side="right") - 1
+    counts = np.bincount(reading_day[(reading_day >= 0) & (reading_day < days)], minlength=days)
+    if len(t) < 2:
+        return np.zeros(days), counts
+
+    # Factor por tramo: un hueco largo se acota a max_gap
+    factor = np.minimum(1.0, max_gap / np.diff(t))
+
+    # Cortes de día dentro de la serie como puntos interpolados
+    inner = bounds[(bounds > t[0]) & (bounds < t[-1])]
+    tt = np.concatenate([t, inner])
+    pp = np.concatenate([p, np.interp(inner, t, p)])
+    order = np.argsort(tt, kind="stable")
+    tt, pp = tt[order], pp[order]
+
+    # Cada subtramo hereda el factor del tramo original que lo contiene
+    segment = np.clip(np.searchsorted(t, tt[:-1], side="right") - 1, 0, len(factor) - 1)
+    kwh = (pp[:-1] + pp[1:]) / 2 * np.diff(tt) * factor[segment] / 3600
+
+    day = np.searchsorted(bounds, tt[:-1], side="right") - 1
+    valid = (day >= 0) & (day < days)
+    return np.bincount(day[valid], weights=kwh[valid], minlength=days), counts
+
+
+def _day_bounds(first: date, last: date, zone: ZoneInfo) -> List[float]:
+    """Inicio de cada día en la zona (respeta cambios de horario) más el fin del último"""
+    n = (last - first).days + 1
+    return [datetime.combine(first + timedelta(days=i), time(), zone).timestamp() for i in range(n + 1)]
+
+
+def _integrate(db: Session, floor_ids: List[int], first: date, last: date, zone: ZoneInfo) -> Dict[int, Tuple[list, list]]:
+    """
+    {floor_id: (kwh por día, lecturas por día)} entre `first` y `last` (inclusive), con una
+    sola consulta para todos los pisos.
+    """
+    import numpy as np
+
+    bounds = np.array(_day_bounds(first, last, zone))
+    gap = _max_gap()
+    start = datetime.fromtimestamp(bounds[0], zone) - gap
+    end = datetime.fromtimestamp(bounds[-1], zone) + gap
+    rows = db.execute(
+        select(Metric.floor_id, cast(func.extract("epoch", Metric.time), Float), cast(Metric.energy_kw, Float))
+        .where(
+            Metric.floor_id.in_(floor_ids),
+            Metric.time >= start,
+            Metric.time < end,
+            Metric.energy_kw.isnot(None),
+        )
+        .order_by(Metric.floor_id, Metric.time)
+    ).all()
+
+    days = len(bounds) - 1
+    out = {f: (np.zeros(days), np.zeros(days, dtype=int)) for f in floor_ids}
+    if rows:
+        data = np.array(rows, dtype=float)
+        ids, starts = np.unique(data[:, 0].astype(int), return_index=True)
+        for i, floor_id in enumerate(ids):
+            stop = starts[i + 1] if i + 1 < len(starts) else len(data)
+            series = data[starts[i]:stop]
+            out[int(floor_id)] = integrate_series(series[:, 1], series[:, 2], bounds, gap.total_seconds())
+    return {f: (kwh.tolist(), counts.tolist()) for f, (kwh, counts) in out.items()}
+
+
+# ============================================================
+# Totales diarios (guardados + día en curso)
+# ============================================================
+
+def daily_kwh(
+    db: Session,
+    floor_ids: List[int],
+    first: date,
+    last: date,
+    tz: str,
+) -> Tuple[Dict[int, List[float]], Optional[date]]:
+    """
+    kWh por piso y día entre `first` y `last`. Los días cerrados salen de `energy_daily`
+    (los que falten se integran en bloque y se guardan); el día en curso se integra sin
+    guardarse. Retorna ({floor_id: kwh por día}, día en curso si está en el rango).
+    """
+    zone = ZoneInfo(tz)
+    today = datetime.now(zone).date()
+    days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+    values: Dict[Tuple[int, date], float] = {}
+
+    closed_last = min(last, today - timedelta(days=1))
+    if floor_ids and first <= closed_last:
+        for floor_id, day, kwh in db.execute(
+            select(EnergyDaily.floor_id, EnergyDaily.day, EnergyDaily.kwh).where(
+                EnergyDaily.floor_id.in_(floor_ids),
+                EnergyDaily.tz == tz,
+                EnergyDaily.day.between(first, closed_last),
+            )
+        ):
+            values[(floor_id, day)] = float(kwh)
+
+        missing = [d for d in days if d <= closed_last and any((f, d) not in values for f in floor_ids)]
+        if missing:
+            computed = _integrate(db, floor_ids, missing[0], missing[-1], zone)
+            rows = []
+            for floor_id, (kwh, counts) in computed.items():
+                for i, value in enumerate(kwh):
+                    day = missing[0] + timedelta(days=i)
+                    if (floor_id, day) not in values:
+                        values[(floor_id, day)] = round(value, 3)
+                        rows.append({"floor_id": floor_id, "tz": tz, "day": day, "kwh": round(value, 3), "readings": counts[i]})
+            if rows:
+                db.execute(pg_insert(EnergyDaily).values(rows).on_conflict_do_nothing())
+                db.commit()
+
+    partial = today if first <= today <= last else None
+    if partial is not None and floor_ids:
+        for floor_id, (kwh, _) in _integrate(db, floor_ids, today, today, zone).items():
+            values[(floor_id, today)] = round(kwh[0], 3)
+
+    return {f: [values.get((f, d), 0.0) for d in days] for f in floor_ids}, partial
@@ -0,0 +1,396 @@
+"""
+Pronóstico de corto plazo y alertas predictivas.
+
+Cada `FORECAST_INTERVAL_SECONDS` se cargan las últimas lecturas de todos los pisos en una
+sola consulta, se arman matrices pisos × lecturas (NaN donde un piso tiene menos) y se
+ajusta, para todos los pisos a la vez, una recta de mínimos cuadrados o un suavizado de
+Holt. Con el nivel y la pendiente de cada serie se estima cuánto falta para que cruce el
+límite del nivel "medium" y, si es dentro de `FORECAST_HORIZON_MINUTES`, se crea una
+alerta con `is_predicted=True` y la hora estimada en `breach_eta`.
+
+Uso manual (una corrida):
+    python -m app.services.forecast [--dry-run]
+"""
+import argparse
+import json
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select, text, true
+from sqlalchemy.orm import Session
+
+from app.api.v1.endpoints.metrics import DEFAULT_THRESHOLDS, _alert_event
+from app.core.config import settings
+from app.core.instrumentation import FORECAST_RUN_DURATION, PREDICTED_ALERTS
+from app.db.models.alert import Alert
+from app.db.models.building import Building
+from app.db.models.enums import AlertLevel, AlertStatus, Variable
+from app.db.models.floor import Floor
+from app.db.models.metric import Metric
+from app.db.models.threshold import Threshold
+from app.services.data_version import data_versions
+from app.services.realtime_hub import realtime_hub
+
+logger = logging.getLogger(__name__)
+
+# Clave del advisory lock: con varios workers, solo uno corre el pronóstico a la vez
+LOCK_KEY = 0x5F10C457
+
+# Límites del nivel "medium" (ver `_evaluate_temperature` y `_evaluate_humidity`).
+# Temperatura no tiene límite inferior; energía usa la banda activa de cada piso.
+TEMP_MEDIUM = (-np.inf, 28.0)
+HUMIDITY_MEDIUM = (22.0, 75.0)
+
+_COLUMNS = {
+    Variable.temperature: "temp_c",
+    Variable.humidity: "humidity_pct",
+    Variable.energy: "energy_kw",
+}
+_UNITS = {Variable.temperature: "°C", Variable.humidity: "%", Variable.energy: " kW"}
+_NAMES = {Variable.temperature: "Temperatura", Variable.humidity: "Humedad", Variable.energy: "Consumo de energía"}
+
+
+# ============================================================
+# Carga de series (una consulta)
+# ============================================================
+
+class SeriesBatch:
+    """
+    Lecturas recientes de todos los pisos como matrices pisos × `points`, de la más
+    antigua a la más nueva. Los tiempos están en horas relativas a la última lectura
+    de cada piso (la última columna válida vale 0); los huecos son NaN.
+    """
+
+    def __init__(self, floor_ids, codes, numbers, last_time, hours, values):
+        self.floor_ids: np.ndarray = floor_ids
+        self.codes: List[str] = codes
+        self.numbers: List[int] = numbers
+        self.last_time: np.ndarray = last_time          # epoch (s) de la última lectura
+        self.hours: np.ndarray = hours
+        self.values: Dict[Variable, np.ndarray] = values
+
+    def __len__(self) -> int:
+        return len(self.floor_ids)
+
+
+def load_series(db: Session, points: int, since: datetime) -> SeriesBatch:
+    """LATERAL por piso sobre el índice (floor_id, time), igual que `detector_state.rebuild`."""
+    recent = (
+        select(Metric.time, Metric.temp_c, Metric.humidity_pct, Metric.energy_kw)
+        .where(Metric.floor_id == Floor.id, Metric.time >= since)
+        .order_by(Metric.time.desc())
+        .limit(points)
+        .lateral("recent")
+    )
+    stmt = (
+        select(
+            Floor.id, Building.code, Floor.number,
+            recent.c.time, recent.c.temp_c, recent.c.humidity_pct, recent.c.energy_kw,
+        )
+        .select_from(Floor)
+        .join(Building, Building.id == Floor.building_id)
+        .join(recent, true())
+        .order_by(Floor.id, recent.c.time)
+    )
+    rows = db.execute(stmt).all()
+    if not rows:
+        empty = np.empty((0, points))
+        return SeriesBatch(np.empty(0, dtype=np.int64), [], [], np.empty(0), empty, {v: empty for v in _COLUMNS})
+
+    ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    epoch = np.fromiter((r[3].timestamp() for r in rows), dtype=np.float64, count=len(rows))
+    floor_ids, first, counts = np.unique(ids, return_index=True, return_counts=True)
+    row = np.repeat(np.arange(len(floor_ids)), counts)
+    # Alineadas a la derecha: la lectura más nueva de cada piso queda en la última columna
+    col = np.arange(len(rows)) - np.repeat(first, counts) + np.repeat(points - counts, counts)
+    last_time = epoch[first + counts - 1]
+
+    hours = np.full((len(floor_ids), points), np.nan)
+    hours[row, col] = (epoch - last_time[row]) / 3600.0
+    values = {}
+    for i, variable in enumerate(_COLUMNS, start=4):
+        matrix = np.full((len(floor_ids), points), np.nan)
+        matrix[row, col] = np.array([np.nan if r[i] is None else float(r[i]) for r in rows])
+        values[variable] = matrix
+
+    return SeriesBatch(
+        floor_ids,
+        [rows[i][1] for i in first],
+        [rows[i][2] for i in first],
+        last_time,
+        hours,
+        values,
+    )
+
+
+def _energy_bands(db: Session, floor_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(lo, hi) de energía por piso: umbral activo o el valor por defecto"""
+    lo_default, hi_default = DEFAULT_THRESHOLDS[Variable.energy]
+    lo = np.full(len(floor_ids), lo_default)
+    hi = np.full(len(floor_ids), hi_default)
+    rows = (
+        db.query(Threshold.floor_id, Threshold.lower, Threshold.upper)
+        .filter(Threshold.variable == Variable.energy, Threshold.is_active == True)
+        .all()
+    )
+    index = {int(f): i for i, f in enumerate(floor_ids)}
+    for floor_id, lower, upper in rows:
+        i = index.get(floor_id)
+        if i is not None:
+            lo[i], hi[i] = float(lower), float(upper)
+    return lo, hi
+
+
+# ============================================================
+# Modelos (vectorizados sobre todos los pisos)
+# ============================================================
+
+def linear_trend(hours: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Recta de mínimos cuadrados por fila ignorando NaN.
+    Devuelve (nivel en la última lectura, pendiente por hora, puntos usados).
+    """
+    mask = ~(np.isnan(hours) | np.isnan(values))
+    n = mask.sum(axis=1)
+    t = np.where(mask, hours, 0.0)
+    x = np.where(mask, values, 0.0)
+    st, sx = t.sum(axis=1), x.sum(axis=1)
+    stt, stx = (t * t).sum(axis=1), (t * x).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        denom = n * stt - st * st
+        slope = np.where(np.abs(denom) > 1e-12, (n * stx - st * sx) / denom, np.nan)
+        # t = 0 es la última lectura: el nivel es el intercepto
+        level = (sx - slope * st) / n
+    return level, slope, n
+
+
+def holt_trend(
+    hours: np.ndarray, values: np.ndarray, alpha: float, beta: float
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Suavizado exponencial doble (Holt) con intervalos irregulares: recorre las columnas
+    una vez y actualiza todos los pisos en paralelo. La tendencia queda en unidades/hora.
+    """
+    rows, cols = values.shape
+    level = np.full(rows, np.nan)
+    slope = np.zeros(rows)
+    prev_t = np.full(rows, np.nan)
+    n = np.zeros(rows, dtype=np.int64)
+    for j in range(cols):
+        t, x = hours[:, j], values[:, j]
+        valid = ~(np.isnan(t) | np.isnan(x))
+        first = valid & (n == 0)
+        level = np.where(first, x, level)
+        prev_t = np.where(first, t, prev_t)
+
+        step = valid & (n > 0)
+        dt = np.where(step, t - prev_t, 1.0)
+        dt = np.where(dt > 0, dt, 1e-6)
+        predicted = level + slope * dt
+        new_level = alpha * x + (1.0 - alpha) * predicted
+        raw_slope = (new_level - level) / dt
+        # La primera diferencia inicializa la tendencia
+        new_slope = np.where(n == 1, raw_slope, beta * raw_slope + (1.0 - beta) * slope)
+        level = np.where(step, new_level, level)
+        slope = np.where(step, new_slope, slope)
+        prev_t = np.where(step, t, prev_t)
+        n += valid
+    slope = np.where(n >= 2, slope, np.nan)
+    return level, slope, n
+
+
+def hours_to_breach(level: np.ndarray, slope: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    """Horas hasta salir de [lo, hi] siguiendo la pendiente; inf si no sale."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        up = np.where(slope > 0, (hi - level) / slope, np.inf)
+        down = np.where(slope < 0, (lo - level) / slope, np.inf)
+    out = np.minimum(up, down)
+    return np.where(np.isnan(out), np.inf, out)
+
+
+# ============================================================
+# Corrida
+# ============================================================
+
+def _bands(batch: SeriesBatch, variable: Variable, energy: Tuple[np.ndarray, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    size = len(batch)
+    if variable == Variable.temperature:
+        return np.full(size, TEMP_MEDIUM[0]), np.full(size, TEMP_MEDIUM[1])
+    if variable == Variable.humidity:
+        return np.full(size, HUMIDITY_MEDIUM[0]), np.full(size, HUMIDITY_MEDIUM[1])
+    return energy
+
+
+def _recommendation(variable: Variable, floor_number: int, rising: bool, bound: float, eta: datetime) -> str:
+    hora = eta.astimezone(timezone.utc).strftime("%H:%M UTC")
+    if variable == Variable.temperature:
+        return f"Anticipar enfriamiento del Piso {floor_number}: revisar climatización y ventilación antes de las {hora}."
+    if variable == Variable.humidity:
+        action = "deshumidificación" if rising else "humidificación"
+        return f"Ajustar {action} del Piso {floor_number} antes de las {hora} para mantener la humedad en rango."
+    return f"Revisar cargas del Piso {floor_number} antes de las {hora} para no superar {bound:g} kW."
+
+
+def _open_recent_alerts(db: Session, now: datetime) -> set[tuple[int, Variable]]:
+    """Misma regla que `_should_create_alert`: una alerta abierta en 30 min bloquea otra"""
+    rows = (
+        db.query(Alert.floor_id, Alert.variable)
+        .filter(Alert.status == AlertStatus.open, Alert.created_at >= now - timedelta(minutes=30))
+        .distinct()
+        .all()
+    )
+    return {(r.floor_id, r.variable) for r in rows}
+
+
+def predict_breaches(
+    db: Session,
+    now: Optional[datetime] = None,
+    method: Optional[str] = None,
+    horizon_minutes: Optional[float] = None,
+) -> Tuple[SeriesBatch, List[dict]]:
+    """Calcula los cruces esperados dentro del horizonte (no escribe nada)."""
+    now = now or datetime.now(timezone.utc)
+    method = method or settings.FORECAST_METHOD
+    horizon = (horizon_minutes or settings.FORECAST_HORIZON_MINUTES) / 60.0
+
+    since = now - timedelta(minutes=settings.FORECAST_LOOKBACK_MINUTES)
+    batch = load_series(db, settings.FORECAST_POINTS, since)
+    if not len(batch):
+        return batch, []
+    energy = _energy_bands(db, batch.floor_ids)
+    # Antigüedad de la última lectura: el cruce se cuenta desde ahora, no desde ella
+    age = (now.timestamp() - batch.last_time) / 3600.0
+
+    out: List[dict] = []
+    for variable in _COLUMNS:
+        values = batch.values[variable]
+        if method == "holt":
+            level, slope, n = holt_trend(batch.hours, values, settings.FORECAST_HOLT_ALPHA, settings.FORECAST_HOLT_BETA)
+        else:
+            level, slope, n = linear_trend(batch.hours, values)
+        lo, hi = _bands(batch, variable, energy)
+        latest = values[:, -1]
+
+        ttb = hours_to_breach(level, slope, lo, hi) - age
+        # Solo series con datos suficientes que todavía están dentro de la banda:
+        # las que ya la cruzaron las cubre la detección de la ingesta
+        candidates = (
+            (n >= settings.FORECAST_MIN_POINTS)
+            & (latest >= lo) & (latest <= hi)
+            & (ttb > 0) & (ttb <= horizon)
+        )
+        for i in np.flatnonzero(candidates):
+            rising = bool(slope[i] > 0)
+            out.append({
+                "floor_id": int(batch.floor_ids[i]),
+                "edificio": batch.codes[i],
+                "piso": batch.numbers[i],
+                "variable": variable,
+                "value": float(latest[i]),
+                "rate_per_hour": float(slope[i]),
+                "bound": float(hi[i] if rising else lo[i]),
+                "rising": rising,
+                "eta": now + timedelta(hours=float(ttb[i])),
+            })
+    return batch, out
+
+
+def run_forecast(db: Session, **kwargs) -> dict:
+    """
+    Una corrida completa: pronostica y crea las alertas predictivas. Toma un advisory
+    lock de transacción; si otro worker ya está corriendo, devuelve sin hacer nada.
+    """
+    start = time.perf_counter()
+    now = kwargs.pop("now", None) or datetime.now(timezone.utc)
+    if not db.execute(text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": LOCK_KEY}).scalar():
+        db.rollback()
+        return {"skipped": "locked"}
+
+    batch, breaches = predict_breaches(db, now=now, **kwargs)
+    blocked = _open_recent_alerts(db, now)
+    pending = [b for b in breaches if (b["floor_id"], b["variable"]) not in blocked]
+
+    alerts: List[Alert] = []
+    for b in pending:
+        minutes = max(1, round((b["eta"] - now).total_seconds() / 60))
+        unit = _UNITS[b["variable"]]
+        alerts.append(Alert(
+            created_at=now,
+            floor_id=b["floor_id"],
+            variable=b["variable"],
+            level=AlertLevel.medium,
+            status=AlertStatus.open,
+            message=(
+                f"Pronóstico: {_NAMES[b['variable']].lower()} llegaría a {b['bound']:g}{unit} "
+                f"en ~{minutes} min (actual {b['value']:g}{unit}, {b['rate_per_hour']:+.2f}{unit}/h)"
+            )[:300],
+            recommendation=_recommendation(b["variable"], b["piso"], b["rising"], b["bound"], b["eta"]),
+            is_predicted=True,
+            breach_eta=b["eta"],
+        ))
+    db.add_all(alerts)
+    db.flush()
+    # Eventos antes del commit: después los atributos expiran y cada uno sería un SELECT
+    events = [(b, _alert_event(a, b["piso"])) for b, a in zip(pending, alerts)]
+    db.commit()
+
+    touched: Dict[str, set] = {}
+    for b, event in events:
+        touched.setdefault(b["edificio"], set()).add(b["piso"])
+        PREDICTED_ALERTS.labels(variable=b["variable"].value).inc()
+        if realtime_hub.has_subscribers(b["edificio"]):
+            realtime_hub.publish(b["edificio"], b["piso"], "alerta", event)
+    for edificio, pisos in touched.items():
+        data_versions.bump(edificio, pisos)
+
+    elapsed = time.perf_counter() - start
+    FORECAST_RUN_DURATION.observe(elapsed)
+    return {
+        "floors": len(batch),
+        "predicted": len(breaches),
+        "created": len(alerts),
+        "skipped_recent": len(breaches) - len(pending),
+        "seconds": round(elapsed, 4),
+    }
+
+
+def run_scheduled() -> None:
+    """Entrada del ciclo periódico del lifespan (corre en un hilo). Un shard tras otro."""
+    from app.db.shards import shard_router
+
+    for shard in shard_router.shards:
+        try:
+            with shard.session() as db:
+                result = run_forecast(db)
+        except Exception as e:
+            logger.error(f"❌ Error en el pronóstico de alertas ({shard.name}): {e}")
+            continue
+        if result.get("created"):
+            logger.info(f"🔮 Pronóstico: {result['created']} alerta(s) predictiva(s) en {result['floors']} pisos ({result['seconds']}s)")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from app.db.shards import shard_router
+
+    parser = argparse.ArgumentParser(description="Corre una vez el pronóstico de alertas")
+    parser.add_argument("--method", choices=("linear", "holt"), default=None)
+    parser.add_argument("--horizon", type=float, default=None, help="horizonte en minutos")
+    parser.add_argument("--dry-run", action="store_true", help="solo calcula, no crea alertas")
+    args = parser.parse_args(argv)
+
+    for shard in shard_router.shards:
+        with shard.session() as db:
+            if args.dry_run:
+                _, breaches = predict_breaches(db, method=args.method, horizon_minutes=args.horizon)
+                for b in breaches:
+                    print(json.dumps({**b, "variable": b["variable"].value, "eta": b["eta"].isoformat()}, ensure_ascii=False))
+                continue
+            result = run_forecast(db, method=args.method, horizon_minutes=args.horizon)
+        print(json.dumps({"shard": shard.name, **result} if shard_router.sharded else result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,68 @@
-import google.generativeai as genai
 from typing import Optional, Dict
 import logging
+import os
+import threading
+import time
 from app.core.config import settings
+from app.core.instrumentation import GEMINI_REQUEST_DURATION, RECOMMENDATION_FALLBACKS
 from app.db.models.enums import Variable, AlertLevel
 
 logger = logging.getLogger(__name__)
 
+
+def _genai():
+    """
+    google.generativeai arrastra gRPC y protos (~1 s de import): se carga al configurar
+    el cliente, no al importar la aplicación.
+    """
+    import google.generativeai as genai
+    return genai
+
+
 class GeminiService:
     def __init__(self):
         self.model = None
         self.is_available = False
         self.model_name = None
-        
+        self._configured = False
+        self._lock = threading.Lock()
+        # Un proceso hijo no puede reutilizar los canales gRPC del padre
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self.model = None
+        self.is_available = False
+        self.model_name = None
+        self._configured = False
+        self._lock = threading.Lock()
+
+    def ensure_configured(self) -> None:
+        """Configura el cliente una sola vez por proceso (al arrancar el worker o en el primer uso)."""
+        if self._configured:
+            return
+        with self._lock:
+            if not self._configured:
+                self.configure()
+                self._configured = True
+
+    def configure(self) -> None:
+        """
+        Configura el cliente y elige un modelo que responda. Si el launcher ya lo resolvió
+        en el proceso principal (`GEMINI_RESOLVED_MODEL`) se usa directamente, sin repetir
+        las llamadas de prueba en cada worker.
+        """
         # Verificar si la API key está configurada (no vacía)
         if settings.GEMINI_API_KEY and settings.GEMINI_API_KEY.strip():
             try:
+                genai = _genai()
                 genai.configure(api_key=settings.GEMINI_API_KEY.strip())
+
+                if settings.GEMINI_RESOLVED_MODEL:
+                    self.model = genai.GenerativeModel(settings.GEMINI_RESOLVED_MODEL)
+                    self.is_available = True
+                    self.model_name = settings.GEMINI_RESOLVED_MODEL
+                    logger.info(f"✅ Gemini AI configurado con modelo: {self.model_name}")
+                    return
                 
                 # Modelos disponibles en versión gratuita (en orden de preferencia)
                 available_models = [
@@ -90,6 +137,7 @@ class GeminiService:
         """
         Genera una recomendación accionable usando Gemini AI
         """
+        self.ensure_configured()
         if not self.is_available or not self.model:
             logger.debug("Usando recomendación de fallback (Gemini no disponible)")
             return self._fallback_recommendation(variable, level, floor_number, current_value)
@@ -117,6 +165,12 @@ class GeminiService:
                 context_text = "\n- Tendencia: Los valores están aumentando."
             elif historical_context.get("trend") == "decreasing":
                 context_text = "\n- Tendencia: Los valores están disminuyendo."
+            rate = historical_context.get("rate_per_hour")
+            if rate is not None:
+                context_text += f"\n- Ritmo de cambio: {rate:+.2f}{unit} por hora."
+            zscore = historical_context.get("zscore")
+            if zscore is not None and abs(zscore) >= 2:
+                context_text += f"\n- Desviación: {abs(zscore):.1f} desvíos {'por encima' if zscore > 0 else 'por debajo'} de lo habitual en este piso."
         
         # Prompt mejorado para Gemini
         prompt = f"""Eres un experto en gestión de edificios inteligentes. Genera UNA SOLA recomendación clara, específica y accionable.
@@ -143,6 +197,8 @@ Ejemplos de formato correcto:
 
 Genera SOLO la recomendación (sin comillas, sin explicaciones):"""
 
+        genai = _genai()
+        started = time.perf_counter()
         try:
             logger.debug(f"Generando recomendación con Gemini ({self.model_name}) para Piso {floor_number}, {variable_name} = {current_value}{unit}")
             response = self.model.generate_content(
@@ -175,6 +231,7 @@ Genera SOLO la recomendación (sin comillas, sin explicaciones):"""
             
             # Verificar finish_reason antes de acceder a response.text
             if not response.candidates:
+                GEMINI_REQUEST_DURATION.labels(outcome="no_candidates").observe(time.perf_counter() - started)
                 logger.warning("No se recibieron candidatos en la respuesta de Gemini")
                 return self._fallback_recommendation(variable, level, floor_number, current_value)
             
@@ -192,6 +249,7 @@ Genera SOLO la recomendación (sin comillas, sin explicaciones):"""
             }
             
             reason_name = finish_reasons.get(finish_reason, f"UNKNOWN({finish_reason})")
+            GEMINI_REQUEST_DURATION.labels(outcome=reason_name.lower()).observe(time.perf_counter() - started)
             
             if finish_reason != 1:  # Si no es STOP (éxito)
                 logger.warning(f"⚠️ Gemini finish_reason: {reason_name} ({finish_reason})")
@@ -230,6 +288,7 @@ Genera SOLO la recomendación (sin comillas, sin explicaciones):"""
             return recommendation
             
         except ValueError as e:
+            GEMINI_REQUEST_DURATION.labels(outcome="error").observe(time.perf_counter() - started)
             # Manejar específicamente el error de response.text
             if "finish_reason" in str(e) or "Part" in str(e):
                 logger.warning(f"⚠️ Respuesta bloqueada o incompleta de Gemini: {e}")
@@ -237,6 +296,7 @@ Genera SOLO la recomendación (sin comillas, sin explicaciones):"""
                 return self._fallback_recommendation(variable, level, floor_number, current_value)
             raise
         except Exception as e:
+            GEMINI_REQUEST_DURATION.labels(outcome="error").observe(time.perf_counter() - started)
             logger.error(f"❌ Error generando recomendación con Gemini: {type(e).__name__}: {e}")
             logger.debug(f"Detalles del error: {str(e)}")
             # Si el error es de modelo no encontrado, marcar como no disponible
@@ -253,34 +313,11 @@ Genera SOLO la recomendación (sin comillas, sin explicaciones):"""
         current_value: float
     ) -> str:
         """Recomendaciones de respaldo si Gemini no está disponible"""
-        if variable == Variable.temperature:
-            if level == AlertLevel.critical:
-                return f"Ajustar setpoint del Piso {floor_number} a 24°C en los próximos 15 min."
-            elif level == AlertLevel.medium:
-                return f"Revisar sistema de climatización del Piso {floor_number} en la próxima hora."
-            else:
-                return f"Monitorear temperatura del Piso {floor_number}."
-        
-        elif variable == Variable.humidity:
-            if level == AlertLevel.critical:
-                if current_value > 80:
-                    return f"Activar deshumidificación del Piso {floor_number} inmediatamente."
-                else:
-                    return f"Activar humidificación del Piso {floor_number} inmediatamente."
-            elif level == AlertLevel.medium:
-                return f"Ajustar control de humedad del Piso {floor_number} en la próxima hora."
-            else:
-                return f"Verificar humedad del Piso {floor_number}."
-        
-        elif variable == Variable.energy:
-            if level == AlertLevel.critical:
-                return f"Redistribuir carga eléctrica del Piso {floor_number} en la próxima hora."
-            elif level == AlertLevel.medium:
-                return f"Revisar consumo energético del Piso {floor_number}."
-            else:
-                return f"Monitorear energía del Piso {floor_number}."
-        
-        return f"Revisar {variable.value} del Piso {floor_number}."
+        # Import diferido: app.services.recommendations construye su proveedor al importarse
+        from app.services.recommendations import rules_recommendation
+
+        RECOMMENDATION_FALLBACKS.inc()
+        return rules_recommendation(variable, level, floor_number, current_value)
 
 
 gemini_service = GeminiService()
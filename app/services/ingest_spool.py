@@ -0,0 +1,313 @@
+"""
+Spool local de ingesta (write-ahead) para sobrevivir caídas o bloqueos de PostgreSQL.
+
+Si la base no responde al escribir un lote, el lote se agrega a un segmento en disco local
+y se confirma al gateway con 202 en vez de fallar. Mientras quede algo en el spool, los
+lotes nuevos también van al spool, así se reaplican en el orden en que llegaron.
+
+Un replayer en segundo plano (`replay`) lee los segmentos en orden, junta los registros en
+lotes grandes (`INGEST_SPOOL_REPLAY_BATCH` lecturas) y los escribe con la ingesta normal.
+Un segmento se borra recién cuando todos sus lotes quedaron confirmados en la base: si el
+proceso muere a mitad, se reaplica entero, lo cual es seguro porque la ingesta es idempotente.
+
+Formato de un segmento (`<secuencia>.seg`): registros `SFSP | largo (u32) | crc32 (u32) | JSON`.
+Un registro truncado (p. ej. por un corte de luz a mitad de la escritura) o con crc inválido
+corta la lectura del segmento, que se renombra a `.corrupt` para revisarlo a mano. Un
+registro que la base rechaza por sus datos (no por estar caída) se aparta en
+`<segmento>.rejected`, con el mismo formato, y el replay sigue con el resto.
+
+Cada worker toma con `flock` un subdirectorio libre (`w0`, `w1`, ...): no hay dos procesos
+escribiendo el mismo segmento, y al reiniciar cada worker retoma el spool que dejó uno anterior.
+"""
+import fcntl
+import json
+import logging
+import os
+import struct
+import threading
+import zlib
+from datetime import datetime
+from decimal import Decimal
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.instrumentation import INGEST_SPOOL_BYTES, INGEST_SPOOL_CORRUPT, INGEST_SPOOL_ROWS
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SFSP"
+_HEADER = struct.Struct("<4sII")
+_FIELDS = ("edificio", "piso", "time", "temp_c", "humidity_pct", "energy_kw")
+
+
+class SpoolFull(Exception):
+    """El spool llegó a `INGEST_SPOOL_MAX_BYTES`: no se aceptan más lotes hasta que se drene."""
+
+
+class CorruptSegment(Exception):
+    """Registro truncado, con marca inválida o con crc que no coincide."""
+
+
+def _encode(readings: List[dict], mode: str, source: str) -> bytes:
+    rows = [
+        [r["edificio"], r["piso"], r["time"].isoformat(), r["temp_c"], r["humidity_pct"], r["energy_kw"]]
+        for r in readings
+    ]
+    # Los Decimal van como texto para no perder precisión
+    payload = json.dumps({"mode": mode, "source": source, "rows": rows}, separators=(",", ":"), default=str).encode()
+    return _HEADER.pack(MAGIC, len(payload), zlib.crc32(payload)) + payload
+
+
+def _decode(payload: bytes) -> Tuple[str, List[dict]]:
+    record = json.loads(payload)
+    readings = []
+    for row in record["rows"]:
+        r = dict(zip(_FIELDS, row))
+        r["time"] = datetime.fromisoformat(r["time"])
+        for key in _FIELDS[3:]:
+            if isinstance(r[key], str):
+                r[key] = Decimal(r[key])
+        readings.append(r)
+    return record["mode"], readings
+
+
+def read_segment(path: str) -> Iterator[Tuple[str, List[dict]]]:
+    """(modo, lecturas) por registro. Lanza CorruptSegment ante un registro truncado o corrupto."""
+    with open(path, "rb") as f:
+        offset = 0
+        while True:
+            header = f.read(_HEADER.size)
+            if not header:
+                return
+            if len(header) < _HEADER.size:
+                raise CorruptSegment(f"encabezado truncado en el byte {offset}")
+            magic, length, crc = _HEADER.unpack(header)
+            if magic != MAGIC:
+                raise CorruptSegment(f"marca inválida en el byte {offset}")
+            payload = f.read(length)
+            if len(payload) < length:
+                raise CorruptSegment(f"registro truncado en el byte {offset}")
+            if zlib.crc32(payload) != crc:
+                raise CorruptSegment(f"crc inválido en el byte {offset}")
+            offset += _HEADER.size + length
+            yield _decode(payload)
+
+
+class IngestSpool:
+    def __init__(
+        self,
+        root: str,
+        segment_bytes: int,
+        max_bytes: int,
+        replay_batch: int,
+        fsync: bool = True,
+    ):
+        self.root = root
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.replay_batch = replay_batch
+        self.fsync = fsync
+        self.directory: Optional[str] = None
+        self._lock_file = None
+        self._lock = threading.Lock()
+        self._active = None          # archivo del segmento en escritura
+        self._active_path: Optional[str] = None
+        self._seq = 0
+        self._bytes = 0              # bytes en disco de todos los segmentos
+        self._segments: List[str] = []  # segmentos cerrados, en orden
+
+    # ---------------------------------------------------------- apertura
+
+    def open(self) -> None:
+        """Toma un subdirectorio libre y carga los segmentos que haya dejado otro proceso."""
+        os.makedirs(self.root, exist_ok=True)
+        index = 0
+        while True:
+            lock_file = open(os.path.join(self.root, f"w{index}.lock"), "w")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                lock_file.close()
+                index += 1
+        self._lock_file = lock_file
+        self.directory = os.path.join(self.root, f"w{index}")
+        os.makedirs(self.directory, exist_ok=True)
+
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(".seg"))
+        self._segments = [os.path.join(self.directory, n) for n in names]
+        self._bytes = sum(os.path.getsize(p) for p in self._segments)
+        self._seq = int(names[-1].split(".")[0]) if names else 0
+        INGEST_SPOOL_BYTES.set(self._bytes)
+        if self._segments:
+            logger.info(f"📼 Spool de ingesta con {len(self._segments)} segmento(s) pendiente(s) en {self.directory}")
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_active()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    # ---------------------------------------------------------- escritura
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    @property
+    def pending(self) -> bool:
+        """Hay lotes sin reaplicar (los lotes nuevos deben ir detrás de ellos)"""
+        return bool(self._segments) or self._active is not None
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def _close_active(self) -> None:
+        if self._active is None:
+            return
+        self._active.close()
+        self._segments.append(self._active_path)
+        self._active = self._active_path = None
+
+    def append(self, readings: List[dict], mode: str, source: str) -> None:
+        """Agrega un lote al segmento activo; vuelve cuando está en disco (fsync)."""
+        record = _encode(readings, mode, source)
+        with self._lock:
+            if self._bytes + len(record) > self.max_bytes:
+                raise SpoolFull(f"spool lleno ({self._bytes} bytes)")
+            if self._active is not None and self._active.tell() + len(record) > self.segment_bytes:
+                self._close_active()
+            if self._active is None:
+                self._seq += 1
+                self._active_path = os.path.join(self.directory, f"{self._seq:016d}.seg")
+                self._active = open(self._active_path, "ab")
+            self._active.write(record)
+            self._active.flush()
+            if self.fsync:
+                os.fsync(self._active.fileno())
+            self._bytes += len(record)
+        INGEST_SPOOL_BYTES.set(self._bytes)
+        INGEST_SPOOL_ROWS.labels("spooled").inc(len(readings))
+
+    # ---------------------------------------------------------- replay
+
+    def _batches(self, path: str) -> Iterator[Tuple[str, List[dict], List[List[dict]]]]:
+        """
+        Registros consecutivos del mismo modo unidos en lotes de hasta `replay_batch` lecturas.
+        Cada lote trae también sus registros originales, por si hay que escribirlos por separado.
+        """
+        mode, batch, records = None, [], []
+        try:
+            for record_mode, readings in read_segment(path):
+                if batch and (record_mode != mode or len(batch) + len(readings) > self.replay_batch):
+                    yield mode, batch, records
+                    batch, records = [], []
+                mode = record_mode
+                batch.extend(readings)
+                records.append(readings)
+        except CorruptSegment:
+            # Lo leído antes del registro dañado se escribe igual
+            if batch:
+                yield mode, batch, records
+            raise
+        if batch:
+            yield mode, batch, records
+
+    def _reject(self, path: str, readings: List[dict], mode: str, error: Exception) -> int:
+        """Aparta un registro que la base rechaza por sus datos en `<segmento>.rejected`"""
+        with open(path + ".rejected", "ab") as f:
+            f.write(_encode(readings, mode, "rejected"))
+        INGEST_SPOOL_ROWS.labels("rejected").inc(len(readings))
+        detail = str(getattr(error, "orig", error)).strip()
+        logger.error(f"❌ Spool de ingesta: {len(readings)} lecturas rechazadas apartadas en {path}.rejected: {detail}")
+        return len(readings)
+
+    def _write_batch(
+        self,
+        path: str,
+        mode: str,
+        batch: List[dict],
+        records: List[List[dict]],
+        write: Callable[[List[dict], str], None],
+        retry_on: Tuple[type, ...],
+    ) -> int:
+        """Escribe un lote; retorna las lecturas apartadas"""
+        try:
+            write(batch, mode)
+            return 0
+        except retry_on:
+            raise
+        except Exception as e:
+            if len(records) == 1:
+                return self._reject(path, batch, mode, e)
+        # El lote unido falló por sus datos: registro por registro, así solo se aparta el malo
+        rejected = 0
+        for readings in records:
+            try:
+                write(readings, mode)
+            except retry_on:
+                raise
+            except Exception as e:
+                rejected += self._reject(path, readings, mode, e)
+        return rejected
+
+    def replay(
+        self,
+        write: Callable[[List[dict], str], None],
+        stop: Optional[threading.Event] = None,
+        retry_on: Tuple[type, ...] = (Exception,),
+    ) -> int:
+        """
+        Reaplica los segmentos en orden con `write(lecturas, modo)`. Un error de `retry_on`
+        (la base sigue caída) sube y el segmento queda para el próximo intento; cualquier otro
+        error (datos, restricciones, edificio borrado) aparta ese registro en `.rejected` y se
+        sigue drenando. Retorna las lecturas reaplicadas.
+        """
+        replayed = 0
+        while True:
+            with self._lock:
+                if not self._segments:
+                    # Lo escrito mientras se reaplicaba pasa a ser el próximo segmento
+                    self._close_active()
+                if not self._segments:
+                    return replayed
+                path = self._segments[0]
+
+            try:
+                for mode, batch, records in self._batches(path):
+                    if stop is not None and stop.is_set():
+                        return replayed
+                    written = len(batch) - self._write_batch(path, mode, batch, records, write, retry_on)
+                    replayed += written
+                    INGEST_SPOOL_ROWS.labels("replayed").inc(written)
+            except CorruptSegment as e:
+                # Lo anterior al registro dañado ya se escribió; el resto se aparta
+                INGEST_SPOOL_CORRUPT.inc()
+                logger.error(f"❌ Segmento de spool dañado {path}: {e}")
+                os.replace(path, path + ".corrupt")
+            else:
+                os.remove(path)
+
+            with self._lock:
+                self._segments.pop(0)
+                self._bytes = sum(os.path.getsize(p) for p in self._segments)
+                if self._active is not None:
+                    self._bytes += self._active.tell()
+            INGEST_SPOOL_BYTES.set(self._bytes)
+
+
+def build_spool() -> IngestSpool:
+    s = settings
+    return IngestSpool(
+        root=s.INGEST_SPOOL_DIR,
+        segment_bytes=s.INGEST_SPOOL_SEGMENT_BYTES,
+        max_bytes=s.INGEST_SPOOL_MAX_BYTES,
+        replay_batch=s.INGEST_SPOOL_REPLAY_BATCH,
+        fsync=s.INGEST_SPOOL_FSYNC,
+    )
+
+
+# Se abre en el lifespan de cada worker (si INGEST_SPOOL_ENABLED)
+ingest_spool = build_spool()
@@ -0,0 +1,143 @@
+import asyncio
+import os
+import threading
+import time
+import logging
+from typing import Callable, List, Optional, Dict, Set, Tuple
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """
+    Suscripción de un cliente (WebSocket o SSE) a un edificio, opcionalmente filtrada por piso.
+    Cada suscripción tiene su propio buffer acotado: si el cliente no consume a tiempo
+    se descartan los eventos más antiguos y se le notifica cuántos se perdieron.
+    """
+
+    def __init__(self, edificio: str, piso: Optional[int], maxsize: int):
+        self.edificio = edificio
+        self.piso = piso
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def matches(self, piso: Optional[int]) -> bool:
+        return self.piso is None or piso is None or self.piso == piso
+
+    def _offer(self, event: dict) -> None:
+        # Se ejecuta siempre en el loop del cliente (call_soon_threadsafe)
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Siguiente evento, o None si vence el timeout (para heartbeats)."""
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            return {"tipo": "desborde", "edificio": self.edificio, "piso": self.piso, "data": {"descartados": dropped}}
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class RealtimeHub:
+    """
+    Pub/sub en proceso para empujar lecturas, cambios de estado de tarjetas y alertas
+    a los dashboards suscritos. `publish` es thread-safe: se llama desde los endpoints
+    síncronos (threadpool) después del commit.
+
+    Con varios workers, los eventos se reenvían a los demás procesos (forwarders) y cada
+    worker anuncia los edificios en los que tiene suscriptores (`remote_interest`), así la
+    ingesta sabe si vale la pena construir eventos aunque el suscriptor esté en otro proceso.
+    """
+
+    def __init__(self, buffer_size: int = 256):
+        self.buffer_size = buffer_size
+        self._forwarders: List[Callable[[str, Optional[int], str, dict], None]] = []
+        self._interest_listeners: List[Callable[[str], None]] = []
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self._subs: Dict[str, Set[Subscription]] = {}
+        self._card_state: Dict[Tuple[str, int], str] = {}
+        self._remote_interest: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add_forwarder(self, forwarder: Callable[[str, Optional[int], str, dict], None]) -> None:
+        """Callback (edificio, piso, tipo, data) para los eventos publicados en este proceso."""
+        self._forwarders.append(forwarder)
+
+    def add_interest_listener(self, listener: Callable[[str], None]) -> None:
+        """Callback (edificio) cuando un edificio recibe su primer suscriptor local."""
+        self._interest_listeners.append(listener)
+
+    def local_buildings(self) -> List[str]:
+        with self._lock:
+            return list(self._subs)
+
+    def remote_interest(self, edificios: List[str], ttl: float) -> None:
+        """Otro worker tiene suscriptores en `edificios` (válido por `ttl` segundos)."""
+        expires_at = time.monotonic() + ttl
+        with self._lock:
+            for edificio in edificios:
+                self._remote_interest[edificio] = expires_at
+
+    def subscribe(self, edificio: str, piso: Optional[int] = None) -> Subscription:
+        sub = Subscription(edificio, piso, self.buffer_size)
+        with self._lock:
+            first = edificio not in self._subs
+            self._subs.setdefault(edificio, set()).add(sub)
+        if first:
+            for listener in self._interest_listeners:
+                listener(edificio)
+        logger.debug(f"Nueva suscripción en tiempo real: edificio={edificio} piso={piso}")
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            subs = self._subs.get(sub.edificio)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.edificio]
+
+    def _has_remote(self, edificio: str) -> bool:
+        return self._remote_interest.get(edificio, 0.0) > time.monotonic()
+
+    def has_subscribers(self, edificio: str) -> bool:
+        return bool(self._subs.get(edificio)) or self._has_remote(edificio)
+
+    def publish(self, edificio: str, piso: Optional[int], tipo: str, data: dict, forward: bool = True) -> None:
+        if forward and self._has_remote(edificio):
+            for forwarder in self._forwarders:
+                forwarder(edificio, piso, tipo, data)
+        with self._lock:
+            targets = [s for s in self._subs.get(edificio, ()) if s.matches(piso)]
+        if not targets:
+            return
+        event = {"tipo": tipo, "edificio": edificio, "piso": piso, "data": data}
+        for sub in targets:
+            try:
+                sub.loop.call_soon_threadsafe(sub._offer, event)
+            except RuntimeError:
+                # El loop del cliente ya se cerró
+                self.unsubscribe(sub)
+
+    def card_changed(self, edificio: str, piso: int, estado: str) -> bool:
+        """Registra el estado de la tarjeta y retorna True si cambió respecto al último publicado."""
+        key = (edificio, piso)
+        with self._lock:
+            previous = self._card_state.get(key)
+            self._card_state[key] = estado
+        return previous != estado
+
+
+realtime_hub = RealtimeHub(buffer_size=settings.REALTIME_BUFFER_SIZE)
@@ -0,0 +1,220 @@
+"""
+Proveedores de recomendaciones para las alertas.
+
+`RECOMMENDATION_PROVIDER` elige la implementación al arrancar:
+
+- `gemini`: Gemini AI (`app/services/gemini_service.py`). Sin API key o ante un error
+  cae a las reglas predefinidas, igual que antes.
+- `rules`: solo las reglas predefinidas, deterministas y sin red.
+- `stub`: simula un LLM local con latencia y tasa de error configurables
+  (`RECOMMENDATION_STUB_*`). Sirve para medir, sin la API real, cuánto de la latencia del
+  proveedor llega a la ingesta cuando se crean alertas.
+
+Todas las llamadas alimentan `smartfloors_recommendation_duration_seconds{provider,outcome}`.
+"""
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.instrumentation import RECOMMENDATION_DURATION, RECOMMENDATION_FALLBACKS
+from app.db.models.enums import AlertLevel, Variable
+
+logger = logging.getLogger(__name__)
+
+PROVIDERS = ("gemini", "rules", "stub")
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+# Observadores por llamada: (proveedor, resultado, segundos). P. ej. el perfilado por petición
+recommendation_observers: List[Callable[[str, str, float], None]] = []
+
+
+def rules_recommendation(
+    variable: Variable,
+    level: AlertLevel,
+    floor_number: int,
+    current_value: float
+) -> str:
+    """Recomendaciones predefinidas por variable y nivel"""
+    if variable == Variable.temperature:
+        if level == AlertLevel.critical:
+            return f"Ajustar setpoint del Piso {floor_number} a 24°C en los próximos 15 min."
+        elif level == AlertLevel.medium:
+            return f"Revisar sistema de climatización del Piso {floor_number} en la próxima hora."
+        else:
+            return f"Monitorear temperatura del Piso {floor_number}."
+
+    elif variable == Variable.humidity:
+        if level == AlertLevel.critical:
+            if current_value > 80:
+                return f"Activar deshumidificación del Piso {floor_number} inmediatamente."
+            else:
+                return f"Activar humidificación del Piso {floor_number} inmediatamente."
+        elif level == AlertLevel.medium:
+            return f"Ajustar control de humedad del Piso {floor_number} en la próxima hora."
+        else:
+            return f"Verificar humedad del Piso {floor_number}."
+
+    elif variable == Variable.energy:
+        if level == AlertLevel.critical:
+            return f"Redistribuir carga eléctrica del Piso {floor_number} en la próxima hora."
+        elif level == AlertLevel.medium:
+            return f"Revisar consumo energético del Piso {floor_number}."
+        else:
+            return f"Monitorear energía del Piso {floor_number}."
+
+    return f"Revisar {variable.value} del Piso {floor_number}."
+
+
+class RecommendationProvider:
+    """Interfaz común: `generate_recommendation` mide la llamada y delega en `_generate`."""
+
+    name = "base"
+
+    def ensure_configured(self) -> None:
+        """Preparación perezosa del cliente (se llama en segundo plano al arrancar)."""
+
+    def generate_recommendation(
+        self,
+        variable: Variable,
+        level: AlertLevel,
+        floor_number: int,
+        current_value: float,
+        historical_context: Optional[Dict] = None
+    ) -> str:
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            return self._generate(variable, level, floor_number, current_value, historical_context)
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            RECOMMENDATION_DURATION.labels(self.name, outcome).observe(elapsed)
+            for observer in recommendation_observers:
+                observer(self.name, outcome, elapsed)
+
+    def _generate(self, variable, level, floor_number, current_value, historical_context) -> str:
+        raise NotImplementedError
+
+
+class GeminiProvider(RecommendationProvider):
+    """Delega en `gemini_service`, que ya maneja sus errores con las reglas predefinidas."""
+
+    name = "gemini"
+
+    def __init__(self):
+        from app.services.gemini_service import gemini_service
+        self.service = gemini_service
+
+    def ensure_configured(self) -> None:
+        self.service.ensure_configured()
+
+    def _generate(self, variable, level, floor_number, current_value, historical_context) -> str:
+        return self.service.generate_recommendation(
+            variable=variable,
+            level=level,
+            floor_number=floor_number,
+            current_value=current_value,
+            historical_context=historical_context,
+        )
+
+
+class RulesProvider(RecommendationProvider):
+    name = "rules"
+
+    def _generate(self, variable, level, floor_number, current_value, historical_context) -> str:
+        return rules_recommendation(variable, level, floor_number, current_value)
+
+
+class StubError(RuntimeError):
+    """Error simulado del proveedor (equivale a un timeout o un 5xx de la API)."""
+
+
+class StubProvider(RecommendationProvider):
+    """
+    LLM simulado: duerme según la distribución de latencia y falla con probabilidad
+    `error_rate`. Un fallo cae a las reglas predefinidas, como haría Gemini.
+
+    - fixed: siempre `latency_ms`.
+    - uniform: entre `latency_ms * (1 - spread)` y `latency_ms * (1 + spread)`.
+    - lognormal: mediana `latency_ms` y sigma `spread` (cola larga, como una API real).
+    """
+
+    name = "stub"
+
+    def __init__(
+        self,
+        distribution: str = "lognormal",
+        latency_ms: float = 800.0,
+        spread: float = 0.5,
+        max_latency_ms: float = 30000.0,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(
+                f"Distribución de latencia desconocida: {distribution} (usa {' | '.join(LATENCY_DISTRIBUTIONS)})"
+            )
+        if not 0.0 <= error_rate <= 1.0:
+            raise ValueError("La tasa de error del stub debe estar entre 0 y 1")
+        self.distribution = distribution
+        self.latency_ms = latency_ms
+        self.spread = spread
+        self.max_latency_ms = max_latency_ms
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()  # random.Random no es seguro entre hilos del threadpool
+
+    def sample_latency(self) -> float:
+        """Latencia simulada en segundos"""
+        with self._lock:
+            if self.distribution == "fixed":
+                ms = self.latency_ms
+            elif self.distribution == "uniform":
+                ms = self._random.uniform(self.latency_ms * (1 - self.spread), self.latency_ms * (1 + self.spread))
+            else:
+                ms = self.latency_ms * self._random.lognormvariate(0.0, self.spread)
+        return min(max(ms, 0.0), self.max_latency_ms) / 1000
+
+    def _fails(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def _generate(self, variable, level, floor_number, current_value, historical_context) -> str:
+        time.sleep(self.sample_latency())
+        if self._fails():
+            raise StubError("Error simulado del proveedor")
+        return rules_recommendation(variable, level, floor_number, current_value)
+
+    def generate_recommendation(self, variable, level, floor_number, current_value, historical_context=None) -> str:
+        try:
+            return super().generate_recommendation(variable, level, floor_number, current_value, historical_context)
+        except StubError:
+            RECOMMENDATION_FALLBACKS.inc()
+            return rules_recommendation(variable, level, floor_number, current_value)
+
+
+def build_provider(name: Optional[str] = None) -> RecommendationProvider:
+    name = (name or settings.RECOMMENDATION_PROVIDER).strip().lower()
+    if name == "gemini":
+        return GeminiProvider()
+    if name == "rules":
+        return RulesProvider()
+    if name == "stub":
+        s = settings
+        return StubProvider(
+            distribution=s.RECOMMENDATION_STUB_LATENCY.strip().lower(),
+            latency_ms=s.RECOMMENDATION_STUB_LATENCY_MS,
+            spread=s.RECOMMENDATION_STUB_LATENCY_SPREAD,
+            max_latency_ms=s.RECOMMENDATION_STUB_MAX_LATENCY_MS,
+            error_rate=s.RECOMMENDATION_STUB_ERROR_RATE,
+            seed=s.RECOMMENDATION_STUB_SEED,
+        )
+    raise ValueError(f"RECOMMENDATION_PROVIDER desconocido: {name} (usa {' | '.join(PROVIDERS)})")
+
+
+recommendation_provider = build_provider()
@@ -0,0 +1,169 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.data_version import data_versions
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+# ============================================================
+# Backends
+# ============================================================
+
+class MemoryCacheBackend:
+    """Caché en proceso: LRU acotado por número de entradas, con TTL por entrada."""
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._reset()
+        # Un worker creado por fork arranca vacío (y sin heredar un lock tomado)
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._generations: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def generations(self, names: List[str]) -> List[int]:
+        return [self._generations.get(n, 0) for n in names]
+
+    def bump(self, names: Iterable[str]) -> None:
+        with self._lock:
+            for n in names:
+                self._generations[n] = self._generations.get(n, 0) + 1
+
+
+class RedisCacheBackend:
+    """
+    Caché compartida entre procesos/nodos. Las entradas se guardan como JSON con TTL
+    de Redis; la expulsión LRU la hace Redis (configurar `maxmemory-policy allkeys-lru`).
+    """
+
+    def __init__(self, url: str, prefix: str = "smartfloors:rc:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("RESPONSE_CACHE_BACKEND=redis requiere el paquete 'redis'") from e
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key: str) -> Any:
+        raw = self._redis.get(self.prefix + key)
+        return _MISSING if raw is None else json.loads(raw)
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self._redis.set(self.prefix + key, json.dumps(value), px=max(int(ttl * 1000), 1))
+
+    def generations(self, names: List[str]) -> List[int]:
+        raw = self._redis.mget([self.prefix + "gen:" + n for n in names])
+        return [int(v) if v is not None else 0 for v in raw]
+
+    def bump(self, names: Iterable[str]) -> None:
+        pipe = self._redis.pipeline(transaction=False)
+        for n in names:
+            pipe.incr(self.prefix + "gen:" + n)
+        pipe.execute()
+
+
+# ============================================================
+# Caché de respuestas
+# ============================================================
+
+class ResponseCache:
+    """
+    Caché read-through de respuestas GET, con llave por ruta + parámetros normalizados.
+
+    La invalidación usa generaciones: cada llave incluye el número de generación del
+    alcance al que pertenece (global, edificio o piso). Invalidar es incrementar la
+    generación, y las entradas viejas quedan inalcanzables hasta que expiran o salen por LRU.
+    """
+
+    def __init__(self, backend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+
+    @staticmethod
+    def _scope(edificio: Optional[str], piso: Optional[int]) -> List[str]:
+        if edificio is None:
+            return ["g"]
+        if piso is None:
+            return [f"b:{edificio}"]
+        return [f"a:{edificio}", f"f:{edificio}:{piso}"]
+
+    def key_for(self, route: str, params: Iterable[Tuple[str, str]], edificio: Optional[str], piso: Optional[int]) -> str:
+        names = self._scope(edificio, piso)
+        gens = self.backend.generations(names)
+        query = "&".join(f"{k}={v}" for k, v in sorted(params))
+        scope = ",".join(f"{n}@{g}" for n, g in zip(names, gens))
+        return f"{route}?{query}|{scope}"
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Retorna (valor, hit). Los errores del backend nunca fallan la petición."""
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"⚠️ Error leyendo caché de respuestas: {e}")
+            return compute(), False
+        if value is not _MISSING:
+            return value, True
+
+        value = compute()
+        try:
+            self.backend.set(key, value, self.ttl)
+        except Exception as e:
+            logger.warning(f"⚠️ Error escribiendo caché de respuestas: {e}")
+        return value, False
+
+    def invalidate(self, edificio: str, pisos: Iterable[int] = ()) -> None:
+        pisos = list(pisos)
+        names = ["g", f"b:{edificio}"] + [f"f:{edificio}:{p}" for p in pisos]
+        if not pisos:
+            names.append(f"a:{edificio}")
+        try:
+            self.backend.bump(names)
+        except Exception as e:
+            logger.error(f"❌ Error invalidando caché de respuestas: {e}")
+
+
+def _build_response_cache() -> Optional[ResponseCache]:
+    backend_name = settings.RESPONSE_CACHE_BACKEND.lower()
+    if backend_name == "off":
+        return None
+    if backend_name == "redis":
+        backend = RedisCacheBackend(settings.REDIS_URL)
+    else:
+        backend = MemoryCacheBackend(max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES)
+    return ResponseCache(backend, ttl=settings.RESPONSE_CACHE_TTL_SECONDS)
+
+
+response_cache = _build_response_cache()
+if response_cache is not None:
+    # Toda escritura que incrementa la versión de datos invalida las entradas afectadas
+    data_versions.add_listener(response_cache.invalidate)
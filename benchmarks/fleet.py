@@ -0,0 +1,125 @@
+"""
+Generador sintético de una flota de edificios: N edificios × M pisos × D días de series
+realistas de temperatura, humedad y energía, con anomalías inyectadas.
+
+Es determinista para una misma semilla, así que dos corridas generan exactamente los
+mismos datos.
+"""
+import csv
+import io
+import math
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List, Optional
+
+
+@dataclass
+class FleetSpec:
+    buildings: int = 3
+    floors: int = 5
+    days: float = 1.0
+    interval_minutes: float = 5.0
+    anomaly_rate: float = 0.01      # probabilidad de iniciar una anomalía en cada lectura
+    seed: int = 42
+    end: Optional[datetime] = None  # por defecto: ahora (UTC)
+
+    def building_codes(self) -> List[str]:
+        return [f"B{i:03d}" for i in range(1, self.buildings + 1)]
+
+    @property
+    def readings_per_floor(self) -> int:
+        return int(self.days * 24 * 60 / self.interval_minutes)
+
+    @property
+    def total_readings(self) -> int:
+        return self.buildings * self.floors * self.readings_per_floor
+
+
+@dataclass
+class _Anomaly:
+    variable: str
+    remaining: int
+    delta: float
+
+
+def _floor_series(spec: FleetSpec, code: str, floor: int, rng: random.Random) -> Iterator[dict]:
+    end = spec.end or datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    step = timedelta(minutes=spec.interval_minutes)
+    n = spec.readings_per_floor
+    start = end - step * n
+
+    # Cada piso tiene su propio "clima": base, amplitud y carga distintas
+    temp_base = rng.uniform(21.0, 24.0)
+    temp_amp = rng.uniform(1.0, 2.5)
+    hum_base = rng.uniform(40.0, 55.0)
+    load_base = rng.uniform(2.0, 5.0)
+    anomaly: Optional[_Anomaly] = None
+
+    for i in range(n):
+        ts = start + step * i
+        hour = ts.hour + ts.minute / 60.0
+        daily = math.sin((hour - 9.0) / 24.0 * 2 * math.pi)
+        office = 1.0 if ts.weekday() < 5 and 8 <= hour < 19 else 0.35
+
+        temp = temp_base + temp_amp * daily + rng.gauss(0, 0.25)
+        humidity = hum_base - 6.0 * daily + rng.gauss(0, 1.0)
+        energy = load_base * office + rng.gauss(0, 0.3)
+
+        if anomaly is None and rng.random() < spec.anomaly_rate:
+            variable = rng.choice(["temperature", "humidity_high", "humidity_low", "energy"])
+            delta = {
+                "temperature": rng.uniform(5.0, 9.0),
+                "humidity_high": rng.uniform(25.0, 40.0),
+                "humidity_low": -rng.uniform(25.0, 35.0),
+                "energy": rng.uniform(6.0, 12.0),
+            }[variable]
+            anomaly = _Anomaly(variable, rng.randint(3, 12), delta)
+
+        if anomaly is not None:
+            if anomaly.variable == "temperature":
+                temp += anomaly.delta
+            elif anomaly.variable.startswith("humidity"):
+                humidity += anomaly.delta
+            else:
+                energy += anomaly.delta
+            anomaly.remaining -= 1
+            if anomaly.remaining <= 0:
+                anomaly = None
+
+        yield {
+            "timestamp": ts.isoformat(),
+            "edificio": code,
+            "piso": floor,
+            "temp_C": round(temp, 2),
+            "humedad_pct": round(min(max(humidity, 0.0), 100.0), 2),
+            "energia_kW": round(max(energy, 0.0), 3),
+        }
+
+
+def generate(spec: FleetSpec) -> Iterator[dict]:
+    """Lecturas de toda la flota, piso por piso, en orden temporal dentro de cada piso."""
+    for code in spec.building_codes():
+        for floor in range(1, spec.floors + 1):
+            rng = random.Random(f"{spec.seed}:{code}:{floor}")
+            yield from _floor_series(spec, code, floor, rng)
+
+
+def batches(readings: Iterator[dict], size: int) -> Iterator[List[dict]]:
+    batch: List[dict] = []
+    for r in readings:
+        batch.append(r)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def to_csv(rows: List[dict]) -> bytes:
+    """CSV con el encabezado que exige /metrics/upload-csv"""
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=["timestamp", "edificio", "piso", "temp_C", "humedad_pct", "energia_kW"])
+    writer.writeheader()
+    writer.writerows(rows)
+    return buf.getvalue().encode("utf-8")
@@ -0,0 +1,320 @@
+"""
+Micro-benchmarks de las rutas calientes de evaluación y serialización.
+
+Cubre las funciones puras de `app/api/v1/endpoints/metrics.py` que corren por cada
+lectura o tarjeta, la validación de `MetricIn` / `MetricInBatch` y la construcción de
+las respuestas de `trends` y `floor_cards`. No necesita base de datos.
+
+Los tiempos absolutos dependen de la máquina y de su carga, así que la comparación no usa
+µs: cada ronda de un caso se mide intercalada con una ronda de `calibration` (un bucle de
+Python puro que no cambia) y lo que se compara es la mediana del cociente caso/calibración.
+`--save` corre la suite `--runs` veces y guarda, además del cociente, el ruido observado de
+cada caso entre corridas; `--compare` solo marca regresión lo que supere ese ruido más
+`--max-regression`.
+
+    python -m benchmarks.micro                      # correr y mostrar resultados
+    python -m benchmarks.micro --save               # guardar como baseline (en esta máquina)
+    python -m benchmarks.micro --compare            # falla si algún caso empeora más que ruido + 20%
+
+El baseline versionado sirve de referencia; antes de usar `--compare` para evaluar un cambio
+conviene regrabarlo en la propia máquina con `--save` sobre el árbol sin el cambio.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import timeit
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Sin API key no se intenta contactar a Gemini al importar los endpoints
+os.environ["GEMINI_API_KEY"] = ""
+
+from app.api import ingest_formats  # noqa: E402
+from app.api.v1.endpoints import metrics as m  # noqa: E402
+from app.db.models.enums import AlertLevel, Variable  # noqa: E402
+from app.db.schemas.metric import MetricIn, MetricInBatch  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "micro.json")
+
+
+# ============================================================
+# Datos de entrada
+# ============================================================
+
+TEMPS = [20.0 + i * 0.1 for i in range(120)]          # 20.0 … 31.9 °C (todas las bandas)
+HUMIDITIES = [10.0 + i * 0.75 for i in range(120)]    # 10 … 99 %
+ENERGIES = [i * 0.15 for i in range(120)]             # 0 … 17.9 kW
+
+
+def _raw_reading(i: int) -> dict:
+    return {
+        "timestamp": f"2025-01-15T10:{i % 60:02d}:00",
+        "edificio": "A",
+        "piso": 1 + i % 10,
+        "temp_C": f"{22 + (i % 80) / 10:.2f}",
+        "humedad_pct": f"{40 + (i % 50) / 2:.2f}",
+        "energia_kW": f"{3 + (i % 40) / 10:.3f}",
+    }
+
+
+RAW_SINGLE = _raw_reading(0)
+RAW_BATCH = {"items": [_raw_reading(i) for i in range(500)]}
+NDJSON_LINES = [json.dumps(r).encode() for r in RAW_BATCH["items"]]
+NDJSON_NUMBERS = list(range(1, len(NDJSON_LINES) + 1))
+
+
+def _msgpack_columnar() -> Optional[bytes]:
+    try:
+        import msgpack
+    except ImportError:
+        return None
+    items = RAW_BATCH["items"]
+    return msgpack.packb({
+        "edificio": "A",
+        "piso": [r["piso"] for r in items],
+        "timestamp": [datetime.fromisoformat(r["timestamp"]).replace(tzinfo=timezone.utc).timestamp() for r in items],
+        "temp_C": [float(r["temp_C"]) for r in items],
+        "humedad_pct": [float(r["humedad_pct"]) for r in items],
+        "energia_kW": [float(r["energia_kW"]) for r in items],
+    })
+
+
+MSGPACK_BATCH = _msgpack_columnar()
+
+
+def _fake_metrics(n: int) -> List[SimpleNamespace]:
+    """Filas con la misma forma que `Metric` (time + Numeric) sin tocar la BD"""
+    start = datetime(2025, 1, 15, tzinfo=timezone.utc)
+    return [
+        SimpleNamespace(
+            time=start + timedelta(minutes=i),
+            temp_c=Decimal(f"{22 + (i % 90) / 10:.2f}"),
+            humidity_pct=Decimal(f"{35 + (i % 60) / 1.5:.2f}"),
+            energy_kw=Decimal(f"{2 + (i % 100) / 10:.3f}") if i % 17 else None,
+        )
+        for i in range(n)
+    ]
+
+
+TREND_ROWS = _fake_metrics(240)          # 4 h a 1 lectura/min
+CARD_ROWS = _fake_metrics(20)            # último registro de 20 pisos
+
+
+# ============================================================
+# Casos
+# ============================================================
+
+def case_evaluate_temperature():
+    for t in TEMPS:
+        m._evaluate_temperature(t)
+
+
+def case_evaluate_humidity():
+    for h in HUMIDITIES:
+        m._evaluate_humidity(h)
+
+
+def case_level_for():
+    for e in ENERGIES:
+        m._level_for(e, 0.0, 10.0)
+
+
+def case_generate_detailed_summary():
+    for t, h, e in zip(TEMPS, HUMIDITIES, ENERGIES):
+        m._generate_detailed_summary(t, h, e, AlertLevel.medium, AlertLevel.info, AlertLevel.critical)
+
+
+def case_brief_summary():
+    levels = {Variable.temperature: AlertLevel.critical, Variable.humidity: AlertLevel.medium, Variable.energy: AlertLevel.info}
+    for t, h, e in zip(TEMPS, HUMIDITIES, ENERGIES):
+        m._brief_summary({"temp_C": t, "humedad_pct": h, "energia_kW": e}, levels)
+
+
+def case_metric_in_single():
+    MetricIn.model_validate(RAW_SINGLE)
+
+
+def case_metric_in_batch_500():
+    MetricInBatch.model_validate(RAW_BATCH)
+
+
+def case_ndjson_fast_500():
+    ingest_formats._parse_lines(NDJSON_LINES, NDJSON_NUMBERS)
+
+
+def case_msgpack_columnar_500():
+    ingest_formats.msgpack_readings(MSGPACK_BATCH)
+
+
+def case_trends_payload_240():
+    m._trends_payload(TREND_ROWS)
+
+
+def case_floor_cards_20():
+    for i, row in enumerate(CARD_ROWS):
+        m._build_card(i + 1, row, (0.0, 10.0))
+
+
+CASES: Dict[str, Callable[[], None]] = {
+    name[len("case_"):]: fn for name, fn in sorted(globals().items()) if name.startswith("case_")
+}
+if MSGPACK_BATCH is None:  # msgpack es opcional
+    del CASES["msgpack_columnar_500"]
+
+
+# ============================================================
+# Ejecución
+# ============================================================
+
+def calibration():
+    """Carga fija de referencia (dict, str, float, sort): no depende del código de la app"""
+    acc = {}
+    for i in range(200):
+        key = f"k{i % 50}"
+        acc[key] = acc.get(key, 0.0) + i * 1.5
+    sorted(acc.items())
+
+
+def _number(timer: timeit.Timer, min_time: float) -> int:
+    number, _ = timer.autorange()
+    return max(1, int(number * min_time / 0.2))
+
+
+def measure(fn: Callable[[], None], repeat: int, min_time: float) -> Tuple[float, float]:
+    """
+    (mejor tiempo por llamada en µs, mediana del cociente caso/calibración) entre `repeat`
+    rondas de al menos `min_time` segundos. Cada ronda del caso va seguida de una de
+    calibración, así una ráfaga de carga en la máquina afecta a las dos por igual.
+    """
+    timer, reference = timeit.Timer(fn), timeit.Timer(calibration)
+    number, ref_number = _number(timer, min_time), _number(reference, min_time)
+    times, ratios = [], []
+    for _ in range(repeat):
+        per_call = timer.timeit(number) / number
+        ref_per_call = reference.timeit(ref_number) / ref_number
+        times.append(per_call)
+        ratios.append(per_call / ref_per_call)
+    return min(times) * 1e6, statistics.median(ratios)
+
+
+def run(selected: Optional[List[str]], repeat: int, min_time: float) -> Tuple[Dict[str, float], Dict[str, float]]:
+    """({caso: µs}, {caso: cociente contra la calibración})"""
+    times, relative = {}, {}
+    for name, fn in CASES.items():
+        if selected and name not in selected:
+            continue
+        us, ratio = measure(fn, repeat, min_time)
+        times[name], relative[name] = round(us, 3), round(ratio, 4)
+        print(f"  {name:<32} {times[name]:>12.3f} µs {relative[name]:>10.4f}x", flush=True)
+    return times, relative
+
+
+def run_many(selected: Optional[List[str]], repeat: int, min_time: float, runs: int) -> Tuple[Dict[str, float], Dict[str, float], Dict[str, float]]:
+    """
+    Corre la suite `runs` veces. Retorna ({caso: µs mínimo}, {caso: cociente mediano},
+    {caso: ruido %}), donde el ruido es el rango de los cocientes sobre su mediana.
+    """
+    all_times: Dict[str, List[float]] = {}
+    all_relative: Dict[str, List[float]] = {}
+    for i in range(runs):
+        if runs > 1:
+            print(f"Corrida {i + 1}/{runs}")
+        times, relative = run(selected, repeat, min_time)
+        for name in times:
+            all_times.setdefault(name, []).append(times[name])
+            all_relative.setdefault(name, []).append(relative[name])
+
+    best = {name: min(values) for name, values in all_times.items()}
+    median = {name: round(statistics.median(values), 4) for name, values in all_relative.items()}
+    noise = {
+        name: round((max(values) - min(values)) / median[name] * 100, 1)
+        for name, values in all_relative.items()
+    }
+    return best, median, noise
+
+
+def compare(relative: Dict[str, float], baseline: dict, max_regression: float) -> int:
+    base_relative = baseline.get("relative", {})
+    base_noise = baseline.get("noise", {})
+    if not base_relative:
+        print("❌ El baseline no tiene cocientes contra la calibración; regrábalo con --save")
+        return 2
+    if baseline.get("machine") != platform.machine() or baseline.get("python") != platform.python_version():
+        print(f"⚠️ Baseline de {baseline.get('machine')} / Python {baseline.get('python')}: la comparación es orientativa")
+
+    failures = 0
+    print(f"\n{'caso':<32} {'baseline':>10} {'actual':>10} {'cambio':>9} {'margen':>8}")
+    for name, current in relative.items():
+        base = base_relative.get(name)
+        if base is None:
+            print(f"{name:<32} {'—':>10} {current:>10.4f} {'nuevo':>9}")
+            continue
+        change = (current - base) / base * 100
+        allowed = max_regression + base_noise.get(name, 0.0)
+        flag = ""
+        if change > allowed:
+            failures += 1
+            flag = "  ❌ REGRESIÓN"
+        print(f"{name:<32} {base:>10.4f} {current:>10.4f} {change:>+8.1f}% {allowed:>7.1f}%{flag}")
+
+    if failures:
+        print(f"\n❌ {failures} caso(s) empeoraron más que su ruido + {max_regression}%")
+        return 1
+    print(f"\n✅ Ningún caso empeoró más que su ruido + {max_regression}%")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks de SmartFloors (sin base de datos)")
+    parser.add_argument("cases", nargs="*", help=f"casos a correr (default: todos): {', '.join(CASES)}")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="segundos mínimos por ronda")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="guardar los resultados como baseline")
+    parser.add_argument("--compare", action="store_true", help="comparar contra el baseline guardado")
+    parser.add_argument("--runs", type=int, default=3, help="corridas de la suite (el ruido del baseline sale de acá)")
+    parser.add_argument(
+        "--max-regression", type=float, default=20.0,
+        help="porcentaje permitido por encima del ruido de cada caso en el baseline",
+    )
+    args = parser.parse_args(argv)
+
+    unknown = [c for c in args.cases if c not in CASES]
+    if unknown:
+        parser.error(f"casos desconocidos: {', '.join(unknown)}")
+
+    print(f"Micro-benchmarks (repeat={args.repeat}, min_time={args.min_time}s, runs={args.runs})")
+    times, relative, noise = run_many(args.cases, args.repeat, args.min_time, args.runs)
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "unit": "us_per_call",
+                "cases": times,
+                "relative": relative,
+                "noise": noise,
+            }, f, indent=2)
+            f.write("\n")
+        print(f"\n💾 Baseline guardado en {args.baseline}")
+
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f"❌ No existe baseline en {args.baseline}; córrelo primero con --save")
+            return 2
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        return compare(relative, baseline, args.max_regression)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
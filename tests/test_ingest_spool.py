@@ -0,0 +1,187 @@
+"""
+Spool de ingesta (`app/services/ingest_spool.py`): orden del replay, registros truncados
+o con crc inválido (`.corrupt`) y registros rechazados por la base (`.rejected`).
+
+No necesita base de datos: `write` es una función que anota lo que recibe.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+
+from app.services.ingest_spool import _HEADER, IngestSpool, read_segment
+
+START = datetime(2025, 1, 15, 10, 0, tzinfo=timezone.utc)
+
+
+def _readings(piso: int, n: int = 2) -> list:
+    return [
+        {
+            "edificio": "A",
+            "piso": piso,
+            "time": START + timedelta(minutes=i),
+            "temp_c": Decimal("22.50"),
+            "humidity_pct": Decimal("45.00"),
+            "energy_kw": None,
+        }
+        for i in range(n)
+    ]
+
+
+class _Writer:
+    """`write(lecturas, modo)` que anota cada llamada y puede fallar según el piso"""
+
+    def __init__(self, fail_piso=None, error=ValueError):
+        self.calls = []
+        self.fail_piso = fail_piso
+        self.error = error
+
+    def __call__(self, readings, mode):
+        if self.fail_piso is not None and any(r["piso"] == self.fail_piso for r in readings):
+            raise self.error("fila rechazada")
+        self.calls.append(([r["piso"] for r in readings], mode))
+
+
+def _segments(spool: IngestSpool, suffix: str = ".seg") -> list:
+    return sorted(n for n in os.listdir(spool.directory) if n.endswith(suffix))
+
+
+@pytest.fixture
+def spool(tmp_path):
+    s = IngestSpool(str(tmp_path), segment_bytes=1 << 20, max_bytes=1 << 24, replay_batch=1000, fsync=False)
+    s.open()
+    yield s
+    s.close()
+
+
+def _flip_byte(path: str, offset: int) -> None:
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        value = f.read(1)
+        f.seek(offset)
+        f.write(bytes([value[0] ^ 0xFF]))
+
+
+# ============================================================
+# Orden del replay
+# ============================================================
+
+def test_replay_keeps_arrival_order_across_segments(tmp_path):
+    # Segmentos chicos: cada lote abre uno nuevo
+    spool = IngestSpool(str(tmp_path), segment_bytes=64, max_bytes=1 << 24, replay_batch=1, fsync=False)
+    spool.open()
+    for piso in (1, 2, 3):
+        spool.append(_readings(piso), "ignore", "json")
+    spool.append(_readings(4), "update", "json")
+    assert len(_segments(spool)) == 4
+
+    writer = _Writer()
+    assert spool.replay(writer) == 8
+    assert writer.calls == [([1, 1], "ignore"), ([2, 2], "ignore"), ([3, 3], "ignore"), ([4, 4], "update")]
+    assert _segments(spool) == []
+    assert not spool.pending
+    spool.close()
+
+
+def test_replay_merges_records_of_the_same_mode(spool):
+    spool.append(_readings(1), "ignore", "json")
+    spool.append(_readings(2), "ignore", "ndjson")
+    spool.append(_readings(3), "update", "json")
+
+    writer = _Writer()
+    spool.replay(writer)
+    assert writer.calls == [([1, 1, 2, 2], "ignore"), ([3, 3], "update")]
+
+
+def test_reopened_spool_resumes_pending_segments(tmp_path):
+    first = IngestSpool(str(tmp_path), segment_bytes=1 << 20, max_bytes=1 << 24, replay_batch=1000, fsync=False)
+    first.open()
+    first.append(_readings(7), "ignore", "json")
+    first.close()
+
+    second = IngestSpool(str(tmp_path), segment_bytes=1 << 20, max_bytes=1 << 24, replay_batch=1000, fsync=False)
+    second.open()
+    assert second.pending
+    writer = _Writer()
+    second.replay(writer)
+    assert writer.calls == [([7, 7], "ignore")]
+    second.close()
+
+
+def test_record_round_trip_keeps_types(spool):
+    spool.append(_readings(1), "ignore", "json")
+    spool.close()
+    [(mode, readings)] = list(read_segment(os.path.join(spool.directory, _segments(spool)[0])))
+    assert mode == "ignore"
+    assert readings == _readings(1)
+
+
+# ============================================================
+# Segmentos dañados
+# ============================================================
+
+def test_truncated_record_writes_previous_and_marks_segment_corrupt(spool):
+    spool.append(_readings(1), "ignore", "json")
+    spool.append(_readings(2), "ignore", "json")
+    spool.close()
+    path = os.path.join(spool.directory, _segments(spool)[0])
+    # Corte a mitad del segundo registro (p. ej. se cortó la luz al escribir)
+    os.truncate(path, os.path.getsize(path) - 5)
+
+    spool.open()
+    writer = _Writer()
+    assert spool.replay(writer) == 2
+    assert writer.calls == [([1, 1], "ignore")]
+    assert _segments(spool) == []
+    assert _segments(spool, ".corrupt") == [os.path.basename(path) + ".corrupt"]
+
+
+def test_crc_mismatch_writes_previous_and_marks_segment_corrupt(spool):
+    spool.append(_readings(1), "ignore", "json")
+    spool.append(_readings(2), "ignore", "json")
+    spool.close()
+    path = os.path.join(spool.directory, _segments(spool)[0])
+    with open(path, "rb") as f:
+        _, first_length, _ = _HEADER.unpack(f.read(_HEADER.size))
+    # Un byte del payload del segundo registro
+    _flip_byte(path, 2 * _HEADER.size + first_length + 3)
+
+    spool.open()
+    writer = _Writer()
+    spool.replay(writer)
+    assert writer.calls == [([1, 1], "ignore")]
+    assert _segments(spool, ".corrupt") == [os.path.basename(path) + ".corrupt"]
+
+
+# ============================================================
+# Registros rechazados por la base
+# ============================================================
+
+def test_rejected_record_is_quarantined_and_replay_continues(spool):
+    spool.append(_readings(1), "ignore", "json")
+    spool.append(_readings(2), "ignore", "json")
+    spool.append(_readings(3), "ignore", "json")
+
+    writer = _Writer(fail_piso=2)
+    assert spool.replay(writer, retry_on=(ConnectionError,)) == 4
+    # El lote unido falla; se reintenta registro por registro y solo se aparta el malo
+    assert writer.calls == [([1, 1], "ignore"), ([3, 3], "ignore")]
+    assert _segments(spool) == []
+
+    [rejected] = _segments(spool, ".rejected")
+    path = os.path.join(spool.directory, rejected)
+    assert [(mode, [r["piso"] for r in readings]) for mode, readings in read_segment(path)] == [("ignore", [2, 2])]
+
+
+def test_database_unavailable_keeps_segment_for_retry(spool):
+    spool.append(_readings(1), "ignore", "json")
+
+    with pytest.raises(ConnectionError):
+        spool.replay(_Writer(fail_piso=1, error=ConnectionError), retry_on=(ConnectionError,))
+    assert len(_segments(spool)) == 1
+    assert _segments(spool, ".rejected") == []
+
+    writer = _Writer()
+    assert spool.replay(writer, retry_on=(ConnectionError,)) == 2
+    assert writer.calls == [([1, 1], "ignore")]